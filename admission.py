@@ -0,0 +1,300 @@
+"""
+请求准入控制：按请求体大小限流，在 Pydantic 解析请求体之前拒绝
+
+AdmissionMiddleware 是纯 ASGI 中间件，按请求体字节数（JSON 中每个字符至少占一个字节，
+字节数是字符数的上限）做三件事：
+- 单个请求体超过 max_body_bytes 时返回 413。有 Content-Length 时不读取请求体直接拒绝；
+  分块上传时先读入（最多 max_body_bytes），超过即拒绝
+- 正在处理的请求体总字节数不超过 max_inflight_bytes：超出时按到达顺序排队，
+  等待超过 queue_timeout 秒返回 503（带 Retry-After）
+- 按客户端的令牌桶限流（rate 为每秒字节数，0 表示不限流）：每个请求消耗
+  请求体字节数 + REQUEST_COST，桶中令牌不足时返回 429（带 Retry-After）。
+  客户端按 X-API-Key 区分（只认 api_keys 中配置的密钥，避免随意换密钥绕过限流），
+  其余按 IP 区分
+
+流式接口（streaming_paths，例如 /api/clean/stream、/api/jobs）本来就逐块处理大请求体，
+不限制大小、不占用并发额度，读取请求体时按实际字节数扣除令牌（可以扣成负数，
+之后的请求要等令牌补回来）。exempt_paths（健康检查、指标）不做任何限制。
+
+所有状态都只在事件循环线程里访问，不需要加锁；多个 worker 进程各自计数。
+"""
+
+import asyncio
+import json
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+# 每个请求除请求体外固定消耗的令牌（字节），小请求也不能无限制地发送
+REQUEST_COST = 1024
+
+
+class RateLimiter:
+    """按客户端的令牌桶：每秒补充 rate 个令牌，最多 burst 个"""
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        # 客户端 -> [令牌数, 上次更新时间]，按最近使用排序，超过 max_clients 时淘汰最久未用的
+        self._buckets: 'OrderedDict[str, List[float]]' = OrderedDict()
+
+    def _bucket(self, client: str) -> List[float]:
+        now = time.monotonic()
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = [self.burst, now]
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        return bucket
+
+    def acquire(self, client: str, cost: float) -> float:
+        """扣除 cost 个令牌，返回 0；令牌不足时不扣除，返回需要等待的秒数
+
+        cost 超过 burst 的请求在桶满时放行（扣成负数），否则永远无法通过
+        """
+        bucket = self._bucket(client)
+        needed = min(cost, self.burst)
+        if bucket[0] < needed:
+            return (needed - bucket[0]) / self.rate
+        bucket[0] -= cost
+        return 0.0
+
+    def charge(self, client: str, cost: float) -> None:
+        """无条件扣除令牌（流式请求体按实际读取的字节数扣除）"""
+        self._bucket(client)[0] -= cost
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class InflightBudget:
+    """正在处理的请求体字节数上限，超出时按到达顺序排队"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self.requests = 0
+        self._waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def try_acquire(self, size: int) -> bool:
+        """不用等待时直接占用额度；前面有排队的请求时也要排队，避免大请求一直等不到"""
+        if self._waiters or self.used + size > self.max_bytes:
+            return False
+        self.used += size
+        self.requests += 1
+        return True
+
+    async def acquire(self, size: int, timeout: float) -> bool:
+        """排队等待额度，超时返回 False"""
+        future = asyncio.get_running_loop().create_future()
+        entry = (size, future)
+        self._waiters.append(entry)
+        granted = False
+        try:
+            await asyncio.wait_for(future, timeout)
+            granted = True
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            if not granted:
+                if future.done() and not future.cancelled():
+                    # 额度已经分给这个请求，但请求被取消了：归还
+                    self.release(size)
+                else:
+                    future.cancel()
+                    if entry in self._waiters:
+                        self._waiters.remove(entry)
+                    self._wake()
+
+    def release(self, size: int) -> None:
+        self.used -= size
+        self.requests -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters:
+            size, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if self.used + size > self.max_bytes:
+                break
+            self._waiters.popleft()
+            self.used += size
+            self.requests += 1
+            future.set_result(None)
+
+
+class AdmissionController:
+    """准入控制的配置和计数（AdmissionMiddleware 使用，stats() 供指标输出）"""
+
+    def __init__(self, max_body_bytes: int, max_inflight_bytes: int, queue_timeout: float,
+                 rate_limiter: Optional[RateLimiter] = None, api_keys: Iterable[str] = (),
+                 streaming_paths: Iterable[str] = (), exempt_paths: Iterable[str] = (), retry_after: str = "1"):
+        # 并发额度至少能容纳一个最大的请求
+        self.max_body_bytes = max_body_bytes
+        self.budget = InflightBudget(max(max_inflight_bytes, max_body_bytes))
+        self.queue_timeout = queue_timeout
+        self.rate_limiter = rate_limiter
+        self.api_keys = frozenset(api_keys)
+        self.streaming_paths = frozenset(streaming_paths)
+        self.exempt_paths = frozenset(exempt_paths)
+        self.retry_after = retry_after
+        self.queued = 0
+        self.rejected: Dict[str, int] = {'too_large': 0, 'rate_limited': 0, 'busy': 0}
+
+    def client(self, scope) -> str:
+        """限流的客户端标识：配置过的 API 密钥，否则是 IP"""
+        for name, value in scope['headers']:
+            if name == b'x-api-key':
+                key = value.decode('latin-1')
+                if key in self.api_keys:
+                    return 'key:' + key
+                break
+        client = scope.get('client')
+        return 'ip:' + (client[0] if client else 'unknown')
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'inflight_bytes': self.budget.used,
+            'inflight_requests': self.budget.requests,
+            'waiting_requests': self.budget.waiting,
+            'queued_total': self.queued,
+            'rejected_too_large_total': self.rejected['too_large'],
+            'rejected_rate_limited_total': self.rejected['rate_limited'],
+            'rejected_busy_total': self.rejected['busy'],
+            'rate_limited_clients': len(self.rate_limiter) if self.rate_limiter is not None else 0,
+        }
+
+
+def _content_length(scope) -> Optional[int]:
+    for name, value in scope['headers']:
+        if name == b'content-length':
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+
+async def _reject(send: Callable, status: int, detail: str, retry_after: Optional[str] = None) -> None:
+    """与 HTTPException 相同格式的错误响应"""
+    body = json.dumps({'detail': detail}, ensure_ascii=False).encode('utf-8')
+    headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    if retry_after is not None:
+        headers.append((b'retry-after', retry_after.encode()))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class AdmissionMiddleware:
+    """在路由和 Pydantic 之前执行准入控制"""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        controller = self.controller
+        if scope['type'] != 'http' or scope['path'] in controller.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+        limiter = controller.rate_limiter
+        client = controller.client(scope) if limiter is not None else None
+
+        if scope['path'] in controller.streaming_paths:
+            if limiter is not None:
+                wait = limiter.acquire(client, REQUEST_COST)
+                if wait:
+                    controller.rejected['rate_limited'] += 1
+                    await _reject(send, 429, "请求过于频繁，请稍后重试", str(math.ceil(wait)))
+                    return
+                receive = self._charging(receive, limiter, client)
+            await self.app(scope, receive, send)
+            return
+
+        size = _content_length(scope)
+        if size is not None and size > controller.max_body_bytes:
+            controller.rejected['too_large'] += 1
+            await _reject(send, 413, f"请求体不能超过 {controller.max_body_bytes} 字节")
+            return
+        if size is None and scope['method'] in ('POST', 'PUT', 'PATCH'):
+            # 分块上传：先读入请求体，确定大小后再决定是否受理
+            messages = await self._read_body(receive)
+            if messages is None:
+                controller.rejected['too_large'] += 1
+                await _reject(send, 413, f"请求体不能超过 {controller.max_body_bytes} 字节")
+                return
+            size = sum(len(message.get('body', b'')) for message in messages)
+            receive = self._replay(messages, receive)
+        size = size or 0
+
+        if limiter is not None:
+            wait = limiter.acquire(client, size + REQUEST_COST)
+            if wait:
+                controller.rejected['rate_limited'] += 1
+                await _reject(send, 429, "请求过于频繁，请稍后重试", str(math.ceil(wait)))
+                return
+
+        # 没有请求体的请求（GET、DELETE 等）不占用额度，不必排在大请求后面
+        if not size:
+            await self.app(scope, receive, send)
+            return
+        budget = controller.budget
+        if not budget.try_acquire(size):
+            controller.queued += 1
+            if not await budget.acquire(size, controller.queue_timeout):
+                controller.rejected['busy'] += 1
+                await _reject(send, 503, "服务器繁忙，请稍后重试", controller.retry_after)
+                return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            budget.release(size)
+
+    async def _read_body(self, receive: Callable) -> Optional[List[Dict]]:
+        """读入整个请求体，超过 max_body_bytes 时返回 None"""
+        messages = []
+        total = 0
+        while True:
+            message = await receive()
+            messages.append(message)
+            if message['type'] != 'http.request':
+                return messages
+            total += len(message.get('body', b''))
+            if total > self.controller.max_body_bytes:
+                return None
+            if not message.get('more_body', False):
+                return messages
+
+    @staticmethod
+    def _replay(messages: List[Dict], receive: Callable) -> Callable:
+        pending = deque(messages)
+
+        async def replay():
+            if pending:
+                return pending.popleft()
+            return await receive()
+
+        return replay
+
+    @staticmethod
+    def _charging(receive: Callable, limiter: RateLimiter, client: str) -> Callable:
+        async def charging():
+            message = await receive()
+            if message['type'] == 'http.request':
+                limiter.charge(client, len(message.get('body', b'')))
+            return message
+
+        return charging
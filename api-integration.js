@@ -4,6 +4,8 @@ class GoodTextAPI {
         // 根据环境自动选择API URL
         this.apiUrl = this.getApiUrl();
         this.isOnline = navigator.onLine;
+        // 增量清理的服务端文档（id、版本、上次的原文和结果）
+        this.document = null;
         
         // 监听网络状态变化
         window.addEventListener('online', () => {
@@ -62,6 +64,111 @@ class GoodTextAPI {
         }
     }
     
+    // 增量清理：第一次创建服务端文档，之后只发送与上次原文不同的部分，按返回的编辑脚本更新清理结果
+    async cleanDocument(text, options = {}, language = null) {
+        const key = JSON.stringify([options, language]);
+        const doc = this.document;
+        if (!this.isOnline || !doc || doc.key !== key) {
+            return this.createDocument(text, options, language, key);
+        }
+
+        // 公共前缀和后缀之外的部分即为改动；不拆开代理对，位置换算成码点（与服务端的字符下标一致）
+        let start = 0;
+        const limit = Math.min(doc.text.length, text.length);
+        while (start < limit && doc.text.charCodeAt(start) === text.charCodeAt(start)) start++;
+        let suffix = 0;
+        while (suffix < limit - start
+               && doc.text.charCodeAt(doc.text.length - 1 - suffix) === text.charCodeAt(text.length - 1 - suffix)) suffix++;
+        if (start > 0 && /[\uD800-\uDBFF]/.test(text[start - 1])) start--;
+        if (suffix > 0 && /[\uDC00-\uDFFF]/.test(text[text.length - suffix])) suffix--;
+        if (start === doc.text.length && start === text.length) {
+            return doc.result;
+        }
+
+        try {
+            const codePointStart = Array.from(text.slice(0, start)).length;
+            const response = await fetch(`${this.apiUrl}/documents/${doc.id}`, {
+                method: 'PATCH',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({
+                    version: doc.version,
+                    start: codePointStart,
+                    end: codePointStart + Array.from(doc.text.slice(start, doc.text.length - suffix)).length,
+                    text: text.slice(start, text.length - suffix),
+                    response_mode: 'diff'
+                })
+            });
+
+            // 文档过期、版本冲突或编辑后为空时重新创建
+            if (!response.ok) {
+                return this.createDocument(text, options, language, key);
+            }
+
+            const update = await response.json();
+            const cleaned = Array.from(doc.result.cleaned_text);
+            for (const [editStart, editEnd, replacement] of update.edits.slice().reverse()) {
+                cleaned.splice(editStart, editEnd - editStart, ...Array.from(replacement));
+            }
+            doc.text = text;
+            doc.version = update.version;
+            doc.result = {
+                ...doc.result,
+                original_text: text,
+                cleaned_text: cleaned.join(''),
+                changes_made: update.changes_made,
+                stats: update.stats
+            };
+            return doc.result;
+
+        } catch (error) {
+            console.warn('增量清理失败，使用普通清理:', error);
+            this.document = null;
+            return this.cleanText(text, options, language);
+        }
+    }
+
+    async createDocument(text, options, language, key) {
+        this.document = null;
+        if (!this.isOnline) {
+            return this.fallbackClean(text, options);
+        }
+
+        try {
+            const response = await fetch(`${this.apiUrl}/documents`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({
+                    text: text,
+                    options: options,
+                    language: language
+                })
+            });
+
+            if (!response.ok) {
+                throw new Error(`API请求失败: ${response.status}`);
+            }
+
+            const created = await response.json();
+            const result = {
+                original_text: text,
+                cleaned_text: created.cleaned_text,
+                detected_language: created.detected_language,
+                changes_made: created.changes_made,
+                stats: created.stats
+            };
+            this.document = { id: created.document_id, version: created.version, key: key, text: text, result: result };
+            return result;
+
+        } catch (error) {
+            console.warn('创建文档失败，使用普通清理:', error);
+            return this.cleanText(text, options, language);
+        }
+    }
+
     async cleanTextBatch(texts, options = {}, language = null) {
         if (!this.isOnline) {
             // 批量本地处理
@@ -262,8 +369,8 @@ async function enhancedCleanText() {
         // 获取语言选择
         const language = document.getElementById('languageSelect')?.value || null;
         
-        // 调用API清理文本
-        const result = await goodTextAPI.cleanText(inputText, options, language);
+        // 调用API清理文本（编辑后再次清理时只发送改动的部分）
+        const result = await goodTextAPI.cleanDocument(inputText, options, language);
         
         // 显示结果
         outputText.value = result.cleaned_text;
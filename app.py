@@ -1,15 +1,34 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import re
 import unicodedata
 import html
-from typing import Optional, List, Dict
+from functools import partial
+from typing import Optional, List, Dict, Tuple, Callable, Literal
 import json
-import langdetect
-from langdetect import detect
+import time
+import gc
+import asyncio
+from text_normalizer import FusedNormalizer
+from text_features import ALWAYS, NON_ASCII, STAGE_TRIGGERS, may_change, scan as scan_features
+from text_stats import calculate_stats
+from clean_executor import CleanExecutor, ExecutorBusyError, WorkerCrashedError
+from shm_transport import SegmentPool
+from static_assets import StaticAssets
+from stream_cleaner import StreamCleaner, iter_ndjson_records, iter_request_text
+from result_cache import ResultCache, SqliteCacheBackend
+from language_detector import LanguageDetector, warm_up as warm_up_language_detection
+from language_packs import LanguagePack, LanguagePackRegistry
+from metrics import MetricsMiddleware, MetricsRegistry
+from admission import AdmissionController, AdmissionMiddleware, RateLimiter
+from compression import CompressionMiddleware
+from response_encoding import RESPONSE_MODES, FastJSONResponse, json_dumps, shape_result
+from job_queue import JobNotFoundError, JobRunner, JobStore
+from line_dedup import DEDUP_MODES, make_line_set, remove_duplicate_lines
+from incremental_cleaner import DocumentNotFoundError, DocumentStore, IncrementalDocument, VersionConflictError
 
 app = FastAPI(
     title="GoodText API",
@@ -21,324 +40,585 @@ app = FastAPI(
 import os
 cors_origins = os.getenv("CORS_ORIGINS", "https://goodtext-ai-cleaner.netlify.app,http://localhost:3000").split(",")
 
+# 请求准入控制（见 admission.py）：在 CORS 之前注册，拒绝的响应也带 CORS 头，前端能读到错误
+# 单个请求体的字节数上限（流式接口除外）
+CLEAN_MAX_BODY_BYTES = int(os.getenv("CLEAN_MAX_BODY_BYTES", str(10 * 1024 * 1024)))
+# 正在处理的请求体总字节数上限，超出时排队，最多等待 CLEAN_ADMISSION_WAIT 秒
+CLEAN_MAX_INFLIGHT_BYTES = int(os.getenv("CLEAN_MAX_INFLIGHT_BYTES", str(64 * 1024 * 1024)))
+CLEAN_ADMISSION_WAIT = float(os.getenv("CLEAN_ADMISSION_WAIT", "2"))
+# 每个客户端每秒的字节数（令牌桶），0 表示不限流；部署在代理后面时要让 uvicorn 使用
+# X-Forwarded-For（--forwarded-allow-ips），否则所有请求都算同一个客户端
+CLEAN_RATE_LIMIT = float(os.getenv("CLEAN_RATE_LIMIT", "0"))
+CLEAN_RATE_BURST = float(os.getenv("CLEAN_RATE_BURST", str(16 * 1024 * 1024)))
+# 单独限流的 API 密钥（请求头 X-API-Key），逗号分隔；其他请求按 IP 限流
+CLEAN_API_KEYS = [key for key in os.getenv("CLEAN_API_KEYS", "").split(",") if key]
+# 繁忙时（执行器已满、准入排队超时、清理进程异常退出）返回 503，建议客户端重试的秒数
+CLEAN_RETRY_AFTER = os.getenv("CLEAN_RETRY_AFTER", "1")
+
+admission = AdmissionController(
+    max_body_bytes=CLEAN_MAX_BODY_BYTES,
+    max_inflight_bytes=CLEAN_MAX_INFLIGHT_BYTES,
+    queue_timeout=CLEAN_ADMISSION_WAIT,
+    rate_limiter=RateLimiter(CLEAN_RATE_LIMIT, CLEAN_RATE_BURST) if CLEAN_RATE_LIMIT > 0 else None,
+    api_keys=CLEAN_API_KEYS,
+    streaming_paths=("/api/clean/stream", "/api/jobs"),
+    exempt_paths=("/api/health", "/api/metrics"),
+    retry_after=CLEAN_RETRY_AFTER,
+)
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=cors_origins,
     allow_credentials=True,
-    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_methods=["GET", "POST", "PATCH", "DELETE", "OPTIONS"],
     allow_headers=["*"],
 )
 
+# HTTP 压缩（见 compression.py）：注册在准入控制之外，准入控制看到的是解压后的请求体。
+# 响应按客户端的 Accept-Encoding 压缩，编码按逗号分隔的优先顺序选择（zstd 需要安装 zstandard），
+# 为空时不压缩响应；请求体的 gzip / zstd 总是解压
+CLEAN_COMPRESS_ENCODINGS = [encoding for encoding in os.getenv("CLEAN_COMPRESS_ENCODINGS", "zstd,gzip").split(",")
+                            if encoding]
+for compress_encoding in CLEAN_COMPRESS_ENCODINGS:
+    if compress_encoding not in ('zstd', 'gzip'):
+        raise ValueError(f"CLEAN_COMPRESS_ENCODINGS 只能包含 zstd、gzip，而不是 {compress_encoding}")
+# 小于这个字节数的响应不压缩
+CLEAN_COMPRESS_MIN_BYTES = int(os.getenv("CLEAN_COMPRESS_MIN_BYTES", "1024"))
+CLEAN_GZIP_LEVEL = int(os.getenv("CLEAN_GZIP_LEVEL", "6"))
+CLEAN_ZSTD_LEVEL = int(os.getenv("CLEAN_ZSTD_LEVEL", "3"))
+
+app.add_middleware(
+    CompressionMiddleware,
+    encodings=CLEAN_COMPRESS_ENCODINGS,
+    min_bytes=CLEAN_COMPRESS_MIN_BYTES,
+    gzip_level=CLEAN_GZIP_LEVEL,
+    zstd_level=CLEAN_ZSTD_LEVEL,
+)
+
 # Request models
 class TextCleanRequest(BaseModel):
     text: str
     options: Optional[Dict[str, bool]] = None
     language: Optional[str] = None
+    timings: bool = False
+    stats: bool = True
+    stage_stats: bool = False
+    response_mode: Literal['full', 'cleaned', 'diff'] = 'full'
 
 class BatchCleanRequest(BaseModel):
     texts: List[str]
     options: Optional[Dict[str, bool]] = None
     language: Optional[str] = None
+    timings: bool = False
+    stats: bool = True
+    stage_stats: bool = False
+    response_mode: Literal['full', 'cleaned', 'diff'] = 'full'
+
+class DocumentCreateRequest(BaseModel):
+    text: str
+    options: Optional[Dict[str, bool]] = None
+    language: Optional[str] = None
+
+class DocumentEditRequest(BaseModel):
+    start: int
+    end: int
+    text: str = ''
+    version: Optional[int] = None
+    response_mode: Literal['cleaned', 'diff'] = 'diff'
 
 # Response models
+class StageTiming(BaseModel):
+    stage: str
+    seconds: float
+    input_length: int
+    output_length: int
+
+class StageStats(BaseModel):
+    stage: str
+    chars_removed: int
+    lines_removed: int
+    # 阶段匹配并处理的数量（含义见 STAGE_MATCHES），没有计数的阶段为 None
+    matches: Optional[int] = None
+
 class CleanResult(BaseModel):
     original_text: str
     cleaned_text: str
     detected_language: str
     changes_made: List[str]
-    stats: Dict[str, int]
+    stats: Optional[Dict[str, int]] = None
+    timings: Optional[List[StageTiming]] = None
+    stage_stats: Optional[List[StageStats]] = None
 
 class BatchCleanResult(BaseModel):
     results: List[CleanResult]
     summary: Dict[str, int]
 
+class BodyStreamingResponse(StreamingResponse):
+    """边读请求体边输出的流式响应
+
+    StreamingResponse 会并发读取 receive 来监听断开，和正在读取的请求体冲突；
+    这里由 body_iterator 自己读取请求体，客户端断开时 request.stream() 会抛出 ClientDisconnect。
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+# 清理阶段（按执行顺序）：(选项名, 默认是否启用, 变更说明)
+CLEAN_STAGES = [
+    ('fix_encoding', True, "修复了文本编码问题"),
+    ('remove_html', True, "移除了HTML标签"),
+    ('remove_markdown', True, "移除了Markdown标记"),
+    ('fix_hyphenation', True, "修复了连字符断行"),
+    ('fix_line_breaks', True, "修复了换行问题"),
+    ('remove_extra_spaces', True, "移除了多余空格"),
+    ('remove_empty_lines', True, "移除了空行"),
+    ('normalize_punctuation', True, "标准化了标点符号"),
+    ('normalize_quotes', True, "标准化了引号"),
+    ('remove_duplicates', True, "移除了重复行"),
+    ('fix_ai_artifacts', True, "清理了AI生成文本的特殊标记"),
+]
+
+# 各阶段 StageStats.matches 的含义；不在这里的阶段只统计字符和行数的变化
+STAGE_MATCHES = {
+    'fix_encoding': "替换的乱码序列数（不含 Unicode 标准化）",
+    'remove_html': "删除的 HTML 标签和注释数（不含实体解码）",
+    'fix_hyphenation': "连接的连字符断行数",
+    'fix_line_breaks': "连接的断行数（不含段落换行的规范化）",
+    'normalize_punctuation': "替换的标点符号数（不含标点周围空格的修正）",
+    'normalize_quotes': "替换的引号数",
+    'remove_duplicates': "删除的重复行数",
+    'fix_ai_artifacts': "删除的 AI 标记数（角色标签、代码块标记、Note、引导语）",
+}
+
+class StagePlan(list):
+    """阶段计划：[(选项名, 阶段函数, 变更说明), ...]；triggers 是各阶段的触发特征（见 text_features.py），
+    counters 是各阶段的计数版本：清理并返回 (结果, 匹配数)，只在请求 stage_stats 时使用"""
+
+    def __init__(self, stages: List[Tuple[str, Callable[[str], str], str]], triggers: Dict[str, Tuple[int, ...]],
+                 counters: Optional[Dict[str, Callable[[str], Tuple[str, int]]]] = None):
+        super().__init__(stages)
+        self.triggers = triggers
+        self.counters = counters or {}
+
+# 默认选项的阶段开关
+DEFAULT_STAGE_KEY = tuple(enabled for _, enabled, _ in CLEAN_STAGES)
+
+# 常见的编码错误（乱码序列 -> 正确字符），按顺序执行
+_ENCODING_FIXES = [
+    ('â€™', "'"),  # 右单引号
+    ('â€œ', '"'),  # 左双引号
+    ('â€', '"'),   # 右双引号
+    ('â€"', '—'),  # 长划线
+    ('â€"', '–'),  # 短划线
+    ('Â', ''),     # 非断空格问题
+]
+
+# 智能引号 -> 直引号
+_QUOTE_FIXES = [(quote, '"') for quote in '"""'] + [(quote, "'") for quote in "'''"]
+
+# 预编译的正则表达式
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+_HTML_COMMENT_RE = re.compile(r'<!--.*?-->', re.DOTALL)
+_MD_CODE_BLOCK_RE = re.compile(r'```[\s\S]*?```')
+_MD_INLINE_CODE_RE = re.compile(r'`[^`]*`')
+_MD_HEADING_RE = re.compile(r'^#{1,6}\s*', re.MULTILINE)
+_MD_BOLD_STAR_RE = re.compile(r'\*\*([^*]*)\*\*')
+_MD_ITALIC_STAR_RE = re.compile(r'\*([^*]*)\*')
+_MD_BOLD_UNDERSCORE_RE = re.compile(r'__([^_]*)__')
+_MD_ITALIC_UNDERSCORE_RE = re.compile(r'_([^_]*)_')
+# 行首标记：等价于 ^\s*[-*+]\s+ 等写法，但避免在长串空白行的每个行首重新扫描（O(n²)）。
+# 行首空白用占有量词一次吃完；没有标记且空白跨越 8 行以上时由第二个分支原样保留并整体跳过
+_MD_BULLET_RE = re.compile(r'^(?:\s*+[-*+]\s+|(?=(?:[^\S\n]*\n){8})(\s++))', re.MULTILINE)
+_MD_NUMBERED_RE = re.compile(r'^(?:\s*+\d+\.\s+|(?=(?:[^\S\n]*\n){8})(\s++))', re.MULTILINE)
+_MD_QUOTE_RE = re.compile(r'^(?:\s*+>\s*|(?=(?:[^\S\n]*\n){8})(\s++))', re.MULTILINE)
+_MD_DASH_RULE_RE = re.compile(r'^-{3,}$', re.MULTILINE)
+_MD_STAR_RULE_RE = re.compile(r'^\*{3,}$', re.MULTILINE)
+_GENERIC_HYPHENATION_RE = re.compile(r'(?<=[a-zA-Z])-\s*\n\s*(?=[a-zA-Z])')
+_PARAGRAPH_BREAK_RE = re.compile(r'(?<=[.!?])\s*\n\s*(?=[A-Z\u4e00-\u9fff])')
+_SENTENCE_BREAK_RE = re.compile(r'(?<=[^.!?\n])\s*\n\s*(?=[a-z\u4e00-\u9fff])')
+_TRAILING_BLANKS_RE = re.compile(r'[ \t]+$', re.MULTILINE)
+_LEADING_BLANKS_RE = re.compile(r'^[ \t]+', re.MULTILINE)
+# 等价于 [ \t]+ 替换为一个空格，但跳过本来就是单个空格的位置（正文中几乎每个词之间都是）
+_BLANK_RUN_RE = re.compile(r' ?\t[ \t]*| {2,}[ \t]*')
+_BLANK_LINE_RE = re.compile(r'\n\s*\n')
+_NEWLINE_RUN_RE = re.compile(r'\n{3,}')
+_SPACE_BEFORE_PUNCT_RE = re.compile(r'\s+([,.!?;:])')
+# 前面是空白的标点；以标点字符集开头，正则引擎可以快速跳到下一个标点再检查前一个字符
+_PUNCT_AFTER_SPACE_RE = re.compile(r'[,.!?;:](?<=\s.)')
+# 等价于 ([,.!?;:])\s* 替换为 "标点+空格"，但跳过后面本来就是一个空格加非空白字符的标点
+_SPACE_AFTER_PUNCT_RE = re.compile(r'([,.!?;:])(?! \S)\s*')
+_TRAILING_WHITESPACE_RE = re.compile(r'\s+$', re.MULTILINE)
+_AI_ROLE_TAG_RE = re.compile(r'\[Assistant\]|\[User\]|\[Human\]|\[AI\]')
+_AI_CODE_FENCE_RE = re.compile(r'```[\w]*\n?')
+_AI_NOTE_RE = re.compile(r'\*\*Note:\*\*.*?(?=\n|$)')
+_AI_PREAMBLE_RE = re.compile(r'(?:Here\'s|Here is).*?:')
+
+def _subn_before_last(pattern: re.Pattern, closing: str, text: str) -> Tuple[str, int]:
+    """只在最后一个结束标记之前执行替换，返回 (结果, 替换次数)
+
+    没有结束标记时 <[^>]+> 和 <!--.*?--> 会从每个开始标记扫描到文本末尾（O(n²)）；
+    最后一个结束标记之后不可能有匹配，截掉后每次扫描都会停在下一个结束标记。
+    """
+    end = text.rfind(closing)
+    if end == -1:
+        return text, 0
+    end += len(closing)
+    head, count = pattern.subn('', text[:end])
+    return head + text[end:], count
+
+def _has_ascii_digit(text: str) -> bool:
+    return any(digit in text for digit in '0123456789')
+
+def _replace_links(text: str, opening: str, keep_label: bool) -> str:
+    """线性时间地替换 [文字](链接)，等价于 \\[([^\\]]*)\\]\\([^\\)]*\\) 的 sub
+
+    opening 为 '[' 时替换链接（保留文字），为 '![' 时删除图片。
+    记住上一次找到的 ']' 和 ')'，连续的 '[' 不会重复向后扫描。
+    """
+    parts = []
+    position = 0
+    search = 0
+    close_bracket = -1
+    close_paren = -1
+    while True:
+        start = text.find(opening, search)
+        if start == -1:
+            break
+        label = start + len(opening)
+        if close_bracket < label:
+            close_bracket = text.find(']', label)
+            if close_bracket == -1:
+                break
+        if not text.startswith('(', close_bracket + 1):
+            search = start + 1
+            continue
+        if close_paren < close_bracket + 2:
+            close_paren = text.find(')', close_bracket + 2)
+            if close_paren == -1:
+                break
+        parts.append(text[position:start])
+        if keep_label:
+            parts.append(text[label:close_bracket])
+        position = search = close_paren + 1
+    if not parts:
+        return text
+    parts.append(text[position:])
+    return ''.join(parts)
+
+# 重复行删除的已见行集合（见 line_dedup.py）：exact / hashed / bloom / near
+CLEAN_DEDUP_MODE = os.getenv("CLEAN_DEDUP_MODE", "hashed")
+CLEAN_DEDUP_ERROR_RATE = float(os.getenv("CLEAN_DEDUP_ERROR_RATE", "0.001"))
+if CLEAN_DEDUP_MODE not in DEDUP_MODES:
+    raise ValueError(f"CLEAN_DEDUP_MODE 必须是 {', '.join(DEDUP_MODES)} 之一")
+
 class AdvancedTextCleaner:
-    def __init__(self):
-        # 多语言标点符号映射
-        self.punctuation_map = {
-            # 中文标点 -> 英文标点
-            '，': ',',
-            '。': '.',
-            '？': '?',
-            '！': '!',
-            '；': ';',
-            '：': ':',
-            '"': '"',
-            '"': '"',
-            ''': "'",
-            ''': "'",
-            '（': '(',
-            '）': ')',
-            '【': '[',
-            '】': ']',
-            '《': '<',
-            '》': '>',
-            '、': ',',
-            
-            # 法语标点
-            '«': '"',
-            '»': '"',
-            
-            # 德语标点
-            '„': '"',
-            '"': '"',
-            
-            # 西班牙语标点
-            '¿': '',
-            '¡': '',
-        }
-        
-        # 多语言连字符模式
-        self.hyphenation_patterns = {
-            'en': r'(?<=[a-z])-\s*\n\s*(?=[a-z])',
-            'zh': r'(?<=[\u4e00-\u9fff])-\s*\n\s*(?=[\u4e00-\u9fff])',
-            'de': r'(?<=[a-zA-ZäöüßÄÖÜ])-\s*\n\s*(?=[a-zA-ZäöüßÄÖÜ])',
-            'fr': r'(?<=[a-zA-ZàâäéèêëïîôöùûüÿçÀÂÄÉÈÊËÏÎÔÖÙÛÜŸÇ])-\s*\n\s*(?=[a-zA-ZàâäéèêëïîôöùûüÿçÀÂÄÉÈÊËÏÎÔÖÙÛÜŸÇ])',
-            'es': r'(?<=[a-zA-ZáéíóúüñÁÉÍÓÚÜÑ])-\s*\n\s*(?=[a-zA-ZáéíóúüñÁÉÍÓÚÜÑ])',
-            'ru': r'(?<=[а-яёА-ЯЁ])-\s*\n\s*(?=[а-яёА-ЯЁ])',
-            'ja': r'(?<=[\u3040-\u309f\u30a0-\u30ff\u4e00-\u9fff])-\s*\n\s*(?=[\u3040-\u309f\u30a0-\u30ff\u4e00-\u9fff])',
-            'ko': r'(?<=[\uac00-\ud7af])-\s*\n\s*(?=[\uac00-\ud7af])',
-        }
-        
-        # 语言特定的换行模式
-        self.line_break_patterns = {
-            'zh': r'(?<=[\u4e00-\u9fff])\s*\n\s*(?=[\u4e00-\u9fff])',
-            'ja': r'(?<=[\u3040-\u309f\u30a0-\u30ff\u4e00-\u9fff])\s*\n\s*(?=[\u3040-\u309f\u30a0-\u30ff\u4e00-\u9fff])',
-            'ko': r'(?<=[\uac00-\ud7af])\s*\n\s*(?=[\uac00-\ud7af])',
-            'th': r'(?<=[\u0e00-\u0e7f])\s*\n\s*(?=[\u0e00-\u0e7f])',
-            'ar': r'(?<=[\u0600-\u06ff])\s*\n\s*(?=[\u0600-\u06ff])',
-            'he': r'(?<=[\u0590-\u05ff])\s*\n\s*(?=[\u0590-\u05ff])',
-        }
+    def __init__(self, dedup_mode: str = CLEAN_DEDUP_MODE, dedup_error_rate: float = CLEAN_DEDUP_ERROR_RATE):
+        self.dedup_mode = dedup_mode
+        self.dedup_error_rate = dedup_error_rate
+        # 各语言的连字符、换行、标点和 AI 引导语规则（language_packs/*.json），第一次用到时编译
+        self.language_packs = LanguagePackRegistry()
+        # 所有语言共用的标点符号映射
+        self.punctuation_map: Dict[str, str] = dict(self.language_packs.common.get('punctuation', {}))
+        self._encoding_normalizer = FusedNormalizer(_ENCODING_FIXES)
+        self._punctuation_normalizer = FusedNormalizer(self.punctuation_map.items())
+        self._quote_normalizer = FusedNormalizer(_QUOTE_FIXES)
+        # 有追加标点规则的语言各自的替换表
+        self._punctuation_normalizers: Dict[str, FusedNormalizer] = {}
+        # 各阶段的触发特征（见 text_features.py）；替换规则含 ASCII 原文时无法按字符类别判断
+        self.stage_triggers = dict(STAGE_TRIGGERS)
+        for name, normalizer in (('fix_encoding', self._encoding_normalizer),
+                                 ('normalize_punctuation', self._punctuation_normalizer),
+                                 ('normalize_quotes', self._quote_normalizer)):
+            if not normalizer.skips_ascii:
+                self.stage_triggers[name] = (ALWAYS,)
+        self.language_detector = LanguageDetector()
+        self._plans: Dict[Tuple[Tuple[bool, ...], Optional[str]], StagePlan] = {}
+        self._get_plan(DEFAULT_STAGE_KEY, None)
 
     def detect_language(self, text: str) -> str:
-        """检测文本语言"""
-        try:
-            # 去除多余空白后检测
-            clean_text = re.sub(r'\s+', ' ', text.strip())
-            if len(clean_text) < 10:
-                return 'unknown'
-            return detect(clean_text)
-        except:
-            return 'unknown'
-
-    def clean_text(self, text: str, options: Dict[str, bool] = None, language: str = None) -> CleanResult:
-        """高级文本清理功能"""
+        """检测文本语言（按样本检测，成本与文本长度无关）"""
+        return self.language_detector.detect(text)
+
+    def clean_text(self, text: str, options: Dict[str, bool] = None, language: str = None, timings: bool = False,
+                   stats: bool = True, stage_stats: bool = False) -> CleanResult:
+        """高级文本清理功能；timings 为 True 时记录每个阶段的耗时和输入输出长度（被跳过的阶段不记录）
+
+        stats 为 False 时不计算整体统计（stats 为 None）；stage_stats 为 True 时记录每个改动了文本的阶段
+        删除的字符数、行数和匹配数（见 STAGE_MATCHES）
+        """
         if not text.strip():
             raise ValueError("输入文本不能为空")
         
         original_text = text
         changes_made = []
         
-        # 默认选项
-        default_options = {
-            'remove_extra_spaces': True,
-            'fix_line_breaks': True,
-            'remove_empty_lines': True,
-            'fix_hyphenation': True,
-            'normalize_punctuation': True,
-            'remove_html': True,
-            'remove_markdown': True,
-            'fix_encoding': True,
-            'normalize_quotes': True,
-            'remove_duplicates': True,
-            'fix_ai_artifacts': True,
-            'standardize_numbers': False,
-            'convert_case': False,
-        }
-        
-        if options:
-            default_options.update(options)
+        stage_timings = [] if timings else None
+        stage_records = [] if stage_stats else None
         
         # 检测语言
         if not language:
+            start = time.perf_counter()
             language = self.detect_language(text)
+            if timings:
+                stage_timings.append(StageTiming(
+                    stage='detect_language', seconds=time.perf_counter() - start,
+                    input_length=len(text), output_length=len(text),
+                ))
         
-        # 开始清理
+        # 按预编译的阶段计划依次清理；预扫描的特征表明阶段不可能改动文本时跳过
         cleaned_text = text
-        
-        # 1. 修复编码问题
-        if default_options.get('fix_encoding'):
-            cleaned_text = self._fix_encoding(cleaned_text)
-            if cleaned_text != text:
-                changes_made.append("修复了文本编码问题")
-        
-        # 2. 清理HTML标签
-        if default_options.get('remove_html'):
+        features = scan_features(text)
+        plan = self.get_plan(options, language)
+        for name, stage, change in plan:
+            if not may_change(plan.triggers[name], features):
+                continue
             old_text = cleaned_text
-            cleaned_text = self._remove_html(cleaned_text)
+            matches = None
+            if timings:
+                start = time.perf_counter()
+            if stage_stats and name in plan.counters:
+                cleaned_text, matches = plan.counters[name](cleaned_text)
+            else:
+                cleaned_text = stage(cleaned_text)
+            if timings:
+                stage_timings.append(StageTiming(
+                    stage=name, seconds=time.perf_counter() - start,
+                    input_length=len(old_text), output_length=len(cleaned_text),
+                ))
+            # 没有匹配时阶段返回原对象，比较是 O(1)；有改动时重新扫描特征
             if cleaned_text != old_text:
-                changes_made.append("移除了HTML标签")
-        
-        # 3. 清理Markdown标记
-        if default_options.get('remove_markdown'):
-            old_text = cleaned_text
-            cleaned_text = self._remove_markdown(cleaned_text)
-            if cleaned_text != old_text:
-                changes_made.append("移除了Markdown标记")
-        
-        # 4. 修复连字符断行
-        if default_options.get('fix_hyphenation'):
-            old_text = cleaned_text
-            cleaned_text = self._fix_hyphenation(cleaned_text, language)
-            if cleaned_text != old_text:
-                changes_made.append("修复了连字符断行")
-        
-        # 5. 修复换行问题
-        if default_options.get('fix_line_breaks'):
-            old_text = cleaned_text
-            cleaned_text = self._fix_line_breaks(cleaned_text, language)
-            if cleaned_text != old_text:
-                changes_made.append("修复了换行问题")
-        
-        # 6. 移除多余空格
-        if default_options.get('remove_extra_spaces'):
-            old_text = cleaned_text
-            cleaned_text = self._remove_extra_spaces(cleaned_text)
-            if cleaned_text != old_text:
-                changes_made.append("移除了多余空格")
-        
-        # 7. 移除空行
-        if default_options.get('remove_empty_lines'):
-            old_text = cleaned_text
-            cleaned_text = self._remove_empty_lines(cleaned_text)
-            if cleaned_text != old_text:
-                changes_made.append("移除了空行")
-        
-        # 8. 标准化标点符号
-        if default_options.get('normalize_punctuation'):
-            old_text = cleaned_text
-            cleaned_text = self._normalize_punctuation(cleaned_text, language)
-            if cleaned_text != old_text:
-                changes_made.append("标准化了标点符号")
-        
-        # 9. 标准化引号
-        if default_options.get('normalize_quotes'):
-            old_text = cleaned_text
-            cleaned_text = self._normalize_quotes(cleaned_text)
-            if cleaned_text != old_text:
-                changes_made.append("标准化了引号")
-        
-        # 10. 移除重复行
-        if default_options.get('remove_duplicates'):
-            old_text = cleaned_text
-            cleaned_text = self._remove_duplicate_lines(cleaned_text)
-            if cleaned_text != old_text:
-                changes_made.append("移除了重复行")
-        
-        # 11. 清理AI生成文本的特殊标记
-        if default_options.get('fix_ai_artifacts'):
-            old_text = cleaned_text
-            cleaned_text = self._fix_ai_artifacts(cleaned_text)
-            if cleaned_text != old_text:
-                changes_made.append("清理了AI生成文本的特殊标记")
-        
-        # 计算统计信息
-        stats = self._calculate_stats(original_text, cleaned_text)
+                changes_made.append(change)
+                features = scan_features(cleaned_text)
+                if stage_stats:
+                    stage_records.append(StageStats(
+                        stage=name, chars_removed=len(old_text) - len(cleaned_text),
+                        lines_removed=old_text.count('\n') - cleaned_text.count('\n'), matches=matches,
+                    ))
         
         return CleanResult(
             original_text=original_text,
             cleaned_text=cleaned_text,
             detected_language=language,
             changes_made=changes_made,
-            stats=stats
+            stats=self._calculate_stats(original_text, cleaned_text) if stats else None,
+            timings=stage_timings,
+            stage_stats=stage_records,
         )
 
+    def get_plan(self, options: Dict[str, bool] = None, language: str = None) -> StagePlan:
+        """返回选项和语言对应的阶段计划：[(选项名, 阶段函数, 变更说明), ...]"""
+        stage_key = self.stage_key(options)
+        # 没有专用规则的语言共用通用计划，避免计划缓存随任意语言代码增长
+        pack = self.language_packs.get(language)
+        if pack is None or not pack.has_rules:
+            language = None
+        return self._get_plan(stage_key, language)
+
+    @staticmethod
+    def stage_key(options: Dict[str, bool] = None) -> Tuple[bool, ...]:
+        """把选项规范成各阶段是否启用的元组"""
+        if not options:
+            return DEFAULT_STAGE_KEY
+        return tuple(bool(options.get(name, enabled)) for name, enabled, _ in CLEAN_STAGES)
+
+    def _get_plan(self, stage_key: Tuple[bool, ...], language: Optional[str]) -> StagePlan:
+        """读取或生成阶段计划"""
+        plan = self._plans.get((stage_key, language))
+        if plan is None:
+            pack = self.language_packs.get(language)
+            enabled_stages = [(name, change) for (name, _, change), enabled in zip(CLEAN_STAGES, stage_key) if enabled]
+            counters = {name: self._stage_counter(name, language, pack) for name, _ in enabled_stages}
+            plan = StagePlan(
+                [(name, self._stage_function(name, language, pack), change) for name, change in enabled_stages],
+                self._plan_triggers(language, pack),
+                {name: counter for name, counter in counters.items() if counter is not None},
+            )
+            self._plans[(stage_key, language)] = plan
+        return plan
+
+    def _stage_function(self, name: str, language: Optional[str], pack: Optional[LanguagePack]) -> Callable[[str], str]:
+        """把语言相关的规则绑定到阶段函数上"""
+        if name == 'fix_hyphenation':
+            return partial((pack and pack.hyphenation or _GENERIC_HYPHENATION_RE).sub, '')
+        if name == 'fix_line_breaks':
+            return partial(self._join_line_breaks, pack and pack.line_break)
+        if name == 'normalize_punctuation':
+            return partial(self._normalize_punctuation, language=language)
+        if name == 'remove_duplicates':
+            return self._remove_duplicate_lines
+        if name == 'fix_ai_artifacts' and pack is not None and pack.ai_preamble is not None:
+            return partial(self._fix_ai_artifacts, preamble=pack.ai_preamble)
+        return getattr(self, '_' + name)
+
+    def _stage_counter(self, name: str, language: Optional[str],
+                       pack: Optional[LanguagePack]) -> Optional[Callable[[str], Tuple[str, int]]]:
+        """阶段的计数版本（匹配数的含义见 STAGE_MATCHES），没有计数的阶段返回 None"""
+        if name == 'fix_encoding':
+            return self._fix_encoding_counted
+        if name == 'remove_html':
+            return self._remove_html_counted
+        if name == 'fix_hyphenation':
+            return partial((pack and pack.hyphenation or _GENERIC_HYPHENATION_RE).subn, '')
+        if name == 'fix_line_breaks':
+            return partial(self._join_line_breaks_counted, pack and pack.line_break)
+        if name == 'normalize_punctuation':
+            return partial(self._normalize_punctuation_counted, language=language)
+        if name == 'normalize_quotes':
+            return self._quote_normalizer.subn
+        if name == 'remove_duplicates':
+            return self._remove_duplicate_lines_counted
+        if name == 'fix_ai_artifacts':
+            return partial(self._fix_ai_artifacts_counted, preamble=pack and pack.ai_preamble)
+        return None
+
+    def _plan_triggers(self, language: Optional[str], pack: Optional[LanguagePack]) -> Dict[str, Tuple[int, ...]]:
+        """语言的各阶段触发特征：规则包追加的规则含 ASCII 原文时无法按字符类别判断"""
+        triggers = self.stage_triggers
+        if pack is None:
+            return triggers
+        triggers = dict(triggers)
+        if pack.punctuation and not self._punctuation_normalizer_for(language).skips_ascii:
+            triggers['normalize_punctuation'] = (ALWAYS,)
+        if pack.ai_phrases:
+            # 引导语都含非 ASCII 字符时，纯 ASCII 文本不会命中
+            if any(phrase.isascii() for phrase in pack.ai_phrases):
+                triggers['fix_ai_artifacts'] = (ALWAYS,)
+            else:
+                triggers['fix_ai_artifacts'] += (NON_ASCII,)
+        return triggers
+
+    def _punctuation_normalizer_for(self, language: Optional[str]) -> FusedNormalizer:
+        """语言的标点替换表：通用映射加上规则包追加的规则"""
+        normalizer = self._punctuation_normalizers.get(language)
+        if normalizer is None:
+            pack = self.language_packs.get(language)
+            if pack is None or not pack.punctuation:
+                return self._punctuation_normalizer
+            normalizer = FusedNormalizer({**self.punctuation_map, **pack.punctuation}.items())
+            self._punctuation_normalizers[language] = normalizer
+        return normalizer
+
     def _fix_encoding(self, text: str) -> str:
         """修复编码问题"""
-        # 修复常见的编码问题
-        text = text.replace('â€™', "'")  # 右单引号
-        text = text.replace('â€œ', '"')  # 左双引号
-        text = text.replace('â€', '"')   # 右双引号
-        text = text.replace('â€"', '—')  # 长划线
-        text = text.replace('â€"', '–')  # 短划线
-        text = text.replace('Â', '')     # 非断空格问题
+        # 修复常见的编码问题（一次融合替换）
+        text = self._encoding_normalizer(text)
         
         # Unicode标准化
         text = unicodedata.normalize('NFKC', text)
         
         return text
 
+    def _fix_encoding_counted(self, text: str) -> Tuple[str, int]:
+        """修复编码问题，同时返回替换的乱码序列数"""
+        text, count = self._encoding_normalizer.subn(text)
+        return unicodedata.normalize('NFKC', text), count
+
     def _remove_html(self, text: str) -> str:
         """移除HTML标签"""
+        return self._remove_html_counted(text)[0]
+
+    def _remove_html_counted(self, text: str) -> Tuple[str, int]:
+        """移除HTML标签，同时返回删除的标签和注释数"""
         # 先解码HTML实体
         text = html.unescape(text)
         
         # 移除HTML标签
-        text = re.sub(r'<[^>]+>', '', text)
+        text, tags = _subn_before_last(_HTML_TAG_RE, '>', text)
         
         # 移除HTML注释
-        text = re.sub(r'<!--.*?-->', '', text, flags=re.DOTALL)
+        text, comments = _subn_before_last(_HTML_COMMENT_RE, '-->', text)
         
-        return text
+        return text, tags + comments
 
     def _remove_markdown(self, text: str) -> str:
-        """移除Markdown标记"""
+        """移除Markdown标记（文本中没有某种标记的字符时跳过对应的正则）"""
         # 移除代码块
-        text = re.sub(r'```[\s\S]*?```', '', text)
-        text = re.sub(r'`[^`]*`', '', text)
+        if '`' in text:
+            text = _MD_CODE_BLOCK_RE.sub('', text)
+            text = _MD_INLINE_CODE_RE.sub('', text)
         
         # 移除标题标记
-        text = re.sub(r'^#{1,6}\s*', '', text, flags=re.MULTILINE)
+        if '#' in text:
+            text = _MD_HEADING_RE.sub('', text)
         
-        # 移除链接
-        text = re.sub(r'\[([^\]]*)\]\([^\)]*\)', r'\1', text)
-        
-        # 移除图片
-        text = re.sub(r'!\[([^\]]*)\]\([^\)]*\)', '', text)
+        if '[' in text:
+            # 移除链接
+            text = _replace_links(text, '[', keep_label=True)
+            
+            # 移除图片
+            text = _replace_links(text, '![', keep_label=False)
         
         # 移除粗体和斜体
-        text = re.sub(r'\*\*([^*]*)\*\*', r'\1', text)
-        text = re.sub(r'\*([^*]*)\*', r'\1', text)
-        text = re.sub(r'__([^_]*)__', r'\1', text)
-        text = re.sub(r'_([^_]*)_', r'\1', text)
+        if '*' in text:
+            text = _MD_BOLD_STAR_RE.sub(r'\1', text)
+            text = _MD_ITALIC_STAR_RE.sub(r'\1', text)
+        if '_' in text:
+            text = _MD_BOLD_UNDERSCORE_RE.sub(r'\1', text)
+            text = _MD_ITALIC_UNDERSCORE_RE.sub(r'\1', text)
         
-        # 移除列表标记
-        text = re.sub(r'^\s*[-*+]\s+', '', text, flags=re.MULTILINE)
-        text = re.sub(r'^\s*\d+\.\s+', '', text, flags=re.MULTILINE)
+        # 移除列表标记（\d 也匹配非 ASCII 数字）
+        if '-' in text or '*' in text or '+' in text:
+            text = _MD_BULLET_RE.sub(r'\1', text)
+        if '.' in text and (not text.isascii() or _has_ascii_digit(text)):
+            text = _MD_NUMBERED_RE.sub(r'\1', text)
         
         # 移除引用标记
-        text = re.sub(r'^\s*>\s*', '', text, flags=re.MULTILINE)
+        if '>' in text:
+            text = _MD_QUOTE_RE.sub(r'\1', text)
         
         # 移除分割线
-        text = re.sub(r'^-{3,}$', '', text, flags=re.MULTILINE)
-        text = re.sub(r'^\*{3,}$', '', text, flags=re.MULTILINE)
+        if '---' in text:
+            text = _MD_DASH_RULE_RE.sub('', text)
+        if '***' in text:
+            text = _MD_STAR_RULE_RE.sub('', text)
         
         return text
 
     def _fix_hyphenation(self, text: str, language: str) -> str:
         """修复连字符断行问题"""
-        if language in self.hyphenation_patterns:
-            pattern = self.hyphenation_patterns[language]
-            text = re.sub(pattern, '', text)
-        else:
-            # 通用连字符修复
-            text = re.sub(r'(?<=[a-zA-Z])-\s*\n\s*(?=[a-zA-Z])', '', text)
-        
-        return text
+        # 没有语言专用规则时使用通用连字符修复
+        pack = self.language_packs.get(language)
+        pattern = pack and pack.hyphenation or _GENERIC_HYPHENATION_RE
+        return pattern.sub('', text)
 
     def _fix_line_breaks(self, text: str, language: str) -> str:
         """修复换行问题"""
+        pack = self.language_packs.get(language)
+        return self._join_line_breaks(pack and pack.line_break, text)
+
+    def _join_line_breaks(self, language_pattern: Optional[re.Pattern], text: str) -> str:
+        """按预编译的语言规则修复换行"""
+        return self._join_line_breaks_counted(language_pattern, text)[0]
+
+    def _join_line_breaks_counted(self, language_pattern: Optional[re.Pattern], text: str) -> Tuple[str, int]:
+        """按预编译的语言规则修复换行，同时返回连接的断行数"""
+        joined = 0
         # 语言特定的换行修复
-        if language in self.line_break_patterns:
-            pattern = self.line_break_patterns[language]
-            text = re.sub(pattern, '', text)
+        if language_pattern is not None:
+            text, joined = language_pattern.subn('', text)
         
         # 修复段落间的换行
-        text = re.sub(r'(?<=[.!?])\s*\n\s*(?=[A-Z\u4e00-\u9fff])', '\n\n', text)
+        text = _PARAGRAPH_BREAK_RE.sub('\n\n', text)
         
         # 修复句子中间的换行
-        text = re.sub(r'(?<=[^.!?\n])\s*\n\s*(?=[a-z\u4e00-\u9fff])', ' ', text)
+        text, count = _SENTENCE_BREAK_RE.subn(' ', text)
         
-        return text
+        return text, joined + count
 
     def _remove_extra_spaces(self, text: str) -> str:
         """移除多余空格"""
-        # 移除行首行尾空格
-        text = re.sub(r'[ \t]+$', '', text, flags=re.MULTILINE)
-        text = re.sub(r'^[ \t]+', '', text, flags=re.MULTILINE)
+        # 移除行首行尾空格（跳过不可能有行首行尾空格的文本）
+        has_tab = '\t' in text
+        if has_tab or ' \n' in text or text.endswith(' '):
+            text = _TRAILING_BLANKS_RE.sub('', text)
+        if has_tab or '\n ' in text or text.startswith(' '):
+            text = _LEADING_BLANKS_RE.sub('', text)
         
         # 合并多个空格为一个
-        text = re.sub(r'[ \t]+', ' ', text)
+        text = _BLANK_RUN_RE.sub(' ', text)
         
         # 移除制表符
         text = text.replace('\t', ' ')
@@ -348,155 +628,553 @@ class AdvancedTextCleaner:
     def _remove_empty_lines(self, text: str) -> str:
         """移除空行"""
         # 移除完全空白的行
-        text = re.sub(r'\n\s*\n', '\n\n', text)
+        text = _BLANK_LINE_RE.sub('\n\n', text)
         
         # 移除超过两个的连续换行
-        text = re.sub(r'\n{3,}', '\n\n', text)
+        if '\n\n\n' in text:
+            text = _NEWLINE_RUN_RE.sub('\n\n', text)
         
         return text.strip()
 
     def _normalize_punctuation(self, text: str, language: str) -> str:
         """标准化标点符号"""
-        for old_punct, new_punct in self.punctuation_map.items():
-            text = text.replace(old_punct, new_punct)
-        
-        # 修复标点符号周围的空格
-        text = re.sub(r'\s+([,.!?;:])', r'\1', text)  # 移除标点前的空格
-        text = re.sub(r'([,.!?;:])\s*', r'\1 ', text)  # 标点后加空格
-        text = re.sub(r'\s+$', '', text, flags=re.MULTILINE)  # 移除行尾多余空格
+        return self._fix_punctuation_spaces(self._punctuation_normalizer_for(language)(text))
+
+    def _normalize_punctuation_counted(self, text: str, language: str) -> Tuple[str, int]:
+        """标准化标点符号，同时返回替换的标点符号数"""
+        text, count = self._punctuation_normalizer_for(language).subn(text)
+        return self._fix_punctuation_spaces(text), count
+
+    @staticmethod
+    def _fix_punctuation_spaces(text: str) -> str:
+        """修复标点符号周围的空格"""
+        if _PUNCT_AFTER_SPACE_RE.search(text):
+            text = _SPACE_BEFORE_PUNCT_RE.sub(r'\1', text)  # 移除标点前的空格
+        text = _SPACE_AFTER_PUNCT_RE.sub(r'\1 ', text)  # 标点后加空格
+        # 移除行尾多余空格（只有一行时就是去掉末尾空白）
+        text = _TRAILING_WHITESPACE_RE.sub('', text) if '\n' in text else text.rstrip()
         
         return text
 
     def _normalize_quotes(self, text: str) -> str:
         """标准化引号"""
         # 智能引号替换
-        text = re.sub(r'["""]', '"', text)
-        text = re.sub(r"[''']", "'", text)
-        
-        return text
+        return self._quote_normalizer(text)
 
     def _remove_duplicate_lines(self, text: str) -> str:
         """移除重复行"""
-        lines = text.split('\n')
-        unique_lines = []
-        seen = set()
-        
-        for line in lines:
-            line_stripped = line.strip()
-            if line_stripped and line_stripped not in seen:
-                unique_lines.append(line)
-                seen.add(line_stripped)
-            elif not line_stripped:
-                unique_lines.append(line)
-        
-        return '\n'.join(unique_lines)
+        return remove_duplicate_lines(text, self.new_line_set())
+
+    def _remove_duplicate_lines_counted(self, text: str) -> Tuple[str, int]:
+        """移除重复行，同时返回删除的行数（只删除整行，行数差就是删除的行数）"""
+        cleaned = self._remove_duplicate_lines(text)
+        return cleaned, text.count('\n') - cleaned.count('\n')
+
+    def new_line_set(self):
+        """按配置的去重模式创建空的已见行集合"""
+        return make_line_set(self.dedup_mode, self.dedup_error_rate)
 
-    def _fix_ai_artifacts(self, text: str) -> str:
-        """清理AI生成文本的特殊标记"""
+    def _fix_ai_artifacts(self, text: str, preamble: Optional[re.Pattern] = None) -> str:
+        """清理AI生成文本的特殊标记；preamble 是语言规则包追加的引导语"""
+        return self._fix_ai_artifacts_counted(text, preamble)[0]
+
+    def _fix_ai_artifacts_counted(self, text: str, preamble: Optional[re.Pattern] = None) -> Tuple[str, int]:
+        """清理AI生成文本的特殊标记，同时返回删除的标记数"""
         # 移除常见的AI标记
-        text = re.sub(r'\[Assistant\]|\[User\]|\[Human\]|\[AI\]', '', text)
-        text = re.sub(r'```[\w]*\n?', '', text)  # 移除代码标记
-        text = re.sub(r'\*\*Note:\*\*.*?(?=\n|$)', '', text)  # 移除Note标记
-        text = re.sub(r'(?:Here\'s|Here is).*?:', '', text)  # 移除AI引导语
+        text, roles = _AI_ROLE_TAG_RE.subn('', text)
+        text, fences = _AI_CODE_FENCE_RE.subn('', text)  # 移除代码标记
+        text, notes = _AI_NOTE_RE.subn('', text)  # 移除Note标记
+        text, preambles = _AI_PREAMBLE_RE.subn('', text)  # 移除AI引导语
+        if preamble is not None:
+            text, count = preamble.subn('', text)
+            preambles += count
         
-        return text
+        return text, roles + fences + notes + preambles
 
     def _calculate_stats(self, original: str, cleaned: str) -> Dict[str, int]:
-        """计算清理统计"""
-        return {
-            'original_length': len(original),
-            'cleaned_length': len(cleaned),
-            'chars_removed': len(original) - len(cleaned),
-            'original_lines': len(original.split('\n')),
-            'cleaned_lines': len(cleaned.split('\n')),
-            'original_words': len(original.split()),
-            'cleaned_words': len(cleaned.split())
-        }
+        """计算清理统计（计数不分配子串，见 text_stats.py）"""
+        return calculate_stats(original, cleaned)
 
 # 创建清理器实例
 cleaner = AdvancedTextCleaner()
 
+# langdetect 语言概率表的加载时机：
+# - lazy: 第一次检测拉丁字母文本时加载（这个请求多花数百毫秒）
+# - startup: 启动后在后台线程加载，不推迟第一个响应
+# - preload: 导入 app 时加载并冻结 GC，之后 fork 出的进程（gunicorn --preload 的 worker、
+#   process 模式的清理进程）按写时复制共享概率表，不必各自加载
+CLEAN_LANGDETECT_LOAD = os.getenv("CLEAN_LANGDETECT_LOAD", "startup")
+if CLEAN_LANGDETECT_LOAD not in ('lazy', 'startup', 'preload'):
+    raise ValueError("CLEAN_LANGDETECT_LOAD 必须是 lazy、startup、preload 之一")
+
+# 清理任务执行器：inline / thread / process
+CLEAN_EXECUTOR = os.getenv("CLEAN_EXECUTOR", "thread")
+CLEAN_WORKERS = int(os.getenv("CLEAN_WORKERS", "0")) or None
+CLEAN_MAX_PENDING = int(os.getenv("CLEAN_MAX_PENDING", "256"))
+# 不超过这个字符数的文本在批量请求中拼在一起清理、按组检测语言（0 表示总是逐条清理）
+CLEAN_BATCH_MAX_CHARS = int(os.getenv("CLEAN_BATCH_MAX_CHARS", "2048"))
+# 批量清理时按组检测语言，每组约这么多字符、调用一次 langdetect；同一组混杂多种拉丁字母
+# 语言时少数语言会被标成多数语言，0 表示逐条检测
+CLEAN_BATCH_LANGUAGE_GROUP = int(os.getenv("CLEAN_BATCH_LANGUAGE_GROUP", "2048"))
+# process 模式下不少于这个字符数的文本在段落边界分块，由所有清理进程并行清理（0 表示不分块）
+CLEAN_PARALLEL_MIN_CHARS = int(os.getenv("CLEAN_PARALLEL_MIN_CHARS", str(1024 * 1024)))
+# process 模式下不少于这个字符数的文本（和大文本的各块）经共享内存传给清理进程，不经过 pickle（0 表示不用）；
+# 编码可选 utf-8（拉丁字母文本更快）或 utf-32-le（以中日韩文本为主时更快），
+# 空闲的共享内存段最多保留这么多字节供后面的请求复用
+CLEAN_SHM_MIN_CHARS = int(os.getenv("CLEAN_SHM_MIN_CHARS", str(64 * 1024)))
+CLEAN_SHM_ENCODING = os.getenv("CLEAN_SHM_ENCODING", "utf-8")
+CLEAN_SHM_POOL_BYTES = int(os.getenv("CLEAN_SHM_POOL_BYTES", str(64 * 1024 * 1024)))
+
+# 清理结果缓存：进程内 LRU，可选 sqlite 文件作为多个 worker 共享的第二层
+CLEAN_CACHE_BYTES = int(os.getenv("CLEAN_CACHE_BYTES", str(64 * 1024 * 1024)))
+CLEAN_CACHE_TTL = float(os.getenv("CLEAN_CACHE_TTL", "3600"))
+CLEAN_CACHE_SQLITE = os.getenv("CLEAN_CACHE_SQLITE")
+
+# 阶段耗时指标：开启后每次清理都记录各阶段耗时并写入 /api/metrics 的直方图；
+# 关闭时只有请求了 timings 的任务会记录
+CLEAN_STAGE_METRICS = os.getenv("CLEAN_STAGE_METRICS", "0") == "1"
+
+metrics = MetricsRegistry()
+http_requests = metrics.counter("goodtext_http_requests_total", "HTTP 请求数", ("method", "path", "status"))
+http_request_seconds = metrics.histogram("goodtext_http_request_seconds", "HTTP 请求耗时（秒）", ("method", "path"))
+batch_size = metrics.histogram("goodtext_batch_size", "批量清理请求的文本数", buckets=(1, 2, 5, 10, 20, 50, 100))
+clean_input_chars = metrics.histogram(
+    "goodtext_clean_input_chars", "新清理（未命中缓存）的文本长度（字符）",
+    buckets=(100, 1000, 10000, 100000, 1000000, 10000000),
+)
+stage_seconds = metrics.histogram("goodtext_stage_seconds", "各清理阶段的耗时（秒）", ("stage",))
+stage_input_chars = metrics.counter("goodtext_stage_input_chars_total", "各清理阶段处理的字符数", ("stage",))
+
+def observe_result(result: CleanResult) -> None:
+    """把新清理结果的阶段耗时写入直方图"""
+    clean_input_chars.observe(len(result.original_text))
+    for timing in result.timings or ():
+        stage_seconds.observe(timing.seconds, timing.stage)
+        stage_input_chars.inc(timing.stage, amount=timing.input_length)
+
+app.add_middleware(
+    MetricsMiddleware,
+    requests=http_requests,
+    latency=http_request_seconds,
+    routes=lambda: app.routes,
+)
+
+result_cache = ResultCache(
+    CleanResult,
+    max_bytes=CLEAN_CACHE_BYTES,
+    ttl=CLEAN_CACHE_TTL,
+    backend=SqliteCacheBackend(CLEAN_CACHE_SQLITE) if CLEAN_CACHE_SQLITE else None,
+) if CLEAN_CACHE_BYTES > 0 else None
+
+executor = CleanExecutor(
+    cleaner, mode=CLEAN_EXECUTOR, workers=CLEAN_WORKERS, max_pending=CLEAN_MAX_PENDING, cache=result_cache,
+    stage_timings=CLEAN_STAGE_METRICS, on_result=observe_result, batch_max_chars=CLEAN_BATCH_MAX_CHARS,
+    batch_language_group=CLEAN_BATCH_LANGUAGE_GROUP, parallel_min_chars=CLEAN_PARALLEL_MIN_CHARS,
+    shared_pool=SegmentPool(CLEAN_SHM_ENCODING, CLEAN_SHM_POOL_BYTES) if CLEAN_EXECUTOR == 'process' else None,
+    shared_min_chars=CLEAN_SHM_MIN_CHARS,
+)
+metrics.gauges("goodtext_executor", "清理执行器状态", lambda: executor.stats())
+metrics.gauges("goodtext_admission", "请求准入控制状态（进程启动以来）", admission.stats)
+metrics.gauges("goodtext_cache", "清理结果缓存状态（进程启动以来）", lambda: result_cache.stats() if result_cache is not None else None)
+
+def busy_error(e: Exception) -> HTTPException:
+    """执行器已满或工作进程异常退出（ExecutorBusyError、WorkerCrashedError）时返回 503，并提示客户端重试时间"""
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": CLEAN_RETRY_AFTER})
+
+# 大批量任务：状态和结果保存在 sqlite 文件中，重启后继续
+CLEAN_JOBS_DB = os.getenv("CLEAN_JOBS_DB", "jobs.db")
+CLEAN_JOBS_CHUNK = int(os.getenv("CLEAN_JOBS_CHUNK", "64"))
+CLEAN_JOBS_MAX_ITEMS = int(os.getenv("CLEAN_JOBS_MAX_ITEMS", "10000000"))
+CLEAN_JOBS_TTL = float(os.getenv("CLEAN_JOBS_TTL", str(7 * 24 * 3600)))
+# 多个 worker 共用任务数据库：心跳超过这么多秒的 worker 视为已退出，它认领的条目由其他 worker 接手
+CLEAN_JOBS_LEASE = float(os.getenv("CLEAN_JOBS_LEASE", "60"))
+
+# 在 startup 中打开（只导入 app 的进程，例如 clean_files.py 和基准测试，不创建数据库文件）
+job_store: Optional[JobStore] = None
+job_runner: Optional[JobRunner] = None
+
+# 增量清理的文档：保存在进程内，多个 worker 时需要按文档 id 固定到同一个 worker
+CLEAN_DOCUMENTS_BYTES = int(os.getenv("CLEAN_DOCUMENTS_BYTES", str(256 * 1024 * 1024)))
+CLEAN_DOCUMENTS_TTL = float(os.getenv("CLEAN_DOCUMENTS_TTL", "3600"))
+
+document_store = DocumentStore(max_bytes=CLEAN_DOCUMENTS_BYTES, ttl=CLEAN_DOCUMENTS_TTL)
+metrics.gauges("goodtext_documents", "增量清理文档状态", document_store.stats)
+
+@app.on_event("startup")
+async def start_job_runner():
+    """打开任务数据库，启动后台任务执行（继续上次未完成的任务）"""
+    global job_store, job_runner
+    job_store = await run_in_threadpool(JobStore, CLEAN_JOBS_DB)
+    job_runner = JobRunner(job_store, executor, shape_result, chunk_size=CLEAN_JOBS_CHUNK,
+                           retry_delay=float(CLEAN_RETRY_AFTER), ttl=CLEAN_JOBS_TTL, lease=CLEAN_JOBS_LEASE)
+    job_runner.start()
+
+@app.on_event("startup")
+async def warm_up_language_detection_in_background():
+    """startup 模式下在后台线程加载 langdetect，不等待加载完成"""
+    if CLEAN_LANGDETECT_LOAD == 'startup':
+        asyncio.get_running_loop().run_in_executor(None, warm_up_language_detection)
+
+@app.on_event("shutdown")
+async def shutdown_executor():
+    """停止后台任务并关闭清理执行器"""
+    if job_runner is not None:
+        await job_runner.stop()
+        job_store.close()
+    executor.shutdown()
+
+# 主页和静态文件：读入内存、预先压缩，文件修改后才重新读取；HTML 以外的文件缓存这么多秒
+CLEAN_STATIC_DIR = os.getenv("CLEAN_STATIC_DIR", os.path.dirname(os.path.abspath(__file__)))
+CLEAN_STATIC_MAX_AGE = int(os.getenv("CLEAN_STATIC_MAX_AGE", "300"))
+
+static_assets = StaticAssets(
+    {
+        "/": os.path.join(CLEAN_STATIC_DIR, "index.html"),
+        "/style.css": os.path.join(CLEAN_STATIC_DIR, "style.css"),
+        "/api-integration.js": os.path.join(CLEAN_STATIC_DIR, "api-integration.js"),
+        "/ads.txt": os.path.join(CLEAN_STATIC_DIR, "ads.txt"),
+    },
+    max_age=CLEAN_STATIC_MAX_AGE,
+)
+metrics.gauges("goodtext_static", "内存中的静态文件", static_assets.stats)
+
 @app.get("/", response_class=HTMLResponse)
-async def read_root():
-    """返回主页面"""
-    try:
-        with open("index.html", "r", encoding="utf-8") as f:
-            return HTMLResponse(content=f.read())
-    except FileNotFoundError:
+async def read_root(request: Request):
+    """返回主页面（内存中的 index.html，支持压缩和 ETag）"""
+    response = await static_assets.response(request)
+    if response is None:
         return HTMLResponse(content="<h1>GoodText API</h1><p>API is running! Visit /docs for documentation.</p>")
+    return response
+
+for static_path in static_assets.paths[1:]:
+    app.add_route(static_path, static_assets.endpoint, methods=["GET", "HEAD"], include_in_schema=False)
 
-@app.post("/api/clean", response_model=CleanResult)
+@app.post("/api/clean", response_model=CleanResult, response_class=FastJSONResponse)
 async def clean_text(request: TextCleanRequest):
-    """清理单个文本"""
+    """清理单个文本
+
+    timings 为 true 时返回各阶段耗时；stats 为 false 时不计算统计，stage_stats 为 true 时返回
+    各阶段删除的字符数、行数和匹配数；response_mode 为 cleaned 时不回传原文，
+    为 diff 时只返回编辑脚本 edits（[起点, 终点, 替换文本]，位置是原文的字符下标）
+    """
     try:
-        result = cleaner.clean_text(
+        result = await executor.clean(
             text=request.text,
             options=request.options,
-            language=request.language
+            language=request.language,
+            timings=request.timings,
+            stats=request.stats,
+            stage_stats=request.stage_stats
         )
-        return result
+        if request.response_mode == 'diff':
+            content = await run_in_threadpool(shape_result, result, request.response_mode)
+        else:
+            content = shape_result(result, request.response_mode)
+        return FastJSONResponse(content)
+    except (ExecutorBusyError, WorkerCrashedError) as e:
+        raise busy_error(e)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"文本处理错误: {str(e)}")
 
-@app.post("/api/clean/batch", response_model=BatchCleanResult)
+@app.post("/api/clean/batch", response_model=BatchCleanResult, response_class=FastJSONResponse)
 async def clean_texts_batch(request: BatchCleanRequest):
-    """批量清理文本"""
+    """批量清理文本（stats、stage_stats、response_mode 同 /api/clean；stats 为 false 时 summary 只有文本数）"""
     if len(request.texts) > 100:
         raise HTTPException(status_code=400, detail="批量处理最多支持100个文本")
+    batch_size.observe(len(request.texts))
     
     try:
-        results = []
         total_chars_removed = 0
         total_lines_removed = 0
         
-        for text in request.texts:
-            if text.strip():  # 跳过空文本
-                result = cleaner.clean_text(
-                    text=text,
-                    options=request.options,
-                    language=request.language
-                )
-                results.append(result)
+        # 跳过空文本，其余文本分给各个工作线程/进程并行清理
+        texts = [text for text in request.texts if text.strip()]
+        results = await executor.clean_many(
+            texts=texts,
+            options=request.options,
+            language=request.language,
+            timings=request.timings,
+            stats=request.stats,
+            stage_stats=request.stage_stats
+        )
+        summary = {'total_texts_processed': len(results)}
+        if request.stats:
+            for result in results:
                 total_chars_removed += result.stats['chars_removed']
                 total_lines_removed += (result.stats['original_lines'] - result.stats['cleaned_lines'])
+            summary['total_chars_removed'] = total_chars_removed
+            summary['total_lines_removed'] = total_lines_removed
         
-        summary = {
-            'total_texts_processed': len(results),
-            'total_chars_removed': total_chars_removed,
-            'total_lines_removed': total_lines_removed
-        }
-        
-        return BatchCleanResult(results=results, summary=summary)
+        if request.response_mode == 'diff':
+            shaped = await run_in_threadpool(lambda: [shape_result(result, 'diff') for result in results])
+        else:
+            shaped = [shape_result(result, request.response_mode) for result in results]
+        return FastJSONResponse({'results': shaped, 'summary': summary})
     
+    except (ExecutorBusyError, WorkerCrashedError) as e:
+        raise busy_error(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"批量处理错误: {str(e)}")
 
+@app.post("/api/clean/stream")
+async def clean_text_stream(request: Request, language: Optional[str] = None, options: Optional[str] = None):
+    """流式清理：请求体为纯文本或 NDJSON（每行 {"text": "..."}），按段落分块清理并逐块返回
+
+    NDJSON 格式错误时：在第一段文本之前返回 400；响应已经开始后，输出已清理的部分，
+    再另起一行写入 {"detail": "..."} 并结束
+    """
+    parsed_options = parse_options(options)
+    ndjson = request.headers.get("content-type", "").startswith("application/x-ndjson")
+    stream_cleaner = StreamCleaner(cleaner, options=parsed_options, language=language)
+    texts = iter_request_text(request.stream(), ndjson=ndjson)
+    # 先读出第一段：第一行就有错误时还能返回 400
+    try:
+        first = await texts.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=ndjson_error(e))
+    
+    async def generate():
+        text, error = first, None
+        while text is not None:
+            output = await run_in_threadpool(stream_cleaner.feed, text)
+            if output:
+                yield output
+            try:
+                text = await texts.__anext__()
+            except StopAsyncIteration:
+                text = None
+            except ValueError as e:
+                text, error = None, e
+        output = await run_in_threadpool(stream_cleaner.finish)
+        if error is not None:
+            # 响应已经开始，只能在输出末尾另起一行报告错误
+            output += "\n" + json.dumps({"detail": ndjson_error(error)}, ensure_ascii=False) + "\n"
+        if output:
+            yield output
+    
+    return BodyStreamingResponse(generate(), media_type="text/plain")
+
+def ndjson_error(e: ValueError) -> str:
+    """NDJSON 请求体错误的说明"""
+    return f"NDJSON 格式错误: {e}" if isinstance(e, json.JSONDecodeError) else str(e)
+
+def parse_options(options: Optional[str]) -> Optional[Dict[str, bool]]:
+    """解析查询参数中 JSON 格式的 options"""
+    try:
+        parsed = json.loads(options) if options else None
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="options 必须是 JSON 对象")
+    if parsed is not None and not isinstance(parsed, dict):
+        raise HTTPException(status_code=400, detail="options 必须是 JSON 对象")
+    return parsed
+
+@app.post("/api/jobs", status_code=202)
+async def create_job(request: Request, language: Optional[str] = None, options: Optional[str] = None,
+                     response_mode: str = "cleaned"):
+    """提交大批量清理任务：请求体为 NDJSON，每行是字符串或 {"text": "...", "id": ...}，可以直接上传文件"""
+    parsed_options = parse_options(options)
+    if response_mode not in RESPONSE_MODES:
+        raise HTTPException(status_code=400, detail=f"response_mode 必须是 {', '.join(RESPONSE_MODES)} 之一")
+    
+    job_id = await run_in_threadpool(job_store.create, parsed_options, language, response_mode)
+    total = 0
+    pending = []
+    try:
+        async for record in iter_ndjson_records(request.stream()):
+            if isinstance(record, str):
+                pending.append((None, record))
+            elif isinstance(record, dict) and isinstance(record.get('text'), str):
+                pending.append((record.get('id'), record['text']))
+            else:
+                raise ValueError(f"第 {total + len(pending) + 1} 行必须是字符串或包含 text 字段的对象")
+            if total + len(pending) > CLEAN_JOBS_MAX_ITEMS:
+                raise ValueError(f"单个任务最多支持 {CLEAN_JOBS_MAX_ITEMS} 个文本")
+            if len(pending) >= 1000:
+                await run_in_threadpool(job_store.add_items, job_id, total, pending)
+                total += len(pending)
+                pending = []
+        if pending:
+            await run_in_threadpool(job_store.add_items, job_id, total, pending)
+            total += len(pending)
+        if not total:
+            raise ValueError("任务中没有文本")
+    except ValueError as e:
+        detail = ndjson_error(e)
+        await run_in_threadpool(job_store.set_status, job_id, "failed", detail)
+        raise HTTPException(status_code=400, detail=detail)
+    except BaseException:
+        await run_in_threadpool(job_store.set_status, job_id, "failed", "上传中断")
+        raise
+    
+    await run_in_threadpool(job_store.set_status, job_id, "queued")
+    job_runner.notify()
+    return await run_in_threadpool(job_store.get, job_id)
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """任务状态和进度"""
+    try:
+        return await run_in_threadpool(job_store.get, job_id)
+    except JobNotFoundError:
+        raise HTTPException(status_code=404, detail="任务不存在")
+
+@app.get("/api/jobs/{job_id}/results")
+async def get_job_results(job_id: str, offset: int = 0, limit: int = 100, format: str = "json"):
+    """按输入顺序读取已完成的结果
+
+    json 为分页：用 next_offset 取下一页，任务结束且没有更多结果时 next_offset 为 null；
+    ndjson 从 offset 开始流式输出当前已完成的全部结果
+    """
+    try:
+        job = await run_in_threadpool(job_store.get, job_id)
+    except JobNotFoundError:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if offset < 0 or not 1 <= limit <= 1000:
+        raise HTTPException(status_code=400, detail="offset 不能为负，limit 必须在 1 到 1000 之间")
+    
+    if format == "ndjson":
+        async def generate():
+            position = offset
+            while True:
+                records = await run_in_threadpool(job_store.results, job_id, position, 1000)
+                if not records:
+                    break
+                yield b"".join(json_dumps(record) + b"\n" for record in records)
+                position = records[-1]['index'] + 1
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+    if format != "json":
+        raise HTTPException(status_code=400, detail="format 必须是 json 或 ndjson")
+    
+    records = await run_in_threadpool(job_store.results, job_id, offset, limit)
+    next_offset = records[-1]['index'] + 1 if records else offset
+    if len(records) < limit and job['status'] in ("completed", "failed", "cancelled"):
+        next_offset = None
+    return FastJSONResponse({"job_id": job_id, "offset": offset, "next_offset": next_offset, "results": records})
+
+@app.delete("/api/jobs/{job_id}")
+async def delete_job(job_id: str):
+    """取消并删除任务及其结果"""
+    try:
+        await run_in_threadpool(job_store.get, job_id)
+    except JobNotFoundError:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    await run_in_threadpool(job_store.delete, job_id)
+    return {"job_id": job_id, "deleted": True}
+
+def document_response(document_id: str, document: IncrementalDocument) -> Dict:
+    """文档的完整清理结果"""
+    return {
+        "document_id": document_id,
+        "version": document.version,
+        "detected_language": document.language,
+        "cleaned_text": document.cleaned_text,
+        "changes_made": document.changes_made,
+        "stats": document.stats,
+    }
+
+def get_document(document_id: str) -> IncrementalDocument:
+    try:
+        return document_store.get(document_id)
+    except DocumentNotFoundError:
+        raise HTTPException(status_code=404, detail="文档不存在或已过期")
+
+@app.post("/api/documents", status_code=201)
+async def create_document(request: DocumentCreateRequest):
+    """创建增量清理的文档，返回 document_id 和整篇清理结果"""
+    try:
+        document = await run_in_threadpool(
+            IncrementalDocument, cleaner, request.text, request.options, request.language
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    document_id = document_store.add(document)
+    return FastJSONResponse(document_response(document_id, document), status_code=201)
+
+@app.patch("/api/documents/{document_id}")
+async def edit_document(document_id: str, request: DocumentEditRequest):
+    """把原文 [start, end)（字符下标）替换为 text，只重新清理受影响的段落
+
+    version 为上次返回的版本号时，文档已被其他请求修改则返回 409；
+    response_mode 为 diff 时返回清理结果的编辑脚本 edits（位置是编辑前清理结果的字符下标），
+    为 cleaned 时返回完整的 cleaned_text
+    """
+    document = get_document(document_id)
+
+    def apply():
+        with document.lock:
+            if request.version is not None and request.version != document.version:
+                raise VersionConflictError(document.version)
+            edits = document.edit(request.start, request.end, request.text)
+            result = {
+                "document_id": document_id,
+                "version": document.version,
+                "changes_made": document.changes_made,
+                "stats": document.stats,
+            }
+            if request.response_mode == 'diff':
+                result["edits"] = edits
+            else:
+                result["cleaned_text"] = document.cleaned_text
+            return result
+
+    try:
+        return FastJSONResponse(await run_in_threadpool(apply))
+    except VersionConflictError as e:
+        raise HTTPException(status_code=409, detail=f"文档已更新到版本 {e.version}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/documents/{document_id}")
+async def read_document(document_id: str):
+    """文档当前的清理结果"""
+    document = get_document(document_id)
+
+    def read():
+        with document.lock:
+            return document_response(document_id, document)
+
+    return FastJSONResponse(await run_in_threadpool(read))
+
+@app.delete("/api/documents/{document_id}")
+async def delete_document(document_id: str):
+    """删除文档"""
+    try:
+        document_store.delete(document_id)
+    except DocumentNotFoundError:
+        raise HTTPException(status_code=404, detail="文档不存在或已过期")
+    return {"document_id": document_id, "deleted": True}
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """清理结果缓存的命中、未命中和淘汰计数"""
+    if result_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **result_cache.stats()}
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Prometheus 文本格式的指标"""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/api/languages")
 async def get_supported_languages():
     """获取支持的语言列表"""
-    return {
-        "supported_languages": {
-            "en": "English",
-            "zh": "Chinese",
-            "de": "German", 
-            "fr": "French",
-            "es": "Spanish",
-            "ru": "Russian",
-            "ja": "Japanese",
-            "ko": "Korean",
-            "th": "Thai",
-            "ar": "Arabic",
-            "he": "Hebrew"
-        }
-    }
+    return {"supported_languages": cleaner.language_packs.names()}
 
 @app.get("/api/health")
 async def health_check():
     """健康检查"""
     return {"status": "healthy", "version": "1.0.0"}
 
+# preload 模式：放在模块最后，冻结导入期间创建的全部对象，避免 GC 扫描时写入共享的内存页
+if CLEAN_LANGDETECT_LOAD == 'preload':
+    warm_up_language_detection()
+    gc.freeze()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+批量引擎与逐条清理的吞吐对比（推文大小的短文本）
+
+把合成语料（见 corpus.py）的段落截成不超过 --max-chars 个字符的短文本，分别：
+- 逐条调用 clean_text
+- 调用 batch_cleaner.clean_batch 一次清理全部文本
+
+报告每千条的耗时和加速比。不给 --language 时两边都检测语言，批量引擎按组检测，
+同时报告与逐条检测结果一致的比例；--verify 在给定语言时检查两边的 cleaned_text、
+changes_made 和 stats 完全一致。
+
+用法:
+    python benchmarks/bench_batch.py
+    python benchmarks/bench_batch.py --languages en,zh,de --count 20000 --verify
+    python benchmarks/bench_batch.py --detect
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import cleaner  # noqa: E402
+from batch_cleaner import clean_batch  # noqa: E402
+from corpus import generate  # noqa: E402
+
+
+def short_texts(language: str, count: int, max_chars: int, seed: int = 0) -> List[str]:
+    """count 条不超过 max_chars 个字符的非空白文本"""
+    texts: List[str] = []
+    size = count * max_chars
+    while len(texts) < count:
+        for paragraph in generate(language, size, seed=seed).split('\n\n'):
+            text = paragraph[:max_chars]
+            if text.strip():
+                texts.append(text)
+        seed += 1
+    return texts[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量引擎与逐条清理的吞吐对比")
+    parser.add_argument('--languages', default='en,zh')
+    parser.add_argument('--count', type=int, default=5000)
+    parser.add_argument('--max-chars', type=int, default=280)
+    parser.add_argument('--detect', action='store_true', help="不指定语言，两边都检测语言")
+    parser.add_argument('--verify', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'language':>9}{'per-item(ms/1k)':>17}{'batch(ms/1k)':>14}{'speedup':>9}")
+    for language in args.languages.split(','):
+        texts = short_texts(language, args.count, args.max_chars, args.seed)
+        given = None if args.detect else language
+
+        start = time.perf_counter()
+        expected = [cleaner.clean_text(text, language=given) for text in texts]
+        per_item = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = clean_batch(cleaner, texts, language=given)
+        batch = time.perf_counter() - start
+
+        scale = 1000 / len(texts) * 1000
+        print(f"{language:>9}{per_item * scale:>17.1f}{batch * scale:>14.1f}{per_item / batch:>8.1f}x")
+        if args.detect:
+            agreed = sum(a.detected_language == b.detected_language for a, b in zip(expected, results))
+            print(f"{'':>9}检测语言与逐条检测一致: {agreed} / {len(texts)}")
+        elif args.verify:
+            mismatches = sum(
+                (a.cleaned_text, a.changes_made, a.stats) != (b.cleaned_text, b.changes_made, b.stats)
+                for a, b in zip(expected, results)
+            )
+            print(f"{'':>9}与逐条清理不一致: {mismatches} / {len(texts)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+clean_text 单文档延迟微基准
+
+用法:
+    python benchmarks/bench_clean_text.py
+    git show HEAD~1:app.py > /tmp/app_before.py
+    python benchmarks/bench_clean_text.py --baseline /tmp/app_before.py
+"""
+
+import argparse
+import importlib.util
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 典型输入：AI输出、网页复制、PDF复制
+SAMPLES = {
+    'short': "Hello  world ,this is a   short comment from a user.\n",
+    'ai_markdown': (
+        "[Assistant] Here's the summary you asked for:\n"
+        "## Overview\n"
+        "**Note:** this is generated text.\n"
+        "- The *quick* brown fox jumps over the __lazy__ dog.\n"
+        "- See [the docs](https://example.com) for `details`.\n"
+        "```python\nprint('hello')\n```\n"
+    ) * 20,
+    'html_page': (
+        "<div class=\"post\"><p>Caf&eacute; opening hours &amp; prices</p>"
+        "<!-- tracking --><span>Open   daily,  9am - 5pm .</span></div>\n"
+        "â€œQuoted textâ€ with mojibake Â and spaces   here.\n"
+    ) * 30,
+    'pdf_copy': (
+        "The experi-\nment was repeated three times under controlled\n"
+        "conditions. Results were consis-\ntent with the hypothesis\n"
+        "and the data was analysed\nusing standard methods.\n\n\n"
+        "The experi-\nment was repeated three times under controlled\n"
+    ) * 25,
+    'chinese': (
+        "这是一个测试文本，包含中文标点符号。\n它的换行\n需要修复！"
+        "（括号）【方括号】《书名号》、顿号？\n\n\n"
+    ) * 30,
+}
+
+
+def load_module(path: str, name: str):
+    """从文件路径加载 app 模块"""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def bench(cleaner, text: str, language: str, repeat: int) -> list:
+    """返回每次调用的耗时（毫秒）"""
+    cleaner.clean_text(text, language=language)  # 预热
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cleaner.clean_text(text, language=language)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="clean_text 单文档延迟微基准")
+    parser.add_argument('--baseline', help="用于对比的旧版 app.py 路径")
+    parser.add_argument('--repeat', type=int, default=200, help="每个样本的重复次数")
+    args = parser.parse_args()
+
+    targets = []
+    if args.baseline:
+        targets.append(('before', load_module(args.baseline, 'app_baseline').cleaner))
+    targets.append(('after', load_module(os.path.join(ROOT, 'app.py'), 'app_current').cleaner))
+
+    print(f"{'sample':<14}{'size':>8}  " + ''.join(f"{label + ' p50 ms':>16}{label + ' mean ms':>17}" for label, _ in targets))
+    for name, text in SAMPLES.items():
+        language = 'zh' if name == 'chinese' else 'en'
+        row = f"{name:<14}{len(text):>8}  "
+        for _, cleaner in targets:
+            timings = bench(cleaner, text, language, args.repeat)
+            row += f"{statistics.median(timings):>16.3f}{statistics.mean(timings):>17.3f}"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+响应压缩的传输字节数和 CPU 耗时
+
+用合成语料（见 corpus.py）的短文本生成 /api/clean/batch 的响应 JSON（response_mode 为
+full、cleaned、diff），按 CompressionMiddleware 的方式（compression.Compressor，按 256KB
+分片输入）用各编码、各压缩级别压缩，报告：
+- 压缩后的字节数和压缩率
+- 每 MB 原始响应的压缩 CPU 时间（process_time，与线程无关）和客户端解压的 CPU 时间
+
+没有安装 zstandard 时只测 gzip。
+
+用法:
+    python benchmarks/bench_compression.py
+    python benchmarks/bench_compression.py --languages en,zh --count 500 --gzip-levels 1,6,9 --zstd-levels 1,3,9,19
+"""
+
+import argparse
+import gzip
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import cleaner  # noqa: E402
+from compression import _SLICE, ENCODINGS, Compressor  # noqa: E402
+from corpus import generate  # noqa: E402
+from response_encoding import RESPONSE_MODES, json_dumps, shape_result  # noqa: E402
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def batch_payload(language: str, count: int, chars: int, mode: str) -> bytes:
+    """count 条文本的批量清理响应体"""
+    texts = [generate(language, chars, seed=seed) for seed in range(count)]
+    results = [cleaner.clean_text(text) for text in texts]
+    return json_dumps({'results': [shape_result(result, mode) for result in results],
+                       'summary': {'total_texts': count}})
+
+
+def compress(encoding: str, level: int, body: bytes) -> bytes:
+    compressor = Compressor(encoding, level)
+    parts = [compressor.compress(body[start:start + _SLICE]) for start in range(0, len(body), _SLICE)]
+    parts.append(compressor.finish())
+    return b''.join(parts)
+
+
+def decompress(encoding: str, data: bytes) -> bytes:
+    if encoding == 'zstd':
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return gzip.decompress(data)
+
+
+def cpu_seconds(func, repeat_count: int):
+    best = None
+    result = None
+    for _ in range(repeat_count):
+        start = time.process_time()
+        result = func()
+        seconds = time.process_time() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="响应压缩的传输字节数和 CPU 耗时")
+    parser.add_argument('--languages', default='en,zh')
+    parser.add_argument('--modes', default=','.join(RESPONSE_MODES))
+    parser.add_argument('--count', type=int, default=200, help="每个响应的文本条数")
+    parser.add_argument('--chars', type=int, default=10000, help="每条文本的字符数")
+    parser.add_argument('--gzip-levels', default='1,6,9')
+    parser.add_argument('--zstd-levels', default='1,3,9')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    levels = {'gzip': args.gzip_levels, 'zstd': args.zstd_levels}
+    print(f"{'language':<9}{'mode':<9}{'encoding':<10}{'size(KB)':>10}{'ratio':>8}"
+          f"{'compress(ms/MB)':>17}{'decompress(ms/MB)':>19}")
+    for language in args.languages.split(','):
+        for mode in args.modes.split(','):
+            body = batch_payload(language, args.count, args.chars, mode)
+            megabytes = len(body) / (1024 * 1024)
+            print(f"{language:<9}{mode:<9}{'identity':<10}{len(body) / 1024:>10.0f}{1:>8.2f}")
+            for encoding in ENCODINGS[::-1]:
+                for level in (int(value) for value in levels[encoding].split(',') if value):
+                    seconds, data = cpu_seconds(lambda: compress(encoding, level, body), args.repeat)
+                    decode_seconds, decoded = cpu_seconds(lambda: decompress(encoding, data), args.repeat)
+                    assert decoded == body
+                    print(f"{language:<9}{mode:<9}{f'{encoding}-{level}':<10}{len(data) / 1024:>10.0f}"
+                          f"{len(body) / len(data):>8.2f}{seconds * 1000 / megabytes:>17.1f}"
+                          f"{decode_seconds * 1000 / megabytes:>19.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+重复行删除的内存和耗时
+
+生成类似日志的文本（大量重复行，以及只差空白、标点或一个词的变体），对每种去重模式报告：
+- 不同行数、集合估算内存（nbytes）和 tracemalloc 峰值，按每百万行折算
+- 去重耗时
+- 与 exact 模式结果不同的行数（bloom 的误判、near 额外删除的近似重复行）
+
+用法:
+    python benchmarks/bench_dedup.py
+    python benchmarks/bench_dedup.py --lines 1000000 --modes exact,hashed,bloom
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from line_dedup import DEDUP_MODES, make_line_set, remove_duplicate_lines  # noqa: E402
+
+_LEVELS = ('INFO', 'WARN', 'ERROR', 'DEBUG')
+_WORDS = ("request handler worker cache miss hit timeout retry connection closed opened user session "
+          "token expired upstream latency queue depth shard replica commit rollback index").split()
+
+
+def generate_lines(count: int, seed: int = 0):
+    """约 30% 的行是之前某行的原样重复，10% 是只差空白、标点或一个词的变体"""
+    rng = random.Random(seed)
+    lines = []
+    for number in range(count):
+        roll = rng.random()
+        if lines and roll < 0.3:
+            lines.append(rng.choice(lines))
+        elif lines and roll < 0.4:
+            words = rng.choice(lines).split(' ')
+            if rng.random() < 0.5:
+                words[rng.randrange(len(words))] = rng.choice(_WORDS)
+                lines.append(' '.join(words))
+            else:
+                lines.append('  '.join(words).rstrip('.') + ' .')
+        else:
+            words = ' '.join(rng.choice(_WORDS) for _ in range(rng.randint(6, 14)))
+            lines.append(f"{rng.choice(_LEVELS)} id={number} {words} shard={rng.randrange(64)} "
+                         f"latency={rng.randrange(2000)}ms.")
+    return lines
+
+
+def run(mode: str, text: str, error_rate: float):
+    """去重结果、集合和耗时"""
+    seen = make_line_set(mode, error_rate)
+    start = time.perf_counter()
+    output = remove_duplicate_lines(text, seen)
+    return output, seen, time.perf_counter() - start
+
+
+def traced_peak(mode: str, lines, error_rate: float) -> int:
+    """只向集合中加入各行时 tracemalloc 记录的内存峰值（字节）"""
+    tracemalloc.start()
+    seen = make_line_set(mode, error_rate)
+    for line in lines:
+        seen.add(line)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="重复行删除的内存和耗时")
+    parser.add_argument('--lines', type=int, default=200000)
+    parser.add_argument('--modes', default=','.join(DEDUP_MODES))
+    parser.add_argument('--error-rate', type=float, default=0.001)
+    parser.add_argument('--no-trace', action='store_true', help="不用 tracemalloc 统计峰值（near 模式下较慢）")
+    args = parser.parse_args()
+
+    lines = generate_lines(args.lines)
+    text = '\n'.join(lines)
+    print(f"lines: {args.lines}  chars: {len(text)}")
+    print(f"{'mode':<8}{'distinct':>10}{'MB/1M(set)':>12}{'MB/1M(peak)':>13}{'seconds':>10}{'diff':>8}")
+    reference = None
+    for mode in args.modes.split(','):
+        output, seen, seconds = run(mode, text, args.error_rate)
+        kept = output.split('\n')
+        if reference is None and mode == 'exact':
+            reference = kept
+        # 与 exact 相比多删除的行数（结果总是 exact 结果的子序列）
+        diff = len(reference) - len(kept) if reference is not None else '-'
+        scale = 1_000_000 / max(1, len(seen)) / (1024 * 1024)
+        peak = f"{'-':>13}" if args.no_trace else f"{traced_peak(mode, lines, args.error_rate) * scale:>13.1f}"
+        print(f"{mode:<8}{len(seen):>10}{seen.nbytes * scale:>12.1f}{peak}{seconds:>10.2f}{diff:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+增量清理的单次编辑耗时
+
+对每个大小的合成语料（见 corpus.py）创建 IncrementalDocument，在随机位置做小的编辑
+（插入或删除几个字符、插入一个段落），报告每次编辑的 p50/p99 耗时，
+并与整篇重新清理（clean_text）的耗时对比；编辑耗时应基本不随文档大小增长。
+
+--verify 在每次编辑后与整篇清理的结果比较 cleaned_text，并检查用 corpus.SEAM_CASES 创建的文档
+（语料默认也混入这些段落，见 corpus.py 的 seams）。
+
+用法:
+    python benchmarks/bench_incremental.py
+    python benchmarks/bench_incremental.py --language zh --sizes 16k,256k,2m --edits 200 --verify
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import cleaner  # noqa: E402
+from corpus import SEAM_CASES, generate, parse_size  # noqa: E402
+from incremental_cleaner import IncrementalDocument  # noqa: E402
+from bench_pipeline import percentile  # noqa: E402
+
+
+def random_edit(rng: random.Random, document: IncrementalDocument, sample: str):
+    """(起点, 终点, 替换文本)：删除几个字符、插入一个词或插入一段"""
+    start = rng.randrange(document.length + 1)
+    roll = rng.random()
+    if roll < 0.4:
+        return start, min(document.length, start + rng.randint(1, 5)), ''
+    offset = rng.randrange(max(1, len(sample) - 200))
+    if roll < 0.8:
+        return start, start, sample[offset:offset + rng.randint(1, 8)]
+    return start, start, '\n\n' + sample[offset:offset + 200] + '\n\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="增量清理的单次编辑耗时")
+    parser.add_argument('--language', default='en')
+    parser.add_argument('--sizes', default='16k,256k,1m')
+    parser.add_argument('--edits', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verify', action='store_true')
+    args = parser.parse_args()
+
+    if args.verify:
+        mismatches = sum(IncrementalDocument(cleaner, text, language='en').cleaned_text
+                         != cleaner.clean_text(text, language='en').cleaned_text for text in SEAM_CASES)
+        print(f"分块边界难例与整篇清理不一致: {mismatches} / {len(SEAM_CASES)}")
+
+    print(f"{'size':>8}{'create(s)':>11}{'edit p50(ms)':>14}{'edit p99(ms)':>14}{'full clean(ms)':>16}")
+    for size_text in args.sizes.split(','):
+        text = generate(args.language, parse_size(size_text), seed=args.seed)
+        rng = random.Random(args.seed)
+        start = time.perf_counter()
+        document = IncrementalDocument(cleaner, text, language=args.language)
+        created = time.perf_counter() - start
+
+        latencies = []
+        mismatches = 0
+        for _ in range(args.edits):
+            edit_start, edit_end, replacement = random_edit(rng, document, text)
+            start = time.perf_counter()
+            document.edit(edit_start, edit_end, replacement)
+            latencies.append(time.perf_counter() - start)
+            if args.verify:
+                expected = cleaner.clean_text(document.text, language=args.language).cleaned_text
+                mismatches += document.cleaned_text != expected
+
+        start = time.perf_counter()
+        cleaner.clean_text(document.text, language=args.language)
+        full = time.perf_counter() - start
+        print(f"{size_text:>8}{created:>11.2f}{percentile(latencies, 0.5) * 1000:>14.2f}"
+              f"{percentile(latencies, 0.99) * 1000:>14.2f}{full * 1000:>16.1f}")
+        if args.verify:
+            print(f"{'':>8}与整篇清理不一致: {mismatches} / {args.edits}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+本地负载测试：启动 uvicorn 运行 app:app，用 N 个并发客户端按流量组合持续请求
+
+流量组合（--mix，名称=权重）由以下场景组成，文本来自合成语料（见 corpus.py）：
+- short: 交互式的短文本 /api/clean（--short-chars 个字符）
+- document: 大文本 /api/clean（--document-size）
+- batch: /api/clean/batch，每批 --batch-items 条、每条 --batch-chars 个字符
+
+每个客户端循环：按权重随机选择场景（--seed 固定时顺序可复现）、发送请求、等待响应后再发下一个
+（闭环负载）。请求体预先编码好，客户端自身的开销只有 HTTP。预热 --warmup 秒后计时 --duration 秒，
+报告每个场景和总体的吞吐（每秒成功的请求数）、p50/p95/p99/最大延迟、错误数（按状态码），
+以及服务进程（uvicorn 主进程、各 worker 和 process 模式的清理进程）的 CPU 时间、平均占用的核数、
+RSS 峰值；也报告负载生成器自身的 CPU 占用，接近一个核时说明瓶颈在客户端。
+
+默认关闭服务端的结果缓存（重复的文本会直接命中缓存），--env 可以覆盖任何环境变量。
+结果保存为 JSON（键按固定顺序、数值取整，便于在提交之间 diff），--compare 读取之前的结果，
+吞吐下降、p95 变慢或错误率上升超过阈值时以非零状态退出。
+
+用法:
+    python benchmarks/bench_load.py --workers 2 --concurrency 16 --duration 30 --output load.json
+    python benchmarks/bench_load.py --mix short=80,document=5,batch=15 --env CLEAN_EXECUTOR=process \\
+        --output after.json --compare load.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import signal
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx  # noqa: E402
+
+from bench_startup import free_port, memory_kb, process_tree  # noqa: E402
+from corpus import LANGUAGES, generate, parse_size  # noqa: E402
+
+SCENARIOS = ('short', 'document', 'batch')
+SCENARIO_PATHS = {'short': '/api/clean', 'document': '/api/clean', 'batch': '/api/clean/batch'}
+# 每个场景预先生成的不同请求体数量
+_POOL_SIZES = {'short': 200, 'document': 3, 'batch': 10}
+_SAMPLE_INTERVAL = 0.5
+_CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """最近秩百分位数（与 bench_pipeline 相同）"""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name not in SCENARIOS:
+            raise SystemExit(f"未知的场景: {name}（可选: {', '.join(SCENARIOS)}）")
+        mix[name] = float(weight or 1)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def build_bodies(args, mix: Dict[str, float]) -> Dict[str, List[bytes]]:
+    """各场景的请求体（预先编码的 JSON），语言在 --languages 中轮换"""
+    languages = args.languages.split(',')
+    bodies: Dict[str, List[bytes]] = {}
+    for name in mix:
+        pool = []
+        for index in range(_POOL_SIZES[name]):
+            language = languages[index % len(languages)]
+            if name == 'short':
+                content = {'text': generate(language, args.short_chars, seed=index)}
+            elif name == 'document':
+                content = {'text': generate(language, parse_size(args.document_size), seed=index)}
+            else:
+                content = {'texts': [generate(language, args.batch_chars, seed=index * args.batch_items + item)
+                                     for item in range(args.batch_items)]}
+            pool.append(json.dumps(content, ensure_ascii=False).encode('utf-8'))
+        bodies[name] = pool
+    return bodies
+
+
+def cpu_seconds(pids: List[int]) -> Dict[int, float]:
+    """各进程已用的 CPU 时间（用户态 + 内核态，秒）"""
+    seconds = {}
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            seconds[pid] = (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+        except (OSError, IndexError, ValueError):
+            continue
+    return seconds
+
+
+class Recorder:
+    """计时窗口内完成的请求：场景 -> [(延迟, 状态码)]，状态码 0 表示连接错误或超时"""
+
+    def __init__(self):
+        self.measuring = False
+        self.samples: Dict[str, List[Tuple[float, int]]] = {}
+
+    def add(self, name: str, seconds: float, status: int) -> None:
+        if self.measuring:
+            self.samples.setdefault(name, []).append((seconds, status))
+
+
+async def client_loop(client: httpx.AsyncClient, base: str, bodies: Dict[str, List[bytes]], mix: Dict[str, float],
+                      rng: random.Random, recorder: Recorder, stop: asyncio.Event) -> None:
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    while not stop.is_set():
+        name = rng.choices(names, weights)[0]
+        body = rng.choice(bodies[name])
+        start = time.perf_counter()
+        try:
+            response = await client.post(base + SCENARIO_PATHS[name], content=body,
+                                         headers={'content-type': 'application/json'})
+            await response.aread()
+            status = response.status_code
+        except httpx.HTTPError:
+            status = 0
+        recorder.add(name, time.perf_counter() - start, status)
+
+
+async def sample_memory(pid: int, recorder: Recorder, stop: asyncio.Event, usage: Dict[str, float]) -> None:
+    """计时窗口内定期采样服务进程树的 RSS 合计和进程数"""
+    while not stop.is_set():
+        if recorder.measuring:
+            pids = process_tree(pid)
+            usage['rss_peak_mb'] = max(usage.get('rss_peak_mb', 0.0), memory_kb(pids)['rss'] / 1024)
+            usage['processes'] = max(usage.get('processes', 0), len(pids))
+        try:
+            await asyncio.wait_for(stop.wait(), _SAMPLE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_load(args, base: str, server_pid: int, bodies: Dict[str, List[bytes]], mix: Dict[str, float]):
+    recorder = Recorder()
+    stop = asyncio.Event()
+    usage: Dict[str, float] = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+        tasks = [asyncio.create_task(client_loop(client, base, bodies, mix, random.Random(args.seed + index),
+                                                 recorder, stop))
+                 for index in range(args.concurrency)]
+        sampler = asyncio.create_task(sample_memory(server_pid, recorder, stop, usage))
+        await asyncio.sleep(args.warmup)
+        recorder.measuring = True
+        server_cpu = cpu_seconds(process_tree(server_pid))
+        client_cpu = time.process_time()
+        started = time.perf_counter()
+        await asyncio.sleep(args.duration)
+        recorder.measuring = False
+        elapsed = time.perf_counter() - started
+        client_cpu = time.process_time() - client_cpu
+        # 计时窗口内新启动的进程从 0 算起，已退出的进程不计
+        usage['cpu_seconds'] = sum(value - server_cpu.get(process, 0.0)
+                                   for process, value in cpu_seconds(process_tree(server_pid)).items())
+        stop.set()
+        # 等正在进行的请求结束，避免关闭服务时产生额外的错误
+        await asyncio.gather(*tasks, sampler)
+    usage['cpu_cores'] = usage.get('cpu_seconds', 0.0) / elapsed
+    usage['client_cpu_cores'] = client_cpu / elapsed
+    return recorder.samples, elapsed, usage
+
+
+def summarize(samples: List[Tuple[float, int]], elapsed: float) -> Dict[str, object]:
+    ok = [seconds for seconds, status in samples if 200 <= status < 300]
+    errors: Dict[str, int] = {}
+    for _, status in samples:
+        if not 200 <= status < 300:
+            errors[str(status)] = errors.get(str(status), 0) + 1
+    latency = [seconds for seconds, _ in samples]
+    return {
+        'requests': len(samples),
+        'ok': len(ok),
+        'errors': dict(sorted(errors.items())),
+        'error_rate': round((len(samples) - len(ok)) / len(samples), 4) if samples else 0.0,
+        'throughput_rps': round(len(ok) / elapsed, 2),
+        'p50_ms': round(percentile(latency, 0.50) * 1000, 1) if latency else None,
+        'p95_ms': round(percentile(latency, 0.95) * 1000, 1) if latency else None,
+        'p99_ms': round(percentile(latency, 0.99) * 1000, 1) if latency else None,
+        'max_ms': round(max(latency) * 1000, 1) if latency else None,
+    }
+
+
+def start_server(args, port: int) -> subprocess.Popen:
+    env = dict(os.environ, CLEAN_CACHE_BYTES='0')
+    for item in args.env:
+        key, _, value = item.partition('=')
+        env[key] = value
+    command = [sys.executable, '-m', 'uvicorn', 'app:app', '--host', '127.0.0.1', '--port', str(port),
+               '--workers', str(args.workers), '--log-level', 'warning']
+    server = subprocess.Popen(command, cwd=ROOT, env=env)
+    deadline = time.monotonic() + args.startup_timeout
+    while True:
+        if server.poll() is not None:
+            raise RuntimeError(f"服务进程退出: {server.returncode}")
+        try:
+            if httpx.get(f'http://127.0.0.1:{port}/api/health', timeout=1).status_code == 200:
+                return server
+        except httpx.HTTPError:
+            pass
+        if time.monotonic() > deadline:
+            stop_server(server)
+            raise RuntimeError("服务启动超时")
+        time.sleep(0.05)
+
+
+def stop_server(server: subprocess.Popen) -> None:
+    server.send_signal(signal.SIGINT)
+    try:
+        server.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def compare(report: dict, baseline_path: str, threshold: float) -> List[str]:
+    """与之前的结果比较吞吐、p95 和错误率，返回超过阈值的回退"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    regressions = []
+    print(f"\n{'scenario':<10}{'rps before':>12}{'rps after':>11}{'p95 before':>12}{'p95 after':>11}"
+          f"{'err before':>12}{'err after':>11}")
+    for name, result in report['results'].items():
+        before = baseline.get(name)
+        if not before or not result['requests']:
+            continue
+        flags = []
+        if before['throughput_rps'] and result['throughput_rps'] < before['throughput_rps'] * (1 - threshold):
+            flags.append(f"吞吐 {result['throughput_rps'] / before['throughput_rps'] - 1:+.1%}")
+        if before['p95_ms'] and result['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            flags.append(f"p95 {result['p95_ms'] / before['p95_ms'] - 1:+.1%}")
+        if result['error_rate'] > before['error_rate'] + 0.01:
+            flags.append(f"错误率 {before['error_rate']:.2%} -> {result['error_rate']:.2%}")
+        print(f"{name:<10}{before['throughput_rps']:>12.1f}{result['throughput_rps']:>11.1f}"
+              f"{before['p95_ms'] or 0:>12.1f}{result['p95_ms'] or 0:>11.1f}"
+              f"{before['error_rate']:>12.2%}{result['error_rate']:>11.2%}" + ('  ' + ', '.join(flags) if flags else ''))
+        regressions.extend(f"{name}: {flag}" for flag in flags)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地负载测试：uvicorn + 按流量组合的并发客户端")
+    parser.add_argument('--workers', type=int, default=1, help="uvicorn worker 进程数")
+    parser.add_argument('--env', action='append', default=[], help="服务进程的环境变量 KEY=VALUE，可重复")
+    parser.add_argument('--concurrency', type=int, default=16, help="并发客户端数")
+    parser.add_argument('--mix', default='short=90,document=2,batch=8', help="场景=权重，逗号分隔")
+    parser.add_argument('--duration', type=float, default=30.0, help="计时秒数")
+    parser.add_argument('--warmup', type=float, default=5.0, help="计时前的预热秒数")
+    parser.add_argument('--languages', default='en,zh,de', help=f"语料语言（可选: {','.join(LANGUAGES)}）")
+    parser.add_argument('--short-chars', type=int, default=300)
+    parser.add_argument('--document-size', default='1m')
+    parser.add_argument('--batch-items', type=int, default=100)
+    parser.add_argument('--batch-chars', type=int, default=500)
+    parser.add_argument('--timeout', type=float, default=120.0, help="单个请求的超时秒数")
+    parser.add_argument('--startup-timeout', type=float, default=60.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="结果 JSON 的保存路径")
+    parser.add_argument('--compare', help="之前保存的结果 JSON，用于对比")
+    parser.add_argument('--threshold', type=float, default=0.10, help="吞吐下降或 p95 变慢多少算回退（默认 10%%）")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    bodies = build_bodies(args, mix)
+    port = free_port()
+    server = start_server(args, port)
+    try:
+        samples, elapsed, usage = asyncio.run(run_load(args, f'http://127.0.0.1:{port}', server.pid, bodies, mix))
+    finally:
+        stop_server(server)
+
+    results = {name: summarize(samples.get(name, []), elapsed) for name in mix}
+    results['total'] = summarize([sample for name in mix for sample in samples.get(name, [])], elapsed)
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'workers': args.workers,
+            'env': sorted(args.env),
+            'concurrency': args.concurrency,
+            'mix': mix,
+            'duration': args.duration,
+            'languages': args.languages,
+            'short_chars': args.short_chars,
+            'document_size': args.document_size,
+            'batch_items': args.batch_items,
+            'batch_chars': args.batch_chars,
+            'seed': args.seed,
+        },
+        'server': {
+            'processes': usage.get('processes', 0),
+            'cpu_seconds': round(usage.get('cpu_seconds', 0.0), 2),
+            'cpu_cores': round(usage['cpu_cores'], 2),
+            'rss_peak_mb': round(usage.get('rss_peak_mb', 0.0), 1),
+            'client_cpu_cores': round(usage['client_cpu_cores'], 2),
+        },
+        'results': results,
+    }
+
+    print(f"{'scenario':<10}{'requests':>10}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}  errors")
+    for name, result in results.items():
+        errors = ', '.join(f"{status}: {count}" for status, count in result['errors'].items()) or '-'
+        print(f"{name:<10}{result['requests']:>10}{result['throughput_rps']:>9.1f}{result['p50_ms'] or 0:>10.1f}"
+              f"{result['p95_ms'] or 0:>10.1f}{result['p99_ms'] or 0:>10.1f}{result['max_ms'] or 0:>10.1f}  {errors}")
+    server_usage = report['server']
+    print(f"\n服务进程 {server_usage['processes']} 个：CPU {server_usage['cpu_seconds']:.1f} 秒"
+          f"（平均 {server_usage['cpu_cores']:.2f} 核），RSS 峰值 {server_usage['rss_peak_mb']:.1f} MB；"
+          f"负载生成器 {server_usage['client_cpu_cores']:.2f} 核")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        print(f"\n结果已保存到 {args.output}")
+
+    if args.compare:
+        regressions = compare(report, args.compare, args.threshold)
+        if regressions:
+            print("\n回退超过阈值:")
+            for regression in regressions:
+                print("  " + regression)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+单个大文本的分块并行清理耗时
+
+对每种语言、每个大小的合成语料（见 corpus.py），比较：
+- serial: clean_text 整篇清理（包含语言检测）
+- workers=N: parallel_cleaner.clean_document，各块交给 N 个进程的进程池（与 process 模式的执行器相同）
+
+报告中位数耗时和相对整篇清理的加速比；加速比受 CPU 核数限制（只有一个核时并行没有收益），
+分块、拼接、行阶段和统计在主进程中执行，是不能并行的部分。
+--verify 比较 cleaned_text、changes_made 和 stats 与整篇清理的结果。
+
+用法:
+    python benchmarks/bench_parallel.py
+    python benchmarks/bench_parallel.py --languages en,zh --sizes 4m,20m --workers 1,2,4,8 --verify
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import AdvancedTextCleaner, cleaner  # noqa: E402
+from clean_executor import (PARALLEL_BLOCKS_PER_WORKER, PARALLEL_MIN_BLOCK, _clean_block_in_worker,  # noqa: E402
+                            _init_worker)
+from corpus import KINDS, generate, parse_size  # noqa: E402
+from parallel_cleaner import clean_document  # noqa: E402
+
+
+def run_parallel(pool: ProcessPoolExecutor, workers: int, text: str):
+    block_size = max(PARALLEL_MIN_BLOCK, len(text) // (workers * PARALLEL_BLOCKS_PER_WORKER))
+
+    def map_blocks(contents, language):
+        return pool.map(_clean_block_in_worker, contents, repeat(None), repeat(language))
+
+    return clean_document(cleaner, text, map_blocks, block_size=block_size)
+
+
+def median_seconds(func, repeat_count: int):
+    timings = []
+    result = None
+    for _ in range(repeat_count):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="单个大文本的分块并行清理耗时")
+    parser.add_argument('--languages', default='en,zh')
+    parser.add_argument('--sizes', default='4m,20m')
+    parser.add_argument('--workers', default=None, help="逗号分隔的进程数（默认 1,2,4,... 直到 CPU 核数）")
+    parser.add_argument('--kinds', default=','.join(KINDS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--verify', action='store_true')
+    args = parser.parse_args()
+
+    if args.workers:
+        worker_counts = [int(value) for value in args.workers.split(',')]
+    else:
+        worker_counts = [1]
+        while worker_counts[-1] * 2 <= (os.cpu_count() or 1):
+            worker_counts.append(worker_counts[-1] * 2)
+    kinds = [kind for kind in args.kinds.split(',') if kind]
+    pools = {}
+    for workers in worker_counts:
+        pools[workers] = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(AdvancedTextCleaner,))
+        # 预热：启动所有进程并完成初始化
+        list(pools[workers].map(abs, range(workers * 4)))
+
+    print(f"CPU 核数: {os.cpu_count()}")
+    print(f"{'language':<10}{'size':>8}  {'mode':<12}{'median(s)':>11}{'speedup':>9}  verify")
+    try:
+        for language in args.languages.split(','):
+            for size_label in args.sizes.split(','):
+                text = generate(language, parse_size(size_label), kinds)
+                serial, expected = median_seconds(lambda: cleaner.clean_text(text), args.repeat)
+                print(f"{language:<10}{size_label:>8}  {'serial':<12}{serial:>11.3f}{1:>9.2f}")
+                for workers in worker_counts:
+                    seconds, result = median_seconds(lambda: run_parallel(pools[workers], workers, text), args.repeat)
+                    verdict = ''
+                    if args.verify:
+                        same = (result.cleaned_text == expected.cleaned_text
+                                and result.changes_made == expected.changes_made and result.stats == expected.stats)
+                        verdict = 'OK' if same else 'MISMATCH'
+                    print(f"{language:<10}{size_label:>8}  {f'workers={workers}':<12}{seconds:>11.3f}"
+                          f"{serial / seconds:>9.2f}  {verdict}")
+    finally:
+        for pool in pools.values():
+            pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+_remove_markdown / _remove_html 的病态输入回归检查
+
+1. 性能：对每种病态输入分别在 n 和 4n 字符上计时，要求耗时近似线性增长
+   （4 倍输入的耗时不超过 --max-ratio 倍）且不超过绝对上限
+2. 正确性：随机生成由标记字符组成的短文本，与原始正则链的输出逐字节比较
+3. 分块边界：corpus.SEAM_CASES 用各种块大小流式清理（StreamCleaner），与 clean_text 的结果比较
+
+任何一项失败时以非零状态退出，可以直接放进 CI。
+
+用法:
+    python benchmarks/bench_pathological.py
+    python benchmarks/bench_pathological.py --size 50000 --fuzz 100000
+"""
+
+import argparse
+import html
+import os
+import random
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import cleaner  # noqa: E402
+from corpus import SEAM_CASES  # noqa: E402
+from stream_cleaner import StreamCleaner  # noqa: E402
+
+# 未闭合或不配对的标记：原来的正则在这些输入上会退化成 O(n²)
+PATHOLOGICAL = {
+    'unclosed_tags': '<',
+    'unclosed_tag_words': '<a ',
+    'unclosed_comments': '<!--',
+    'empty_tags': '<>',
+    'open_brackets': '[',
+    'brackets_without_url': '[a]',
+    'open_images': '![',
+    'unclosed_urls': '[a](',
+    'backticks': '`',
+    'fences': '```a',
+    'asterisks': '*',
+    'bold_markers': '**a',
+    'underscores': '_a',
+    'blank_lines': '\n',
+    'whitespace_lines': ' \t\n',
+    'quote_like_lines': '\n \n>',
+    'number_like_lines': '\n\n1',
+    'bullet_like_lines': '\n \n-',
+    'dash_runs': '-' * 50 + 'x\n',
+}
+
+STAGES = ('_remove_markdown', '_remove_html')
+
+# 原始实现（逐条正则），作为正确性参照
+_REFERENCE_MARKDOWN = [
+    (re.compile(r'```[\s\S]*?```'), ''),
+    (re.compile(r'`[^`]*`'), ''),
+    (re.compile(r'^#{1,6}\s*', re.MULTILINE), ''),
+    (re.compile(r'\[([^\]]*)\]\([^\)]*\)'), r'\1'),
+    (re.compile(r'!\[([^\]]*)\]\([^\)]*\)'), ''),
+    (re.compile(r'\*\*([^*]*)\*\*'), r'\1'),
+    (re.compile(r'\*([^*]*)\*'), r'\1'),
+    (re.compile(r'__([^_]*)__'), r'\1'),
+    (re.compile(r'_([^_]*)_'), r'\1'),
+    (re.compile(r'^\s*[-*+]\s+', re.MULTILINE), ''),
+    (re.compile(r'^\s*\d+\.\s+', re.MULTILINE), ''),
+    (re.compile(r'^\s*>\s*', re.MULTILINE), ''),
+    (re.compile(r'^-{3,}$', re.MULTILINE), ''),
+    (re.compile(r'^\*{3,}$', re.MULTILINE), ''),
+]
+_REFERENCE_HTML = [
+    (re.compile(r'<[^>]+>'), ''),
+    (re.compile(r'<!--.*?-->', re.DOTALL), ''),
+]
+
+FUZZ_ALPHABET = list("<>!-[]()*_`#+.1a \n\t") + ['<!--', '-->', '```', '](', '![', '\n\n', '  \n', '\n- ', '\n1. ', '\n> ']
+
+
+def reference(stage: str, text: str) -> str:
+    """用原始正则链清理"""
+    if stage == '_remove_html':
+        text = html.unescape(text)
+        rules = _REFERENCE_HTML
+    else:
+        rules = _REFERENCE_MARKDOWN
+    for pattern, replacement in rules:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def timed(func, text: str) -> float:
+    """取三次运行的最短耗时（秒）"""
+    best = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        func(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def check_performance(size: int, max_ratio: float, max_seconds: float) -> list:
+    failures = []
+    print(f"{'input':<22}{'stage':<18}{'n ms':>10}{'4n ms':>10}{'ratio':>8}")
+    for name, unit in PATHOLOGICAL.items():
+        small = unit * (size // len(unit))
+        large = unit * (4 * size // len(unit))
+        for stage in STAGES:
+            func = getattr(cleaner, stage)
+            small_time = timed(func, small)
+            large_time = timed(func, large)
+            # 太快的测量噪声很大，给 1ms 的下限
+            ratio = large_time / max(small_time, 1e-3)
+            status = ''
+            if ratio > max_ratio or large_time > max_seconds:
+                status = '  FAIL'
+                failures.append(f"{name} / {stage}: {small_time * 1000:.1f}ms -> {large_time * 1000:.1f}ms")
+            print(f"{name:<22}{stage:<18}{small_time * 1000:>10.2f}{large_time * 1000:>10.2f}{ratio:>8.1f}{status}")
+    return failures
+
+
+def check_equivalence(count: int, seed: int) -> list:
+    failures = []
+    rng = random.Random(seed)
+    for _ in range(count):
+        text = ''.join(rng.choice(FUZZ_ALPHABET) for _ in range(rng.randint(0, 40)))
+        for stage in STAGES:
+            if getattr(cleaner, stage)(text) != reference(stage, text):
+                failures.append(f"{stage}: {text!r}")
+                if len(failures) >= 10:
+                    return failures
+    return failures
+
+
+def check_seams() -> list:
+    failures = []
+    for text in SEAM_CASES:
+        expected = cleaner.clean_text(text, language='en').cleaned_text
+        for block_size in range(1, len(text) + 1):
+            stream = StreamCleaner(cleaner, language='en', block_size=block_size)
+            if stream.feed(text) + stream.finish() != expected:
+                failures.append(f"stream (block_size={block_size}): {text!r}")
+                break
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Markdown/HTML 清理的病态输入回归检查")
+    parser.add_argument('--size', type=int, default=20000, help="小输入的字符数（大输入为 4 倍）")
+    parser.add_argument('--max-ratio', type=float, default=8.0, help="4 倍输入允许的最大耗时倍数")
+    parser.add_argument('--max-seconds', type=float, default=0.5, help="大输入允许的最长耗时（秒）")
+    parser.add_argument('--fuzz', type=int, default=20000, help="随机对比的样本数")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    failures = check_performance(args.size, args.max_ratio, args.max_seconds)
+    failures += check_equivalence(args.fuzz, args.seed)
+    failures += check_seams()
+    print(f"\nfuzz: {args.fuzz} samples x {len(STAGES)} stages, seams: {len(SEAM_CASES)} cases")
+    if failures:
+        print("\nFAILED:")
+        for failure in failures:
+            print("  " + failure)
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+清理流水线吞吐基准
+
+对每种语言、每个大小的合成语料（见 corpus.py）：
+- 按阶段计划逐个计时 AdvancedTextCleaner 的每个私有阶段（输入是上一阶段的真实输出）
+- 计时 clean_text 端到端（包含语言检测）
+- 可选：用进程内 ASGI 测试客户端请求 /api/clean，得到 HTTP 层的额外开销
+
+报告每个阶段的 p50/p99 延迟和按 UTF-8 字节计的 MB/s，结果保存为 JSON，
+--compare 读取之前的结果文件，延迟变慢超过阈值时以非零状态退出。
+
+用法:
+    python benchmarks/bench_pipeline.py --sizes 1k,64k,1m --output before.json
+    python benchmarks/bench_pipeline.py --sizes 1k,64k,1m --output after.json --compare before.json
+    python benchmarks/bench_pipeline.py --languages en,zh --sizes 10m --repeat 3 --api
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: E402
+from corpus import KINDS, LANGUAGES, generate, parse_size  # noqa: E402
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """最近秩百分位数"""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(timings: List[float], size_bytes: int) -> Dict[str, float]:
+    p50 = percentile(timings, 0.50)
+    return {
+        'p50_ms': round(p50 * 1000, 4),
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 4),
+        'mb_per_s': round(size_bytes / 1e6 / p50, 3) if p50 > 0 else None,
+        'runs': len(timings),
+    }
+
+
+def measure(func: Callable[[], object], repeat: int, budget: float) -> List[float]:
+    """重复计时，总耗时超过预算后提前结束（至少运行 3 次）"""
+    timings = []
+    started = time.perf_counter()
+    for run in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+        if run >= 2 and time.perf_counter() - started > budget:
+            break
+    return timings
+
+
+def bench_stages(text: str, language: str, repeat: int, budget: float) -> Dict[str, List[float]]:
+    """按默认阶段计划逐个计时；每个阶段的输入是前一阶段的输出"""
+    timings: Dict[str, List[float]] = {}
+    current = text
+    for name, stage, _ in app.cleaner.get_plan(None, language):
+        stage_input = current
+        timings[name] = measure(lambda: stage(stage_input), repeat, budget)
+        current = stage(stage_input)
+    return timings
+
+
+def bench_api(text: str, repeat: int, budget: float) -> List[float]:
+    """用进程内测试客户端请求 /api/clean"""
+    from fastapi.testclient import TestClient  # 需要 httpx
+
+    with TestClient(app.app) as client:
+        def request():
+            response = client.post('/api/clean', json={'text': text})
+            response.raise_for_status()
+        return measure(request, repeat, budget)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(results: List[dict], baseline_path: str, threshold: float) -> List[str]:
+    """与之前的结果比较 p50，返回变慢超过阈值的条目"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(r['language'], r['size'], r['stage']): r for r in json.load(f)['results']}
+    regressions = []
+    print(f"\n{'language':<10}{'size':>10}  {'stage':<24}{'before ms':>12}{'after ms':>12}{'change':>9}")
+    for result in results:
+        before = baseline.get((result['language'], result['size'], result['stage']))
+        if not before or not before['p50_ms']:
+            continue
+        change = result['p50_ms'] / before['p50_ms'] - 1
+        flag = ''
+        if change > threshold:
+            flag = '  SLOWER'
+            regressions.append(f"{result['language']} {result['size']} {result['stage']}: {change:+.1%}")
+        print(f"{result['language']:<10}{result['size']:>10}  {result['stage']:<24}"
+              f"{before['p50_ms']:>12.3f}{result['p50_ms']:>12.3f}{change:>+9.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="清理流水线吞吐基准")
+    parser.add_argument('--languages', default=','.join(LANGUAGES), help="逗号分隔的语言代码")
+    parser.add_argument('--sizes', default='1k,64k,1m', help="逗号分隔的大小，支持 k/m 后缀，最大建议 10m")
+    parser.add_argument('--kinds', default=','.join(KINDS), help="语料中混入的噪声类型")
+    parser.add_argument('--repeat', type=int, default=20, help="每项最多重复次数")
+    parser.add_argument('--budget', type=float, default=2.0, help="每项计时的时间预算（秒）")
+    parser.add_argument('--api', action='store_true', help="同时测量 /api/clean 的 HTTP 开销（需要 httpx）")
+    parser.add_argument('--output', help="结果 JSON 的保存路径")
+    parser.add_argument('--compare', help="之前保存的结果 JSON，用于对比")
+    parser.add_argument('--threshold', type=float, default=0.10, help="p50 变慢多少算回退（默认 10%%）")
+    args = parser.parse_args()
+
+    languages = [language for language in args.languages.split(',') if language]
+    sizes = [parse_size(size) for size in args.sizes.split(',') if size]
+    kinds = [kind for kind in args.kinds.split(',') if kind]
+
+    # 结果缓存会让重复请求直接命中，基准中关闭
+    app.executor.cache = None
+
+    results = []
+    print(f"{'language':<10}{'size':>10}  {'stage':<24}{'p50 ms':>10}{'p99 ms':>10}{'MB/s':>10}")
+    for language in languages:
+        for size in sizes:
+            text = generate(language, size, kinds)
+            size_bytes = len(text.encode('utf-8'))
+            timings = bench_stages(text, language, args.repeat, args.budget)
+            timings['clean_text'] = measure(lambda: app.cleaner.clean_text(text), args.repeat, args.budget)
+            if args.api:
+                timings['api_clean'] = bench_api(text, args.repeat, args.budget)
+            for stage, stage_timings in timings.items():
+                result = {'language': language, 'size': size, 'bytes': size_bytes, 'stage': stage,
+                          **summarize(stage_timings, size_bytes)}
+                results.append(result)
+                print(f"{language:<10}{size:>10}  {stage:<24}{result['p50_ms']:>10.3f}"
+                      f"{result['p99_ms']:>10.3f}{result['mb_per_s'] or 0:>10.2f}")
+            if args.api:
+                overhead = percentile(timings['api_clean'], 0.5) - percentile(timings['clean_text'], 0.5)
+                print(f"{language:<10}{size:>10}  {'http overhead':<24}{overhead * 1000:>10.3f}")
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'kinds': kinds,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到 {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print("\n变慢超过阈值:")
+            for regression in regressions:
+                print("  " + regression)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+响应模式的体积和编码耗时
+
+对合成语料的清理结果，比较：
+- fastapi: 原来的路径（jsonable_encoder + json.dumps）
+- full / cleaned / diff: response_encoding.shape_result + json_dumps（orjson 可用时使用 orjson）
+
+同时检查 diff 模式的编辑脚本能重建清理结果。
+
+用法:
+    python benchmarks/bench_response_modes.py
+    python benchmarks/bench_response_modes.py --languages en,zh --sizes 64k,1m,4m
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+import response_encoding  # noqa: E402
+from app import cleaner  # noqa: E402
+from corpus import generate, parse_size  # noqa: E402
+from response_encoding import RESPONSE_MODES, apply_edits, json_dumps, shape_result  # noqa: E402
+
+
+def timed(func, repeat: int):
+    """返回最后一次的结果和最短耗时（秒）"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = func()
+        best = min(best, time.perf_counter() - start)
+    return value, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="响应模式的体积和编码耗时")
+    parser.add_argument('--languages', default='en,zh,de,ru')
+    parser.add_argument('--sizes', default='64k,1m')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"encoder: {'orjson' if response_encoding.orjson is not None else 'json'}")
+    print(f"{'language':<10}{'size':>10}  {'mode':<10}{'bytes':>12}{'ms':>10}")
+    failed = False
+    for language in args.languages.split(','):
+        for size in (parse_size(value) for value in args.sizes.split(',')):
+            result = cleaner.clean_text(generate(language, size))
+            body, seconds = timed(lambda: json.dumps(jsonable_encoder(result), ensure_ascii=False).encode('utf-8'), args.repeat)
+            print(f"{language:<10}{size:>10}  {'fastapi':<10}{len(body):>12}{seconds * 1000:>10.2f}")
+            for mode in RESPONSE_MODES:
+                body, seconds = timed(lambda: json_dumps(shape_result(result, mode)), args.repeat)
+                print(f"{language:<10}{size:>10}  {mode:<10}{len(body):>12}{seconds * 1000:>10.2f}")
+            edits = [tuple(edit) for edit in json.loads(body)['edits']]
+            if apply_edits(result.original_text, edits) != result.cleaned_text:
+                print(f"{language:<10}{size:>10}  diff 无法重建清理结果")
+                failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
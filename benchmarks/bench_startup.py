@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+冷启动耗时：从启动 uvicorn 进程到第一个响应
+
+对每种 langdetect 加载模式（CLEAN_LANGDETECT_LOAD=lazy / startup / preload）各启动一次服务，报告：
+- 从启动进程到 /api/health 第一次返回 200 的时间
+- 之后第一个需要 langdetect 的 /api/clean 请求（拉丁字母文本、不指定语言）的耗时
+- 服务进程（含 process 模式的清理进程）的 RSS 和 PSS 合计；PSS 按共享页的进程数分摊，
+  preload 模式下 fork 出的清理进程共享父进程加载的概率表
+
+每种模式重复 --repeat 次取中位数。
+
+用法:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --modes lazy,preload --executor process --workers 2 --repeat 5
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_TEXT = "The quick brown fox jumps over the lazy dog while the band plays on the shore tonight."
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def request(url: str, body: Dict = None) -> int:
+    data = json.dumps(body).encode() if body is not None else None
+    headers = {'Content-Type': 'application/json'} if body is not None else {}
+    with urllib.request.urlopen(urllib.request.Request(url, data=data, headers=headers), timeout=30) as response:
+        response.read()
+        return response.status
+
+
+def process_tree(pid: int) -> List[int]:
+    """pid 和它的全部子孙进程"""
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                parent = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+    return tree
+
+
+def memory_kb(pids: List[int]) -> Dict[str, int]:
+    """进程的 RSS 和 PSS 合计（KB）"""
+    totals = {'rss': 0, 'pss': 0}
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/smaps_rollup') as f:
+                for line in f:
+                    key, _, value = line.partition(':')
+                    if key in ('Rss', 'Pss'):
+                        totals[key.lower()] += int(value.split()[0])
+        except OSError:
+            continue
+    return totals
+
+
+def run_once(mode: str, executor: str, workers: int) -> Dict[str, float]:
+    port = free_port()
+    env = dict(os.environ, CLEAN_LANGDETECT_LOAD=mode, CLEAN_EXECUTOR=executor, CLEAN_WORKERS=str(workers),
+               CLEAN_CACHE_BYTES='0')
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app:app', '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning'],
+        cwd=ROOT, env=env,
+    )
+    base = f'http://127.0.0.1:{port}'
+    try:
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError(f"服务进程退出: {server.returncode}")
+            try:
+                request(base + '/api/health')
+                break
+            except OSError:
+                time.sleep(0.005)
+        ready = time.perf_counter() - start
+
+        clean_start = time.perf_counter()
+        request(base + '/api/clean/batch', {'texts': [_TEXT, _TEXT + ' Again.']})
+        first_detect = time.perf_counter() - clean_start
+
+        memory = memory_kb(process_tree(server.pid))
+        return {'ready': ready, 'first_detect': first_detect, 'rss_mb': memory['rss'] / 1024,
+                'pss_mb': memory['pss'] / 1024}
+    finally:
+        server.send_signal(signal.SIGINT)
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冷启动耗时：从启动进程到第一个响应")
+    parser.add_argument('--modes', default='lazy,startup,preload')
+    parser.add_argument('--executor', default='thread', help="CLEAN_EXECUTOR（inline / thread / process）")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'mode':>9}{'ready(ms)':>11}{'first detect(ms)':>18}{'RSS(MB)':>9}{'PSS(MB)':>9}")
+    for mode in args.modes.split(','):
+        runs = [run_once(mode, args.executor, args.workers) for _ in range(args.repeat)]
+        median = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+        print(f"{mode:>9}{median['ready'] * 1000:>11.0f}{median['first_detect'] * 1000:>18.0f}"
+              f"{median['rss_mb']:>9.1f}{median['pss_mb']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+process 模式下文本在进程之间的传输耗时：pickle 与共享内存（shm_transport.py）
+
+对每种语言、每个大小的合成语料（见 corpus.py），用 process 模式的 CleanExecutor 清理一个文本：
+- pickle: 文本和结果（original_text、cleaned_text）pickle 后经管道传递（原来的做法）
+- shm-utf-8 / shm-utf-32-le: 文本和结果经共享内存段传递，管道里只有段的描述
+
+默认工作进程里的清理器只复制一次文本（CopyCleaner），耗时基本都是传输；--clean 改用真正的
+清理器，看传输在整个请求里的占比。报告中位数耗时和相对 pickle 的加速比，--verify 检查三种
+传输的结果一致。
+
+用法:
+    python benchmarks/bench_transport.py
+    python benchmarks/bench_transport.py --languages en,zh --sizes 64k,1m,16m --clean --verify
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import AdvancedTextCleaner  # noqa: E402
+from batch_cleaner import BatchResult  # noqa: E402
+from clean_executor import CleanExecutor  # noqa: E402
+from corpus import generate, parse_size  # noqa: E402
+from shm_transport import ENCODINGS, SegmentPool  # noqa: E402
+
+
+class CopyCleaner:
+    """只复制文本的清理器：结果和原文是两个不同的字符串对象，与真正清理时传输的数据量相同"""
+
+    def stage_key(self, options):
+        return ()
+
+    def clean_text(self, text, options=None, language=None, timings=False, stats=True, stage_stats=False):
+        return BatchResult(text, text[:1] + text[1:], language or 'en', [], None)
+
+
+async def median_seconds(executor: CleanExecutor, text: str, repeat_count: int):
+    timings = []
+    result = None
+    for _ in range(repeat_count):
+        start = time.perf_counter()
+        result = (await executor.clean_many([text], stats=False))[0]
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+async def run(args) -> None:
+    cleaner = AdvancedTextCleaner() if args.clean else CopyCleaner()
+    transports = {'pickle': CleanExecutor(cleaner, mode='process', workers=1)}
+    for encoding in ENCODINGS:
+        transports['shm-' + encoding] = CleanExecutor(cleaner, mode='process', workers=1,
+                                                      shared_pool=SegmentPool(encoding), shared_min_chars=1)
+    try:
+        # 预热：启动工作进程
+        for executor in transports.values():
+            await executor.clean_many(['warm up'])
+
+        print(f"{'language':<10}{'size':>8}  " + ''.join(f"{name:>15}" for name in transports) + "   (ms, speedup)")
+        for language in args.languages.split(','):
+            for size_label in args.sizes.split(','):
+                text = generate(language, parse_size(size_label))
+                columns = []
+                expected = None
+                mismatch = False
+                baseline = None
+                for name, executor in transports.items():
+                    seconds, result = await median_seconds(executor, text, args.repeat)
+                    baseline = baseline or seconds
+                    columns.append(f"{seconds * 1000:>8.1f} {baseline / seconds:>5.2f}x")
+                    if expected is None:
+                        expected = result
+                    elif args.verify:
+                        mismatch = mismatch or (result.original_text, result.cleaned_text, result.changes_made) != (
+                            expected.original_text, expected.cleaned_text, expected.changes_made)
+                verdict = ('  MISMATCH' if mismatch else '  OK') if args.verify else ''
+                print(f"{language:<10}{size_label:>8}  " + ''.join(f"{column:>15}" for column in columns) + verdict)
+    finally:
+        for executor in transports.values():
+            executor.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="进程之间文本传输的耗时：pickle 与共享内存")
+    parser.add_argument('--languages', default='en,zh')
+    parser.add_argument('--sizes', default='16k,64k,256k,1m,4m,16m')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--clean', action='store_true', help="用真正的清理器（默认只复制文本）")
+    parser.add_argument('--verify', action='store_true')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+合成多语言测试语料
+
+为 /api/languages 中的每种语言生成指定大小的文本，按需混入：
+- mojibake: UTF-8 被当作 Latin-1 解码产生的乱码序列
+- html: 标签、实体和注释
+- markdown: 标题、列表、粗体斜体、链接、代码
+- pdf: 行尾连字符断词和固定宽度硬换行
+- ai: AI 对话的角色标记、引导语和 Note 提示
+- seams: 分块边界的难例（SEAM_CASES），连字符或列表标记结尾的段落之后跟着清理后被删除的段落
+
+同一组参数和种子总是生成同样的文本。
+
+用法:
+    python benchmarks/corpus.py --language de --size 64k --kinds html,pdf > sample.txt
+"""
+
+import argparse
+import random
+import sys
+from typing import Iterable, List
+
+LANGUAGES = ('en', 'zh', 'de', 'fr', 'es', 'ru', 'ja', 'ko', 'th', 'ar', 'he')
+KINDS = ('mojibake', 'html', 'markdown', 'pdf', 'ai', 'seams')
+
+# 整篇清理时段落末尾的连字符或列表标记会跨过之后被删除的段落（代码、乱码）与下一段连接，
+# 分块清理（流式、增量、并行）不能在这些段落之间分块
+SEAM_CASES = (
+    "Some words quick-\n\n`code`\n\nlink text here.\n",
+    "A\n-```\nx\n```\n\nmore text\n",
+    "Some words quick- Â\n\nlink text here.\n",
+)
+
+# 每种语言的常用词；不使用空格分词的语言按字符拼接
+_WORDS = {
+    'en': "the of and to in is was for on that with as by at from this data results method system text process model "
+          "analysis research experiment hypothesis controlled conditions standard repeated measurement".split(),
+    'de': "der die das und ist nicht mit für auf dem eine Größe Prüfung Ergebnis Bedingungen Messung Verfahren "
+          "während über Änderung Straße Übersicht wurde werden".split(),
+    'fr': "le la les et est dans pour avec sur une des résultat méthode système été très être où français "
+          "données expérience conditions mesure répétée".split(),
+    'es': "el la los las y es en para con por una del resultado método sistema años niño también más "
+          "datos experimento condiciones medición repetida".split(),
+    'ru': "и в не на что с по это как из для результат метод система данные эксперимент условия "
+          "измерение повторение анализ".split(),
+    'zh': list("的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经"),
+    'ja': list("のにはをたがでてとしれさあいうえおかきくけこアイウエオカキクケコ日本語文章結果方法"),
+    'ko': "그리고 결과 방법 시스템 데이터 실험 조건 측정 분석 연구 문서 텍스트 정리 처리".split(),
+    'th': list("กขคงจฉชซญดตถทนบปผพฟมยรลวศสหอะาิีึืุูเแโใไ่้๊๋"),
+    'ar': "في من على إلى عن مع هذا التي الذي نتيجة طريقة نظام بيانات تجربة ظروف قياس تحليل".split(),
+    'he': "של את על עם זה היא הוא תוצאה שיטה מערכת נתונים ניסוי תנאים מדידה ניתוח".split(),
+}
+
+# 没有空格分词的语言
+_UNSPACED = ('zh', 'ja', 'th')
+
+# 各语言的句末标点和逗号
+_PUNCTUATION = {
+    'zh': ('。', '，'), 'ja': ('。', '、'), 'th': (' ', ' '),
+    'ar': ('.', '،'), 'he': ('.', ','),
+}
+
+_MOJIBAKE = ('â€™', 'â€œ', 'â€', 'â€"', 'Â ')
+_AI_TAGS = ('[Assistant] ', '[User] ', '[AI] ', '[Human] ')
+
+
+def parse_size(value: str) -> int:
+    """'64k' / '1m' / '1000' -> 字符数"""
+    value = value.strip().lower()
+    units = {'k': 1024, 'm': 1024 * 1024}
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def _sentence(rng: random.Random, language: str) -> str:
+    words = _WORDS[language]
+    end, comma = _PUNCTUATION.get(language, ('.', ','))
+    count = rng.randint(6, 18)
+    if language in _UNSPACED:
+        body = ''.join(rng.choice(words) for _ in range(count * 2))
+        if count > 10:
+            body = body[:count] + comma + body[count:]
+        return body + end
+    chosen = [rng.choice(words) for _ in range(count)]
+    if count > 10:
+        chosen[count // 2] += comma
+    chosen[0] = chosen[0][:1].upper() + chosen[0][1:]
+    return ' '.join(chosen) + end
+
+
+def _paragraph(rng: random.Random, language: str) -> str:
+    joiner = '' if language in _UNSPACED else ' '
+    return joiner.join(_sentence(rng, language) for _ in range(rng.randint(2, 6)))
+
+
+def _hard_wrap(text: str, width: int, hyphenate: bool) -> str:
+    """按固定宽度硬换行，断开单词时加连字符，模拟 PDF 复制"""
+    lines = []
+    while len(text) > width:
+        cut = width
+        if hyphenate and text[cut - 2].isalpha() and text[cut - 1].isalpha() and text[cut].isalpha():
+            lines.append(text[:cut - 1] + '-')
+            text = text[cut - 1:]
+        else:
+            lines.append(text[:cut])
+            text = text[cut:].lstrip(' ')
+    lines.append(text)
+    return '\n'.join(lines)
+
+
+def _decorate(rng: random.Random, paragraph: str, language: str, kinds: Iterable[str]) -> str:
+    """按选择的类型给段落加上噪声"""
+    kinds = set(kinds)
+    if 'mojibake' in kinds and rng.random() < 0.5:
+        position = rng.randrange(len(paragraph))
+        paragraph = paragraph[:position] + rng.choice(_MOJIBAKE) + paragraph[position:]
+    if 'markdown' in kinds:
+        roll = rng.random()
+        if roll < 0.15:
+            paragraph = '#' * rng.randint(1, 3) + ' ' + paragraph[:40] + '\n' + paragraph
+        elif roll < 0.3:
+            paragraph = '\n'.join('- ' + part for part in paragraph.split(' ')[:6] if part)
+        elif roll < 0.45:
+            paragraph = f"**{paragraph[:20]}** {paragraph[20:]} [link](https://example.com/{rng.randint(0, 999)}) `code`"
+        elif roll < 0.5:
+            paragraph = "```python\nprint('hello')\n```\n" + paragraph
+    if 'html' in kinds and rng.random() < 0.5:
+        paragraph = f'<p class="c{rng.randint(0, 9)}">{paragraph} &amp; &eacute;</p><!-- note -->'
+    if 'pdf' in kinds and language not in _UNSPACED and rng.random() < 0.7:
+        paragraph = _hard_wrap(paragraph, 72, hyphenate=True)
+    elif 'pdf' in kinds and rng.random() < 0.7:
+        paragraph = _hard_wrap(paragraph, 36, hyphenate=False)
+    if 'ai' in kinds and rng.random() < 0.3:
+        paragraph = rng.choice(_AI_TAGS) + "Here's the summary you asked for: " + paragraph + "\n**Note:** generated text."
+    if 'seams' in kinds and rng.random() < 0.05:
+        paragraph += '\n\n' + rng.choice(SEAM_CASES).rstrip('\n')
+    return paragraph
+
+
+def generate(language: str, size: int, kinds: Iterable[str] = KINDS, seed: int = 0) -> str:
+    """生成约 size 个字符的文本（以整段为单位，最后一段可能略超出）"""
+    if language not in _WORDS:
+        raise ValueError(f"不支持的语言: {language}")
+    kinds = list(kinds)
+    rng = random.Random(f"{seed}:{language}:{','.join(kinds)}")
+    paragraphs: List[str] = []
+    total = 0
+    while total < size:
+        paragraph = _decorate(rng, _paragraph(rng, language), language, kinds)
+        # 一部分段落重复出现，让重复行删除有事可做
+        if paragraphs and rng.random() < 0.05:
+            paragraph = rng.choice(paragraphs)
+        paragraphs.append(paragraph)
+        total += len(paragraph) + 2
+    return '\n\n'.join(paragraphs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成合成多语言测试语料")
+    parser.add_argument('--language', default='en', choices=LANGUAGES)
+    parser.add_argument('--size', default='64k', help="字符数，支持 k/m 后缀")
+    parser.add_argument('--kinds', default=','.join(KINDS), help="逗号分隔: " + ','.join(KINDS))
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    kinds = [kind for kind in args.kinds.split(',') if kind]
+    unknown = set(kinds) - set(KINDS)
+    if unknown:
+        parser.error(f"未知的类型: {', '.join(sorted(unknown))}")
+    sys.stdout.write(generate(args.language, parse_size(args.size), kinds, args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+"""
+清理任务执行器：把 CPU 密集的文本清理移出 asyncio 事件循环
+
+执行模式：
+- inline: 直接在事件循环里执行（原来的行为）
+- thread: 线程池执行，事件循环可以继续响应其他请求
+- process: 进程池执行，每个工作进程持有一个预热好的清理器，多核并行
+
+配置了结果缓存时，在分发之前先查缓存，只把未命中的文本交给工作线程/进程。
+请求阶段耗时的任务不查缓存（缓存的结果没有耗时）。
+
+stage_timings 为 True 时所有任务都记录阶段耗时，新清理的结果交给 on_result
+（例如写入进程级直方图）；调用方没有请求耗时时，返回前去掉 timings 字段。
+
+等待中的文本数量有上限，超过上限时拒绝新任务（ExecutorBusyError），
+由调用方返回 503 让客户端稍后重试。
+
+process 模式下工作进程异常退出（例如清理大文本时被 OOM 终止）后进程池不能再用：正在执行的任务
+抛出 WorkerCrashedError（调用方同样返回 503），进程池被丢弃，下一个任务重新创建。
+
+不记录阶段耗时时，不超过 batch_max_chars 个字符的短文本交给批量引擎（batch_cleaner.py）
+一起清理，较长的文本仍然逐条清理；batch_max_chars 为 0 时不使用批量引擎。
+batch_language_group 是批量引擎按组检测语言时每组的字符数，0 表示逐条检测。
+
+stats 为 False 时不计算整体统计；stage_stats（各阶段的统计）和 timings 一样逐条清理、不查缓存。
+缓存只保存带整体统计的结果，不保存各阶段的统计。
+
+process 模式下，不少于 parallel_min_chars 个字符的单个文本（默认选项、不记录耗时和各阶段统计）
+在段落边界分块，各块分给所有工作进程并行清理（parallel_cleaner.py），结果与整篇清理相同；
+parallel_min_chars 为 0 时不分块。
+
+process 模式下配置了 shared_pool（shm_transport.SegmentPool）时，不少于 shared_min_chars 个字符的
+文本（包括大文本的各块）经共享内存传给工作进程，结果写回同一个段，管道里只传段的描述。
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from batch_cleaner import clean_batch
+from parallel_cleaner import clean_block, clean_document
+from shm_transport import SharedText, read_text, write_back
+
+# 分块并行清理时每块的最小字符数；每个工作进程约分到 4 块，清理快慢不同的块可以互相平衡
+PARALLEL_MIN_BLOCK = 256 * 1024
+PARALLEL_BLOCKS_PER_WORKER = 4
+
+EXECUTOR_MODES = ('inline', 'thread', 'process')
+
+
+class ExecutorBusyError(RuntimeError):
+    """等待执行的任务已达上限"""
+
+
+class WorkerCrashedError(RuntimeError):
+    """工作进程异常退出，任务没有完成；进程池会在下次使用时重建"""
+
+
+# 进程池工作进程里的清理器，由 _init_worker 创建
+_worker_cleaner = None
+
+
+def _init_worker(cleaner_factory: Callable[[], Any]) -> None:
+    """工作进程启动时创建清理器（编译正则、生成阶段计划）"""
+    global _worker_cleaner
+    _worker_cleaner = cleaner_factory()
+
+
+def _clean_chunk_in_worker(texts: List[str], options: Optional[Dict[str, bool]], language: Optional[str], timings: bool = False,
+                           batch_max_chars: int = 0, batch_language_group: int = 0, stats: bool = True,
+                           stage_stats: bool = False) -> list:
+    """在工作进程中清理一组文本"""
+    return clean_texts(_worker_cleaner, texts, options, language, timings, batch_max_chars, batch_language_group,
+                       stats, stage_stats)
+
+
+def _clean_block_in_worker(content: str, options: Optional[Dict[str, bool]], language: str):
+    """在工作进程中清理大文本的一块"""
+    return clean_block(_worker_cleaner, options, language, content)
+
+
+def _clean_shared_chunk_in_worker(items: List[Any], options: Optional[Dict[str, bool]], language: Optional[str],
+                                  timings: bool = False, batch_max_chars: int = 0, batch_language_group: int = 0,
+                                  stats: bool = True, stage_stats: bool = False):
+    """在工作进程中清理一组文本，其中的 SharedText 从共享内存读出、结果写回同一个段
+
+    返回 (结果, 各条写回的 SharedText 或 None)；经共享内存传入的文本，结果里不带 original_text，
+    写回成功的不带 cleaned_text，由主进程补上。
+    """
+    texts = [read_text(item) if isinstance(item, SharedText) else item for item in items]
+    results = clean_texts(_worker_cleaner, texts, options, language, timings, batch_max_chars, batch_language_group,
+                          stats, stage_stats)
+    outputs = []
+    for item, result in zip(items, results):
+        output = None
+        if isinstance(item, SharedText):
+            result.original_text = ''
+            output = write_back(item, result.cleaned_text)
+            if output is not None:
+                result.cleaned_text = ''
+        outputs.append(output)
+    return results, outputs
+
+
+def _clean_shared_block_in_worker(shared: SharedText, options: Optional[Dict[str, bool]], language: str):
+    """在工作进程中清理共享内存中的一块，清理结果写回同一个段"""
+    result = clean_block(_worker_cleaner, options, language, read_text(shared))
+    output = write_back(shared, result.staged)
+    if output is not None:
+        result.staged = ''
+    return result, output
+
+
+def clean_texts(cleaner, texts: Sequence[str], options: Optional[Dict[str, bool]], language: Optional[str],
+                timings: bool = False, batch_max_chars: int = 0, batch_language_group: int = 0, stats: bool = True,
+                stage_stats: bool = False) -> list:
+    """清理一组文本：不记录耗时和各阶段统计时短文本交给批量引擎，其余逐条清理"""
+    short = [] if timings or stage_stats or not batch_max_chars else [
+        index for index, text in enumerate(texts) if len(text) <= batch_max_chars
+    ]
+    if len(short) < 2:
+        return [cleaner.clean_text(text, options, language, timings, stats, stage_stats) for text in texts]
+    results = [None] * len(texts)
+    for index, result in zip(short, clean_batch(
+            cleaner, [texts[index] for index in short], options, language, batch_language_group, stats)):
+        results[index] = result
+    for index, result in enumerate(results):
+        if result is None:
+            results[index] = cleaner.clean_text(texts[index], options, language, timings, stats)
+    return results
+
+
+def split_chunks(items: Sequence, parts: int) -> List[Sequence]:
+    """把列表按顺序切成最多 parts 段，各段长度相差不超过 1"""
+    parts = max(1, min(parts, len(items)))
+    size, extra = divmod(len(items), parts)
+    chunks = []
+    start = 0
+    for index in range(parts):
+        end = start + size + (1 if index < extra else 0)
+        chunks.append(items[start:end])
+        start = end
+    return chunks
+
+
+class CleanExecutor:
+    """按配置的模式执行清理任务，并限制等待中的文本数量"""
+
+    def __init__(self, cleaner, mode: str = 'thread', workers: Optional[int] = None, max_pending: int = 256, cache=None,
+                 stage_timings: bool = False, on_result: Optional[Callable[[Any], None]] = None, batch_max_chars: int = 0,
+                 batch_language_group: int = 0, parallel_min_chars: int = 0, shared_pool=None,
+                 shared_min_chars: int = 0):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"未知的执行模式: {mode}（可选: {', '.join(EXECUTOR_MODES)}）")
+        self.cleaner = cleaner
+        self.mode = mode
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.cache = cache
+        self.stage_timings = stage_timings
+        self.on_result = on_result
+        self.batch_max_chars = batch_max_chars
+        self.batch_language_group = batch_language_group
+        self.parallel_min_chars = parallel_min_chars
+        # 只有 process 模式需要跨进程传输
+        self.shared_pool = shared_pool if mode == 'process' and shared_min_chars > 0 else None
+        self.shared_min_chars = shared_min_chars
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.restarts = 0
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    async def clean(self, text: str, options: Optional[Dict[str, bool]] = None, language: Optional[str] = None,
+                    timings: bool = False, stats: bool = True, stage_stats: bool = False):
+        """清理单个文本"""
+        return (await self.clean_many([text], options, language, timings, stats, stage_stats))[0]
+
+    async def clean_many(self, texts: List[str], options: Optional[Dict[str, bool]] = None, language: Optional[str] = None,
+                         timings: bool = False, stats: bool = True, stage_stats: bool = False) -> list:
+        """清理一组文本，分段并行执行，结果保持输入顺序；timings 为 True 时结果带阶段耗时"""
+        stage_key = self.cleaner.stage_key(options)
+        collect = timings or self.stage_timings
+        results = [None] * len(texts)
+        if self.cache is not None and not timings and not stage_stats:
+            for index, text in enumerate(texts):
+                result = results[index] = self.cache.get(text, stage_key, language)
+                if result is not None and not stats:
+                    result.stats = None
+        missing = [index for index, result in enumerate(results) if result is None]
+        if not missing:
+            return results
+        
+        self._admit(len(missing))
+        try:
+            documents = set()
+            if (self.mode == 'process' and self.workers > 1 and self.parallel_min_chars and not collect
+                    and not stage_stats and stage_key == self.cleaner.stage_key(None)):
+                documents = {index for index in missing if len(texts[index]) >= self.parallel_min_chars}
+            others = [index for index in missing if index not in documents]
+            misses = [texts[index] for index in others]
+            cleaned = {}
+            if misses and self.mode == 'inline':
+                cleaned.update(zip(others, clean_texts(self.cleaner, misses, options, language, collect,
+                                                       self.batch_max_chars, self.batch_language_group, stats,
+                                                       stage_stats)))
+            elif misses:
+                loop = asyncio.get_running_loop()
+                executor = self._get_executor()
+                worker = _clean_chunk_in_worker if self.mode == 'process' else self._clean_chunk
+                chunks = split_chunks(misses, self.workers)
+                arguments = (options, language, collect, self.batch_max_chars, self.batch_language_group, stats,
+                             stage_stats)
+                try:
+                    parts = await asyncio.gather(*(
+                        asyncio.to_thread(self._clean_shared_chunk, executor, chunk, *arguments)
+                        if self.shared_pool is not None and any(len(text) >= self.shared_min_chars for text in chunk)
+                        else loop.run_in_executor(executor, worker, chunk, *arguments)
+                        for chunk in chunks
+                    ))
+                except BrokenProcessPool as e:
+                    raise self._discard_broken(executor) from e
+                cleaned.update(zip(others, (result for part in parts for result in part)))
+            # 大文本依次清理，每个都分给所有工作进程；分块和拼接在线程中执行，不阻塞事件循环
+            for index in sorted(documents):
+                cleaned[index] = await asyncio.to_thread(self._clean_document, texts[index], options, language, stats)
+            self.completed += len(missing)
+        finally:
+            self.pending -= len(missing)
+        
+        for index in missing:
+            result = cleaned[index]
+            if self.on_result is not None and collect:
+                self.on_result(result)
+            if not timings:
+                result.timings = None
+            results[index] = result
+            if self.cache is not None and result.stats is not None:
+                self.cache.put(texts[index], stage_key, language, result)
+        return results
+
+    def stats(self) -> Dict[str, int]:
+        """执行器状态计数"""
+        content = {
+            'workers': self.workers,
+            'pending': self.pending,
+            'max_pending': self.max_pending,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'restarts': self.restarts,
+        }
+        if self.shared_pool is not None:
+            content.update(('shared_' + name, value) for name, value in self.shared_pool.stats().items())
+        return content
+
+    def shutdown(self) -> None:
+        """关闭线程池或进程池"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            if self.shared_pool is not None:
+                self.shared_pool.close()
+
+    def _admit(self, count: int) -> None:
+        """登记等待中的文本；空闲时总是接受，避免超过上限的单个任务永远无法执行"""
+        if self.pending and self.pending + count > self.max_pending:
+            self.rejected += count
+            raise ExecutorBusyError("服务繁忙，请稍后重试")
+        self.pending += count
+
+    def _clean_chunk(self, texts: List[str], options: Optional[Dict[str, bool]], language: Optional[str], timings: bool = False,
+                     batch_max_chars: int = 0, batch_language_group: int = 0, stats: bool = True,
+                     stage_stats: bool = False) -> list:
+        """在线程池中用共享的清理器清理一组文本"""
+        return clean_texts(self.cleaner, texts, options, language, timings, batch_max_chars, batch_language_group,
+                           stats, stage_stats)
+
+    def _clean_shared_chunk(self, executor: Executor, texts: List[str], *arguments) -> list:
+        """长文本经共享内存交给进程池清理；在线程中执行，编码和解码不阻塞事件循环
+
+        等工作进程返回（包括出错时）才归还段，不会有工作进程还在写已经复用的段。
+        """
+        pool = self.shared_pool
+        items = []
+        try:
+            for text in texts:
+                items.append(pool.put(text) if len(text) >= self.shared_min_chars else text)
+            results, outputs = executor.submit(_clean_shared_chunk_in_worker, items, *arguments).result()
+            for text, item, result, output in zip(texts, items, results, outputs):
+                if isinstance(item, SharedText):
+                    result.original_text = text
+                if output is not None:
+                    result.cleaned_text = pool.get(output)
+            return results
+        finally:
+            for item in items:
+                if isinstance(item, SharedText):
+                    pool.release(item)
+
+    def _clean_document(self, text: str, options: Optional[Dict[str, bool]], language: Optional[str],
+                        stats: bool):
+        """把一个大文本分块交给进程池并行清理"""
+        executor = self._get_executor()
+        block_size = max(PARALLEL_MIN_BLOCK, len(text) // (self.workers * PARALLEL_BLOCKS_PER_WORKER))
+
+        pool = self.shared_pool
+        if pool is None or block_size < self.shared_min_chars:
+            def map_blocks(contents: List[str], block_language: str):
+                return executor.map(_clean_block_in_worker, contents, repeat(options), repeat(block_language))
+
+            try:
+                return clean_document(self.cleaner, text, map_blocks, options, language, block_size, stats)
+            except BrokenProcessPool as e:
+                raise self._discard_broken(executor) from e
+
+        shared = []
+        futures = []
+
+        def map_shared_blocks(contents: List[str], block_language: str):
+            for content in contents:
+                shared.append(pool.put(content))
+                futures.append(executor.submit(_clean_shared_block_in_worker, shared[-1], options, block_language))
+            for future in futures:
+                result, output = future.result()
+                if output is not None:
+                    result.staged = pool.get(output)
+                yield result
+
+        try:
+            return clean_document(self.cleaner, text, map_shared_blocks, options, language, block_size, stats)
+        except BrokenProcessPool as e:
+            raise self._discard_broken(executor) from e
+        finally:
+            for future in futures:
+                future.cancel()
+            wait(futures)
+            for block in shared:
+                pool.release(block)
+
+    def _discard_broken(self, executor: Executor) -> WorkerCrashedError:
+        """丢弃有工作进程异常退出的进程池（其他任务可能已经换了新的），返回交给调用方的错误"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+                self.restarts += 1
+        executor.shutdown(wait=False, cancel_futures=True)
+        return WorkerCrashedError("清理进程异常退出（可能是内存不足），请稍后重试")
+
+    def _get_executor(self) -> Executor:
+        """第一次使用时再创建线程池或进程池"""
+        with self._lock:
+            if self._executor is None:
+                if self.mode == 'process':
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        initializer=_init_worker,
+                        initargs=(type(self.cleaner),),
+                    )
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='clean')
+            return self._executor
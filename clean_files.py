@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+离线批量清理大文件：python clean_files.py 'dumps/**/*.txt' -o cleaned/
+
+- 输入用 mmap 映射，每次只解码约一块（--block-size），整个文件不会同时放在内存里
+- 按 StreamCleaner 的规则在安全的段落边界分块；各块的清理阶段在进程池中并行执行，
+  重复行删除、AI 标记清理和块间空白的拼接在主进程中按顺序执行，输出按原文顺序流式写入
+- 默认选项下输出与对整个文件调用 clean_text 一致（见 stream_cleaner.py），包括段落末尾的连字符
+  跨过被删除的段落与下一段连接的情况
+- 每隔 --checkpoint-every 秒把输出刷到磁盘，并在 <输出>.ckpt 中记录已处理的输入位置和
+  跨块状态；--resume 从检查点继续，已经完成的文件（有输出、没有检查点）直接跳过
+- 结束时打印每个文件和总计的吞吐量
+
+重复行删除的 hashed / bloom / near 模式依赖 Python 的字符串哈希，恢复时必须使用同一个
+哈希种子：脚本启动时固定 PYTHONHASHSEED（恢复时使用检查点中记录的种子）并重新执行自身。
+"""
+
+import argparse
+import codecs
+import glob
+import json
+import mmap
+import os
+import pickle
+import random
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from stream_cleaner import StreamCleaner, run_block_stages
+
+CHECKPOINT_SUFFIX = '.ckpt'
+# 2: 分块规则改为不在清理后可能与下一段连接的位置分块（见 stream_cleaner），旧检查点可能停在这样的位置，
+# 之前写出的输出也可能与整篇清理不一致，从头开始
+CHECKPOINT_VERSION = 2
+
+# 工作进程里的清理器，由 _init_worker 创建
+_worker_cleaner = None
+
+
+def _init_worker() -> None:
+    # fork 出的进程直接使用父进程已经创建好的清理器
+    global _worker_cleaner
+    from app import cleaner
+    _worker_cleaner = cleaner
+
+
+def _clean_block_in_worker(content: str, options: Optional[Dict[str, bool]], language: str) -> str:
+    """在工作进程中对一块执行行阶段之外的阶段"""
+    return run_block_stages(_worker_cleaner, _worker_cleaner.get_plan(options, language), content)
+
+
+def parse_size(value: str) -> int:
+    """'64k' / '8m' / '1000' -> 字符数"""
+    value = value.strip().lower()
+    units = {'k': 1024, 'm': 1024 * 1024, 'g': 1024 * 1024 * 1024}
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def output_path(path: str, output_dir: Optional[str], suffix: str) -> str:
+    """输出文件路径：<输出目录或输入所在目录>/<文件名><suffix><扩展名>"""
+    name, extension = os.path.splitext(os.path.basename(path))
+    return os.path.join(output_dir or os.path.dirname(path), name + suffix + extension)
+
+
+class _NewlineCursor:
+    """按已处理文本中的换行数定位输入中的字节位置
+
+    分块点总在换行之后；UTF-8 中 0x0A 只表示换行（解码错误时的替换也不会吞掉它），
+    所以数到第 n 个换行就是对应的字节位置。
+    """
+
+    def __init__(self, data: mmap.mmap, position: int, chunk: int = 1024 * 1024):
+        self.data = data
+        self.position = position
+        self.chunk = chunk
+
+    def advance(self, newlines: int) -> int:
+        while newlines:
+            window = self.data[self.position:self.position + self.chunk]
+            count = window.count(b'\n')
+            if count < newlines:
+                self.position += len(window)
+                newlines -= count
+                continue
+            index = -1
+            for _ in range(newlines):
+                index = window.index(b'\n', index + 1)
+            self.position += index + 1
+            newlines = 0
+        return self.position
+
+
+class FileCleaner:
+    """清理单个文件，可以从检查点继续"""
+
+    def __init__(self, cleaner, pool: Optional[ProcessPoolExecutor], workers: int, options: Optional[Dict[str, bool]],
+                 language: Optional[str], block_size: int, checkpoint_every: float, hash_seed: str):
+        self.cleaner = cleaner
+        self.pool = pool
+        self.workers = workers
+        self.options = options
+        self.language = language
+        self.block_size = block_size
+        self.checkpoint_every = checkpoint_every
+        self.hash_seed = hash_seed
+
+    def run(self, source: str, target: str, resume: bool) -> Dict[str, Any]:
+        """清理 source 写入 target，返回统计"""
+        stat = os.stat(source)
+        stream = StreamCleaner(self.cleaner, self.options, self.language, block_size=self.block_size,
+                               max_block_size=max(self.block_size * 8, 1024 * 1024))
+        checkpoint_path = target + CHECKPOINT_SUFFIX
+        state = self._load_checkpoint(checkpoint_path, stat) if resume and os.path.exists(target) else None
+        position = 0
+        written = 0
+        elapsed = 0.0
+        if state is not None:
+            stream.restore(state['stream'])
+            position = state['input_offset']
+            written = state['output_bytes']
+            elapsed = state['elapsed']
+        started = time.perf_counter() - elapsed
+        # 统计只计本次运行：恢复时从检查点的位置算起
+        resumed_written = written
+        run_started = time.perf_counter()
+
+        with open(source, 'rb') as f, open(target, 'r+b' if state is not None else 'wb') as out:
+            out.truncate(written)
+            out.seek(written)
+            if stat.st_size == 0:
+                return self._finish(checkpoint_path, self._summary(source, 0, 0, time.perf_counter() - started, 0))
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                cursor = _NewlineCursor(data, position)
+                self._save_checkpoint(checkpoint_path, stat, stream, cursor.position, written,
+                                      time.perf_counter() - started)
+                decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+                pending: Deque[Tuple[Future, str, int]] = deque()
+                newlines = 0  # 已 append 但还没计入 cursor 的换行数
+                last_checkpoint = time.monotonic()
+                blocks = 0
+
+                def drain(limit: int) -> None:
+                    nonlocal written, newlines, last_checkpoint, blocks
+                    while len(pending) > limit:
+                        future, gap, count = pending.popleft()
+                        text = stream.append(future.result(), gap)
+                        if text:
+                            encoded = text.encode('utf-8')
+                            out.write(encoded)
+                            written += len(encoded)
+                        newlines += count
+                        blocks += 1
+                        if time.monotonic() - last_checkpoint >= self.checkpoint_every:
+                            out.flush()
+                            os.fsync(out.fileno())
+                            self._save_checkpoint(checkpoint_path, stat, stream, cursor.advance(newlines), written,
+                                                  time.perf_counter() - started)
+                            newlines = 0
+                            last_checkpoint = time.monotonic()
+
+                def submit(new_blocks: List[Tuple[str, str]]) -> None:
+                    for content, gap in new_blocks:
+                        count = content.count('\n') + gap.count('\n')
+                        if self.pool is None:
+                            future: Future = Future()
+                            future.set_result(stream.clean_block(content))
+                        else:
+                            future = self.pool.submit(_clean_block_in_worker, content, self.options, stream.language)
+                        pending.append((future, gap, count))
+                        drain(self.workers * 2)
+
+                # 每次解码约一块：StreamCleaner 在缓冲区中最后一个安全的位置分块，一次给太多文本会得到过大的块
+                for offset in range(position, len(data), self.block_size):
+                    submit(stream.split(decoder.decode(data[offset:offset + self.block_size])))
+                submit(stream.split(decoder.decode(b'', final=True)))
+                submit(stream.split_rest())
+                drain(0)
+                tail = stream.finish().encode('utf-8')
+                out.write(tail)
+                written += len(tail)
+            finally:
+                data.close()
+        return self._finish(checkpoint_path, self._summary(
+            source, stat.st_size - position, written - resumed_written, time.perf_counter() - run_started, blocks))
+
+    @staticmethod
+    def _finish(checkpoint_path: str, summary: Dict[str, Any]) -> Dict[str, Any]:
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        return summary
+
+    def _load_checkpoint(self, path: str, stat: os.stat_result) -> Optional[Dict[str, Any]]:
+        """读取检查点；输入文件变了或选项不同时从头开始"""
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        if (state.get('version') != CHECKPOINT_VERSION or state['input_size'] != stat.st_size
+                or state['input_mtime'] != stat.st_mtime_ns or state['options'] != self.options
+                or state['hash_seed'] != self.hash_seed or (self.language and state['stream']['language'] != self.language)):
+            print(f"检查点与当前输入或参数不一致，从头开始: {path}", file=sys.stderr)
+            return None
+        return state
+
+    def _save_checkpoint(self, path: str, stat: os.stat_result, stream, input_offset: int, output_bytes: int,
+                         elapsed: float) -> None:
+        """原子地写入检查点（先写临时文件再改名）"""
+        state = {
+            'version': CHECKPOINT_VERSION,
+            'input_size': stat.st_size,
+            'input_mtime': stat.st_mtime_ns,
+            'options': self.options,
+            'hash_seed': self.hash_seed,
+            'input_offset': input_offset,
+            'output_bytes': output_bytes,
+            'elapsed': elapsed,
+            'stream': stream.checkpoint(),
+        }
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+
+    @staticmethod
+    def _summary(source: str, read: int, written: int, seconds: float, blocks: int) -> Dict[str, Any]:
+        return {'file': source, 'input_bytes': read, 'output_bytes': written, 'seconds': seconds, 'blocks': blocks}
+
+
+def expand_inputs(patterns: List[str]) -> List[str]:
+    """展开 glob（支持 **），去重并保持顺序"""
+    paths: List[str] = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        for path in matches:
+            if os.path.isfile(path) and path not in paths:
+                paths.append(path)
+    return paths
+
+
+def _hash_seed(targets: List[str], resume: bool) -> str:
+    """本次运行使用的字符串哈希种子：恢复时沿用检查点中的种子"""
+    if resume:
+        for target in targets:
+            path = target + CHECKPOINT_SUFFIX
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    return pickle.load(f)['hash_seed']
+    current = os.environ.get('PYTHONHASHSEED')
+    if current and current != 'random':
+        return current
+    return str(random.randint(1, 2 ** 32 - 1))
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="离线批量清理大文本文件")
+    parser.add_argument('inputs', nargs='+', help="输入文件或 glob（需要加引号，支持 **）")
+    parser.add_argument('-o', '--output-dir', help="输出目录，默认与输入文件相同")
+    parser.add_argument('--suffix', default='.clean', help="输出文件名在扩展名之前追加的后缀")
+    parser.add_argument('--language', help="语言代码，默认按每个文件的开头检测")
+    parser.add_argument('--options', help='清理选项 JSON，例如 {"remove_duplicates": false}')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="清理进程数，1 表示在主进程中清理")
+    parser.add_argument('--block-size', default='1m', help="分块大小（字符）")
+    parser.add_argument('--checkpoint-every', type=float, default=30.0, help="写检查点的间隔（秒）")
+    parser.add_argument('--resume', action='store_true', help="从检查点继续，跳过已经完成的文件")
+    args = parser.parse_args(argv)
+
+    sources = expand_inputs(args.inputs)
+    if not sources:
+        parser.error("没有匹配的输入文件")
+    targets = [output_path(source, args.output_dir, args.suffix) for source in sources]
+    if len(set(targets)) != len(targets) or set(targets) & set(sources):
+        parser.error("输出文件名冲突（同名输入或输出覆盖输入），请调整 --output-dir 或 --suffix")
+
+    seed = _hash_seed(targets, args.resume)
+    if os.environ.get('PYTHONHASHSEED') != seed:
+        os.environ['PYTHONHASHSEED'] = seed
+        os.execv(sys.executable, [sys.executable, os.path.abspath(__file__), *(argv or sys.argv[1:])])
+
+    from app import cleaner
+
+    options = json.loads(args.options) if args.options else None
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    pool = ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) if args.workers > 1 else None
+    file_cleaner = FileCleaner(cleaner, pool, args.workers, options, args.language, parse_size(args.block_size),
+                               args.checkpoint_every, seed)
+    summaries = []
+    started = time.perf_counter()
+    try:
+        for source, target in zip(sources, targets):
+            if args.resume and os.path.exists(target) and not os.path.exists(target + CHECKPOINT_SUFFIX):
+                print(f"跳过已完成: {source}")
+                continue
+            summary = file_cleaner.run(source, target, args.resume)
+            summaries.append(summary)
+            print(_format_summary(summary['file'] + ' -> ' + target, summary), flush=True)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    total = {
+        'input_bytes': sum(summary['input_bytes'] for summary in summaries),
+        'output_bytes': sum(summary['output_bytes'] for summary in summaries),
+        'seconds': time.perf_counter() - started,
+        'blocks': sum(summary['blocks'] for summary in summaries),
+    }
+    print(_format_summary(f"总计 {len(summaries)} 个文件（{args.workers} 个进程）", total))
+
+
+def _format_summary(label: str, summary: Dict[str, Any]) -> str:
+    megabytes = summary['input_bytes'] / (1024 * 1024)
+    rate = megabytes / summary['seconds'] if summary['seconds'] > 0 else 0.0
+    return (f"{label}: {megabytes:.1f} MB -> {summary['output_bytes'] / (1024 * 1024):.1f} MB, "
+            f"{summary['blocks']} 块, {summary['seconds']:.1f} 秒, {rate:.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
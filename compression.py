@@ -0,0 +1,411 @@
+"""
+HTTP 压缩：响应按 Accept-Encoding 用 zstd 或 gzip 压缩，请求体按 Content-Encoding 解压
+
+批量清理的响应常有几 MB 的 JSON（原文和清理结果大部分相同），原来都不压缩发送。
+CompressionMiddleware 是纯 ASGI 中间件：
+- 响应：客户端接受 zstd（安装了 zstandard 时）或 gzip、内容类型是 JSON / NDJSON / 文本、
+  不小于 min_bytes 时压缩。已经带 Content-Encoding 或 ETag 的响应（例如预先压缩的静态文件）
+  不再处理。一次发送的响应体按 _SLICE 分片压缩、逐片发送，不必在内存中再放一份完整的
+  压缩结果；大的分片在线程中压缩（zlib 和 zstd 压缩时释放 GIL），不阻塞事件循环。
+  流式响应的每一块压缩后立即 flush，客户端仍然能边收边处理
+- 请求体：Content-Encoding 为 gzip 或 zstd 时边读边解压，每次交给下游最多 _SLICE 字节，
+  并去掉 Content-Encoding 和 Content-Length。注册在准入控制之外，请求体大小的限制和限流
+  都按解压后的字节数计算，下游读到上限就不再读取，解压炸弹不会一次展开到内存里。
+  不支持的编码返回 415，数据损坏返回 400
+"""
+
+import json
+import zlib
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard 是可选依赖
+    zstandard = None
+
+# 服务端支持的编码，按优先顺序
+ENCODINGS = ('zstd', 'gzip') if zstandard is not None else ('gzip',)
+
+# 压缩的内容类型（前缀）
+_COMPRESSIBLE = ('application/json', 'application/x-ndjson', 'text/')
+# 响应体每次压缩、请求体每次交给下游的字节数；不小于这个大小的分片在线程中压缩
+_SLICE = 256 * 1024
+# zstd 解压时每次从请求体取的字节数
+_ZSTD_INPUT = 16 * 1024
+
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    """Accept-Encoding -> {编码: q 值}（小写）"""
+    accepted = {}
+    for item in header.split(','):
+        name, _, parameters = item.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        parameter = parameters.strip()
+        if parameter.startswith('q='):
+            try:
+                quality = float(parameter[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+
+def choose_encoding(header: Optional[str], available: Iterable[str]) -> Optional[str]:
+    """按 Accept-Encoding 从 available（按服务端优先顺序）中选择编码，None 表示不压缩"""
+    if not header:
+        return None
+    accepted = accepted_encodings(header)
+    best, best_quality = None, 0.0
+    for encoding in available:
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class Compressor:
+    """流式压缩：compress 返回目前能输出的部分，flush 输出已输入的全部内容（流不结束），finish 结束"""
+
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == 'zstd':
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        if self.encoding == 'zstd':
+            return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class ContentEncodingError(ValueError):
+    """请求体无法解压"""
+
+
+class _ZstdFrames:
+    """只读 zstd 的帧头和块头（不解压），跟踪输入是否停在一帧的末尾，用来发现截断的请求体"""
+
+    def __init__(self):
+        self.frames = 0
+        self.invalid = False
+        self._state = 'magic'
+        self._needed = 4
+        self._field = b''
+        self._skip = 0
+        self._checksum = 0
+
+    @property
+    def complete(self) -> bool:
+        return (self.frames > 0 and not self.invalid and self._state == 'magic'
+                and not self._field and not self._skip)
+
+    def feed(self, data: bytes) -> None:
+        position = 0
+        while position < len(data) and not self.invalid:
+            if self._skip:
+                step = min(self._skip, len(data) - position)
+                self._skip -= step
+                position += step
+                continue
+            take = min(self._needed - len(self._field), len(data) - position)
+            self._field += data[position:position + take]
+            position += take
+            if len(self._field) == self._needed:
+                field, self._field = self._field, b''
+                self._advance(int.from_bytes(field, 'little'))
+
+    def _advance(self, value: int) -> None:
+        if self._state == 'magic':
+            if value & 0xFFFFFFF0 == 0x184D2A50:
+                self._state, self._needed = 'skippable', 4
+            elif value == 0xFD2FB528:
+                self._state, self._needed = 'descriptor', 1
+            else:
+                self.invalid = True
+        elif self._state == 'skippable':
+            self._skip = value
+            self._state, self._needed = 'magic', 4
+        elif self._state == 'descriptor':
+            single_segment = value >> 5 & 1
+            self._checksum = 4 if value >> 2 & 1 else 0
+            # 跳过窗口描述符、字典 ID 和内容大小
+            self._skip = (not single_segment) + (0, 1, 2, 4)[value & 3] + (single_segment, 2, 4, 8)[value >> 6]
+            self._state, self._needed = 'block', 3
+        else:
+            kind = value >> 1 & 3
+            if kind == 3:
+                self.invalid = True
+                return
+            # RLE 块的内容只有 1 字节，其他块的大小字段就是内容的字节数
+            self._skip = 1 if kind == 1 else value >> 3
+            if value & 1:
+                self._skip += self._checksum
+                self.frames += 1
+                self._state, self._needed = 'magic', 4
+
+
+class _ZstdInput:
+    """stream_reader 的输入源：请求体还没到时抛出 BlockingIOError，请求体结束后返回 b''
+
+    read1 只在还没有任何输出时才向输入源要数据，这时抛出异常不会丢掉已经解压的内容。
+    """
+
+    def __init__(self):
+        self.data = b''
+        self.position = 0
+        self.finished = False
+        self.frames = _ZstdFrames()
+
+    def feed(self, data: bytes, final: bool) -> None:
+        self.data = self.data[self.position:] + data
+        self.position = 0
+        self.finished = final
+        self.frames.feed(data)
+
+    def read(self, size: int) -> bytes:
+        if self.position >= len(self.data):
+            if self.finished:
+                return b''
+            raise BlockingIOError
+        chunk = self.data[self.position:self.position + size]
+        self.position += len(chunk)
+        return chunk
+
+
+class Decompressor:
+    """流式解压：feed 输入一段压缩数据，read 每次最多输出 size 字节，需要更多输入时返回 b''"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == 'zstd':
+            # zstd 的 decompressobj 没有输出上限（几 KB 输入就能展开成上百 MB），用 stream_reader 按需读取
+            self._source = _ZstdInput()
+            self._reader = zstandard.ZstdDecompressor().stream_reader(self._source, read_size=_ZSTD_INPUT)
+        else:
+            # 47 = 32 + 15：自动识别 gzip 和 zlib 头
+            self._decompressor = zlib.decompressobj(47)
+            self._input = b''
+
+    @property
+    def complete(self) -> bool:
+        if self.encoding == 'zstd':
+            return self._source.frames.complete
+        return self._decompressor.eof
+
+    def feed(self, data: bytes, final: bool = False) -> None:
+        """final：请求体到此结束"""
+        if self.encoding == 'zstd':
+            self._source.feed(data, final)
+        else:
+            self._input += data
+
+    def read(self, size: int) -> bytes:
+        try:
+            if self.encoding != 'zstd':
+                output = self._decompressor.decompress(self._input, size)
+                self._input = self._decompressor.unconsumed_tail
+                return output
+            parts = []
+            total = 0
+            while total < size:
+                if self._source.finished:
+                    part = self._reader.read(size - total)
+                else:
+                    part = self._reader.read1(size - total)
+                if not part:
+                    break
+                parts.append(part)
+                total += len(part)
+            return b''.join(parts)
+        except BlockingIOError:
+            return b''.join(parts)
+        except (zlib.error, ValueError) as error:
+            raise ContentEncodingError("请求体解压失败") from error
+        except Exception as error:
+            if zstandard is not None and isinstance(error, zstandard.ZstdError):
+                raise ContentEncodingError("请求体解压失败") from error
+            raise
+
+
+def _header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[bytes]:
+    for key, value in headers:
+        if key == name:
+            return value
+    return None
+
+
+async def _reject(send: Callable, status: int, detail: str) -> None:
+    """与 HTTPException 相同格式的错误响应"""
+    body = json.dumps({'detail': detail}, ensure_ascii=False).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class CompressionMiddleware:
+    """响应压缩和请求体解压"""
+
+    def __init__(self, app, encodings: Iterable[str] = ENCODINGS, min_bytes: int = 1024, gzip_level: int = 6,
+                 zstd_level: int = 3):
+        self.app = app
+        self.encodings = tuple(encoding for encoding in encodings if encoding in ENCODINGS)
+        self.min_bytes = min_bytes
+        self.levels = {'gzip': gzip_level, 'zstd': zstd_level}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        headers = scope['headers']
+        content_encoding = _header(headers, b'content-encoding')
+        if content_encoding is not None:
+            encoding = content_encoding.decode('latin-1').strip().lower()
+            if encoding == 'identity':
+                pass
+            elif encoding not in ENCODINGS:
+                await _reject(send, 415, f"不支持的请求体编码: {encoding}（可选: {', '.join(ENCODINGS)}）")
+                return
+            else:
+                # 直接改原来的 scope（不复制），外层中间件还能看到路由写入的 endpoint 等信息
+                scope['headers'] = [(key, value) for key, value in headers
+                                    if key not in (b'content-encoding', b'content-length')]
+                receive = self._decompressing(receive, Decompressor(encoding))
+
+        accept = _header(headers, b'accept-encoding')
+        encoding = choose_encoding(accept.decode('latin-1') if accept is not None else None, self.encodings)
+        if encoding is not None:
+            send = _CompressingSend(self, send, encoding).send
+        elif content_encoding is None:
+            await self.app(scope, receive, send)
+            return
+        started = False
+
+        async def tracking(message):
+            nonlocal started
+            started = started or message['type'] == 'http.response.start'
+            await send(message)
+
+        try:
+            await self.app(scope, receive, tracking)
+        except ContentEncodingError as error:
+            if started:
+                raise
+            await _reject(send, 400, str(error))
+
+    @staticmethod
+    def _decompressing(receive: Callable, decompressor: Decompressor) -> Callable:
+        done = False
+        finished = False
+
+        async def decompressing():
+            nonlocal done, finished
+            if done:
+                return await receive()
+            while True:
+                body = decompressor.read(_SLICE)
+                if body:
+                    return {'type': 'http.request', 'body': body, 'more_body': True}
+                if finished:
+                    if not decompressor.complete:
+                        raise ContentEncodingError("请求体解压失败：数据不完整")
+                    done = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                message = await receive()
+                if message['type'] != 'http.request':
+                    return message
+                finished = not message.get('more_body', False)
+                decompressor.feed(message.get('body', b''), finished)
+
+        return decompressing
+
+
+class _CompressingSend:
+    """压缩一个响应：先看响应头和第一块响应体，决定是否压缩"""
+
+    def __init__(self, middleware: CompressionMiddleware, send: Callable, encoding: str):
+        self.middleware = middleware
+        self._send = send
+        self.encoding = encoding
+        self.start = None
+        self.compressor: Optional[Compressor] = None
+        self.passthrough = False
+
+    async def send(self, message) -> None:
+        if self.passthrough:
+            await self._send(message)
+            return
+        if message['type'] == 'http.response.start':
+            if not self._eligible(message):
+                self.passthrough = True
+                await self._send(message)
+                return
+            self.start = message
+            return
+        if message['type'] != 'http.response.body':
+            await self._send(message)
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+        if self.compressor is None:
+            if not more_body and len(body) < self.middleware.min_bytes:
+                self.passthrough = True
+                await self._send(self.start)
+                await self._send(message)
+                return
+            await self._start_compressing()
+        await self._compress(body, more_body)
+
+    def _eligible(self, message) -> bool:
+        if message['status'] < 200 or message['status'] in (204, 304):
+            return False
+        headers = message.get('headers', [])
+        content_type = _header(headers, b'content-type')
+        if content_type is None or not content_type.decode('latin-1').startswith(_COMPRESSIBLE):
+            return False
+        if _header(headers, b'content-encoding') is not None or _header(headers, b'etag') is not None:
+            return False
+        length = _header(headers, b'content-length')
+        return length is None or int(length) >= self.middleware.min_bytes
+
+    async def _start_compressing(self) -> None:
+        headers = [(key, value) for key, value in self.start.get('headers', []) if key != b'content-length']
+        vary = _header(headers, b'vary')
+        if vary is None:
+            headers.append((b'vary', b'Accept-Encoding'))
+        elif b'accept-encoding' not in vary.lower():
+            headers = [(key, value + b', Accept-Encoding' if key == b'vary' else value) for key, value in headers]
+        headers.append((b'content-encoding', self.encoding.encode()))
+        self.compressor = Compressor(self.encoding, self.middleware.levels[self.encoding])
+        await self._send({**self.start, 'headers': headers})
+
+    async def _compress(self, body: bytes, more_body: bool) -> None:
+        compressor = self.compressor
+        for start in range(0, len(body), _SLICE):
+            piece = body[start:start + _SLICE]
+            if len(piece) >= _SLICE:
+                output = await run_in_threadpool(compressor.compress, piece)
+            else:
+                output = compressor.compress(piece)
+            await self._write(output, True)
+        if more_body:
+            # 流式响应：已收到的内容立即发给客户端
+            await self._write(compressor.flush(), True)
+        else:
+            await self._write(compressor.finish(), False)
+
+    async def _write(self, data: bytes, more_body: bool) -> None:
+        if data or not more_body:
+            await self._send({'type': 'http.response.body', 'body': data, 'more_body': more_body})
@@ -0,0 +1,529 @@
+"""
+增量清理：文档保存在服务端，编辑后只重新清理受影响的段落
+
+文档按 StreamCleaner 的规则在每个安全的空行处切成段落块，每块缓存：
+- 非行阶段（编码、HTML、Markdown、断行、空格、标点、引号）的清理结果
+- 与前面的块拼接后得到的完整行，以及拼接前的状态（尚未完成的最后一行、待处理的空白）
+- 重复行删除和 AI 标记清理之后的输出
+
+编辑时从编辑位置的前一块开始重新分块和清理，直到分块点回到原来的位置，
+再继续拼接到拼接状态与原来一致为止；内容没变的块直接复用清理结果。
+重复行删除使用全文的行索引（行哈希 -> 含有该行的块，按位置排序），只重新输出
+“第一次出现的位置”改变了的块。清理耗时随编辑涉及的段落大小增长，与文档长度无关；
+只有块的偏移量和序号按块数线性更新。
+
+输出与整篇清理（/api/clean）一致，但：
+- 语言只在创建文档时检测一次
+- 重复行按行的 64 位哈希比较（同 hashed 去重模式）
+- 文档中有未闭合的 Markdown/HTML 标记时，之后的部分不能分块，编辑会重新清理到文末
+"""
+
+import sys
+import threading
+import time
+import uuid
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, OrderedDict
+from itertools import accumulate
+from typing import Any, Dict, List, Optional, Tuple
+
+from stream_cleaner import iter_paragraph_cuts, join_cleaned, run_block_stages
+from text_stats import count_words
+
+Edit = Tuple[int, int, str]
+
+# 拼接状态：(尚未完成的最后一行，还没有内容时为 None；待处理的空白)
+_JoinState = Tuple[Optional[str], str]
+_INITIAL_STATE: _JoinState = (None, '')
+
+
+class DocumentNotFoundError(KeyError):
+    """文档不存在或已过期"""
+
+
+class VersionConflictError(Exception):
+    """编辑基于的版本不是文档的当前版本"""
+
+    def __init__(self, version: int):
+        super().__init__(f"文档已更新到版本 {version}")
+        self.version = version
+
+
+class _Block:
+    """一个段落块：原文 = content + gap"""
+
+    __slots__ = ('content', 'gap', 'staged', 'stage_changes', 'index', 'before', 'lines', 'keys', 'join_changes',
+                 'kept', 'output', 'dropped', 'ai_changed', 'source_stats', 'output_stats', 'nbytes')
+
+    def __init__(self, content: str, gap: str):
+        self.content = content
+        self.gap = gap
+        self.staged = ''
+        self.stage_changes: frozenset = frozenset()
+        self.index = 0
+        self.before: _JoinState = _INITIAL_STATE
+        self.lines: List[str] = []
+        self.keys: List[Optional[int]] = []
+        self.join_changes: frozenset = frozenset()
+        self.kept: List[str] = []
+        self.output = ''
+        self.dropped = 0
+        self.ai_changed = False
+        source = content + gap
+        self.source_stats = (len(source), source.count('\n'), count_words(source))
+        self.output_stats = (0, 0, 0)
+        self.nbytes = 0
+
+    @property
+    def source(self) -> str:
+        return self.content + self.gap
+
+
+class IncrementalDocument:
+    """可以按原文位置编辑、并增量更新清理结果的文档"""
+
+    def __init__(self, cleaner, text: str, options: Optional[Dict[str, bool]] = None, language: Optional[str] = None):
+        if not text.strip():
+            raise ValueError("输入文本不能为空")
+        self.language = language or cleaner.detect_language(text)
+        self.options = options
+        self.version = 0
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        plan = cleaner.get_plan(options, self.language)
+        self._plan = plan
+        self._names = {name for name, _, _ in plan}
+        self._cleaner = cleaner
+        self._dedup = 'remove_duplicates' in self._names
+        self._fix_ai = next((stage for name, stage, _ in plan if name == 'fix_ai_artifacts'), None)
+        self._blocks: List[_Block] = []
+        # 行哈希 -> 含有该行的块（按 index 排序）
+        self._index: Dict[int, List[_Block]] = {}
+        # 阶段名 -> 被它改动过的块数
+        self._change_counts: Counter = Counter()
+        self._source_totals = [0, 0, 0]
+        self._output_totals = [0, 0, 0]
+        self._content_blocks = 0
+        self.nbytes = 0
+        self.edit(0, 0, text)
+        self.version = 0
+
+    @property
+    def length(self) -> int:
+        """原文长度（字符）"""
+        return self._source_totals[0]
+
+    @property
+    def text(self) -> str:
+        return ''.join(block.source for block in self._blocks)
+
+    @property
+    def cleaned_text(self) -> str:
+        return ''.join(block.output for block in self._blocks)
+
+    @property
+    def changes_made(self) -> List[str]:
+        return [change for name, _, change in self._plan if self._change_counts[name]]
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """与 /api/clean 的 stats 相同的统计"""
+        original_length, original_newlines, original_words = self._source_totals
+        cleaned_length, cleaned_newlines, cleaned_words = self._output_totals
+        return {
+            'original_length': original_length,
+            'cleaned_length': cleaned_length,
+            'chars_removed': original_length - cleaned_length,
+            'original_lines': original_newlines + 1,
+            'cleaned_lines': cleaned_newlines + 1,
+            'original_words': original_words,
+            'cleaned_words': cleaned_words,
+        }
+
+    def edit(self, start: int, end: int, text: str) -> List[Edit]:
+        """把原文 [start, end) 替换为 text，返回清理结果的编辑脚本
+
+        编辑脚本是 [(起点, 终点, 替换文本)]，位置是编辑前清理结果的字符下标（同 response_encoding.apply_edits）。
+        编辑后全文为空白时抛出 ValueError，文档保持不变。
+        """
+        if not 0 <= start <= end <= self.length:
+            raise ValueError(f"编辑范围 [{start}, {end}) 超出文档长度 {self.length}")
+        blocks = self._blocks
+        ends = list(accumulate(block.source_stats[0] for block in blocks))
+        if blocks:
+            first = min(bisect_right(ends, start), len(blocks) - 1)
+            last = min(bisect_right(ends, end - 1), len(blocks) - 1) if end > start else first
+        else:
+            first = last = 0
+        # 编辑位置前一块的结尾可能随编辑改变（连字符、空白），从前一块开始重新分块
+        s = max(0, first - 1)
+        region_start = ends[s - 1] if s else 0
+        new_blocks, stop = self._resegment(s, last, start - region_start, end - region_start, text)
+        removed = blocks[s:stop]
+
+        content_blocks = (self._content_blocks - sum(1 for block in removed if block.content.strip())
+                          + sum(1 for block in new_blocks if block.content.strip()))
+        if not content_blocks:
+            raise ValueError("输入文本不能为空")
+        self._content_blocks = content_blocks
+
+        old_starts = [0]
+        old_starts.extend(accumulate(block.output_stats[0] for block in blocks))
+        touched: Dict[int, Optional[_Block]] = {}
+        for block in removed:
+            self._unindex(block, touched)
+            self._forget(block)
+            block.index = -1
+        blocks[s:stop] = new_blocks
+        for index in range(s, len(blocks)):
+            blocks[index].index = index
+        for block in new_blocks:
+            self._add_stats(block.source_stats, self._source_totals)
+            for name in block.stage_changes:
+                self._change_counts[name] += 1
+
+        dirty = set(range(s, s + len(new_blocks)))
+        if s < len(blocks):
+            dirty.add(s)
+        elif blocks:
+            dirty.add(len(blocks) - 1)
+        self._rejoin(s, removed[0].before if removed else _INITIAL_STATE, new_blocks, dirty, touched)
+        if self._dedup:
+            for key, previous_first in touched.items():
+                occurrences = self._index.get(key)
+                current_first = occurrences[0] if occurrences else None
+                if current_first is not previous_first:
+                    for block in (previous_first, current_first):
+                        if block is not None and block.index >= 0:
+                            dirty.add(block.index)
+        edits = self._render(dirty, s, len(new_blocks), len(removed), old_starts)
+        self.version += 1
+        self.last_used = time.monotonic()
+        return edits
+
+    def _resegment(self, s: int, last: int, edit_start: int, edit_end: int, text: str) -> Tuple[List[_Block], int]:
+        """重新分块：从第 s 块开始，到分块点回到原来某块的结尾为止
+
+        返回新块和被替换的原块范围终点（不含）。原文没有变化的块复用清理结果。
+        """
+        blocks = self._blocks
+        delta = len(text) - (edit_end - edit_start)
+        stop = min(last + 2, len(blocks))
+        region = ''.join(block.source for block in blocks[s:stop])
+        region = region[:edit_start] + text + region[edit_end:]
+        new_end = edit_start + len(text)
+        extra = 1
+        while True:
+            # 编辑之后原来各块的结尾在 region 中的位置 -> 块序号
+            boundaries = {}
+            position = sum(block.source_stats[0] for block in blocks[s:last]) + delta
+            for index in range(last, stop):
+                position += blocks[index].source_stats[0]
+                boundaries[position] = index
+            cuts = []
+            converged = None
+            for gap_start, cut_start, cut_end, safe in iter_paragraph_cuts(region, self._names):
+                if not safe:
+                    continue
+                cuts.append((cut_start, cut_end))
+                if gap_start > new_end and cut_end in boundaries:
+                    converged = boundaries[cut_end]
+                    break
+            if converged is not None or stop == len(blocks):
+                break
+            # 没有回到原来的分块点（例如编辑改变了标记是否闭合），再多包含几块
+            region += ''.join(block.source for block in blocks[stop:stop + extra])
+            stop = min(stop + extra, len(blocks))
+            extra *= 2
+
+        staged = {block.content: block for block in blocks[s:stop]}
+        new_blocks = []
+        position = 0
+        for cut_start, cut_end in cuts:
+            new_blocks.append(self._make_block(region[position:cut_start], region[cut_start:cut_end], staged))
+            position = cut_end
+        if converged is None:
+            new_blocks.append(self._make_block(region[position:], '', staged))
+            return new_blocks, stop
+        return new_blocks, converged + 1
+
+    def _make_block(self, content: str, gap: str, staged: Dict[str, _Block]) -> _Block:
+        """新块：内容与原来某块相同时复用非行阶段的结果，否则清理"""
+        block = _Block(content, gap)
+        previous = staged.get(content)
+        if previous is not None:
+            block.staged, block.stage_changes = previous.staged, previous.stage_changes
+            return block
+        changes = set()
+        block.staged = run_block_stages(self._cleaner, self._plan, content, changes)
+        block.stage_changes = frozenset(changes)
+        return block
+
+    def _rejoin(self, s: int, state: _JoinState, new_blocks: List[_Block], dirty: set,
+                touched: Dict[int, Optional[_Block]]) -> None:
+        """从第 s 块开始（拼接状态为 state）重新拼接，直到拼接状态与原来一致"""
+        blocks = self._blocks
+        new = set(map(id, new_blocks))
+        index = s
+        while index < len(blocks):
+            block = blocks[index]
+            if id(block) not in new and block.before == state:
+                break
+            block.before = state
+            (lines, join_changes), state = self._advance(block, state, with_lines=True)
+            if index == len(blocks) - 1 and state[0] is not None:
+                lines.append(state[0])
+            if id(block) in new or lines != block.lines or join_changes != block.join_changes:
+                if id(block) not in new:
+                    self._unindex(block, touched)
+                for name in block.join_changes:
+                    self._change_counts[name] -= 1
+                block.lines = lines
+                block.join_changes = join_changes
+                for name in join_changes:
+                    self._change_counts[name] += 1
+                block.keys = [hash(line.strip()) if line.strip() else None for line in lines]
+                self._index_block(block, touched)
+                dirty.add(index)
+            index += 1
+
+    def _advance(self, block: _Block, state: _JoinState, with_lines: bool = False):
+        """与 StreamCleaner.append 相同的拼接：返回 ((完整的行, 改动了块间空白的阶段), 新状态)"""
+        tail, pending = state
+        content = block.staged
+        if not content.strip():
+            return ([], frozenset()), (tail, pending + content + block.gap)
+        changes = set() if with_lines else None
+        joined = join_cleaned(self._plan, tail or '', pending, content, changes)
+        lines_end = joined.rfind('\n') + 1
+        lines = joined[:lines_end - 1].split('\n') if with_lines and lines_end else []
+        return (lines, frozenset(changes or ())), (joined[lines_end:], block.gap)
+
+    def _index_block(self, block: _Block, touched: Dict[int, Optional[_Block]]) -> None:
+        if not self._dedup:
+            return
+        for key in set(block.keys):
+            if key is None:
+                continue
+            occurrences = self._index.setdefault(key, [])
+            if key not in touched:
+                touched[key] = occurrences[0] if occurrences else None
+            insort(occurrences, block, key=_block_index)
+
+    def _unindex(self, block: _Block, touched: Dict[int, Optional[_Block]]) -> None:
+        if not self._dedup:
+            return
+        for key in set(block.keys):
+            if key is None:
+                continue
+            occurrences = self._index[key]
+            if key not in touched:
+                touched[key] = occurrences[0]
+            del occurrences[bisect_left(occurrences, block.index, key=_block_index)]
+            if not occurrences:
+                del self._index[key]
+
+    def _forget(self, block: _Block) -> None:
+        """从汇总中去掉一个被替换的块"""
+        self._subtract_stats(block.source_stats, self._source_totals)
+        self._subtract_stats(block.output_stats, self._output_totals)
+        self.nbytes -= block.nbytes
+        # 与累加时一致：非行阶段和拼接分别计数
+        for name in block.stage_changes:
+            self._change_counts[name] -= 1
+        for name in block.join_changes:
+            self._change_counts[name] -= 1
+        self._change_counts['remove_duplicates'] -= bool(block.dropped)
+        self._change_counts['fix_ai_artifacts'] -= block.ai_changed
+
+    def _kept_lines(self, block: _Block) -> List[str]:
+        """删除重复行后保留的行"""
+        if not self._dedup:
+            return block.lines
+        kept = []
+        local = set()
+        for line, key in zip(block.lines, block.keys):
+            if key is None:
+                kept.append(line)
+            elif key not in local:
+                local.add(key)
+                if self._index[key][0] is block:
+                    kept.append(line)
+        return kept
+
+    def _eats_newline(self, line: str) -> bool:
+        """AI 标记清理会删掉这一行之后的换行（行尾是代码块标记）"""
+        return self._fix_ai is not None and '```' in line and not self._fix_ai(line + '\n').endswith('\n')
+
+    def _render(self, dirty: set, s: int, new_count: int, removed_count: int, old_starts: List[int]) -> List[Edit]:
+        """重新输出受影响的块，返回清理结果的编辑脚本"""
+        blocks = self._blocks
+        for index in dirty:
+            blocks[index].kept = self._kept_lines(blocks[index])
+
+        # 扩展成若干连续范围：包括前后有输出的块，以及跨块的代码块标记组
+        runs = []
+        for index in sorted(dirty):
+            start = end = index
+            previous = self._previous_nonempty(start)
+            while previous is not None:
+                start = previous
+                previous = self._previous_nonempty(start)
+                if previous is None or not self._eats_newline(blocks[previous].kept[-1]):
+                    break
+            following = self._next_nonempty(end)
+            while following is not None:
+                end = following
+                if not self._eats_newline(blocks[end].kept[-1]):
+                    break
+                following = self._next_nonempty(end)
+            runs.append([start, end + 1])
+        runs.append([s, s + new_count])
+        runs.sort()
+        merged = []
+        for run in runs:
+            if merged and run[0] <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], run[1])
+            else:
+                merged.append(run)
+
+        edits = []
+        shift = new_count - removed_count
+        for start, end in merged:
+            # 包含被替换部分的范围总是输出；其余范围只在输出变化时输出
+            splice = start <= s and s + new_count <= end
+            old_output = '' if splice else ''.join(blocks[index].output for index in range(start, end))
+            self._render_run(start, end)
+            replacement = ''.join(blocks[index].output for index in range(start, end))
+            if not splice and replacement == old_output:
+                continue
+            old_start = old_starts[start if start <= s else start - shift]
+            old_end = old_starts[end if end <= s else end - shift]
+            edits.append((old_start, old_end, replacement))
+        return edits
+
+    def _render_run(self, start: int, end: int) -> None:
+        """输出 [start, end) 中的块；AI 标记清理按“被代码块标记连接起来的行”分组执行"""
+        blocks = self._blocks
+        final = self._next_nonempty(end - 1) is None
+        group: List[str] = []
+        owner = None
+        outputs: Dict[int, List[str]] = {index: [] for index in range(start, end)}
+        last_index, last_line = None, None
+        for index in range(start, end):
+            kept = blocks[index].kept
+            if kept:
+                last_index, last_line = index, len(kept) - 1
+        for index in range(start, end):
+            for position, line in enumerate(blocks[index].kept):
+                if owner is None:
+                    owner = index
+                group.append(line)
+                is_last = index == last_index and position == last_line
+                if is_last or not self._eats_newline(line):
+                    outputs[owner].append('\n'.join(group) + ('' if is_last and final else '\n'))
+                    group = []
+                    owner = None
+        for index in range(start, end):
+            block = blocks[index]
+            self._subtract_stats(block.output_stats, self._output_totals)
+            self.nbytes -= block.nbytes
+            self._change_counts['remove_duplicates'] -= bool(block.dropped)
+            self._change_counts['fix_ai_artifacts'] -= block.ai_changed
+            output = ''.join(outputs[index])
+            cleaned = self._fix_ai(output) if self._fix_ai is not None else output
+            block.ai_changed = cleaned != output
+            block.output = cleaned
+            block.dropped = len(block.lines) - len(block.kept)
+            block.output_stats = (len(cleaned), cleaned.count('\n'), count_words(cleaned))
+            self._add_stats(block.output_stats, self._output_totals)
+            block.nbytes = _block_nbytes(block)
+            self.nbytes += block.nbytes
+            self._change_counts['remove_duplicates'] += bool(block.dropped)
+            self._change_counts['fix_ai_artifacts'] += block.ai_changed
+
+    def _previous_nonempty(self, index: int) -> Optional[int]:
+        """index 之前最近的有输出行的块"""
+        for previous in range(index - 1, -1, -1):
+            if self._blocks[previous].kept:
+                return previous
+        return None
+
+    def _next_nonempty(self, index: int) -> Optional[int]:
+        """index 之后最近的有输出行的块"""
+        for following in range(index + 1, len(self._blocks)):
+            if self._blocks[following].kept:
+                return following
+        return None
+
+    @staticmethod
+    def _add_stats(stats, totals: List[int]) -> None:
+        for position, value in enumerate(stats):
+            totals[position] += value
+
+    @staticmethod
+    def _subtract_stats(stats, totals: List[int]) -> None:
+        for position, value in enumerate(stats):
+            totals[position] -= value
+
+
+def _block_index(block: _Block) -> int:
+    return block.index
+
+
+def _block_nbytes(block: _Block) -> int:
+    """块中缓存的文本大致占用的字节数"""
+    return (sys.getsizeof(block.content) + sys.getsizeof(block.staged) + sys.getsizeof(block.output)
+            + sum(sys.getsizeof(line) for line in block.lines))
+
+
+class DocumentStore:
+    """进程内的文档表：按最近使用淘汰，总大小不超过 max_bytes，闲置超过 ttl 秒的文档过期"""
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, ttl: float = 3600):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._documents: 'OrderedDict[str, IncrementalDocument]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, document: IncrementalDocument) -> str:
+        document_id = uuid.uuid4().hex
+        with self._lock:
+            self._documents[document_id] = document
+            self._evict()
+        return document_id
+
+    def get(self, document_id: str) -> IncrementalDocument:
+        with self._lock:
+            document = self._documents.get(document_id)
+            if document is None or time.monotonic() - document.last_used > self.ttl:
+                self._documents.pop(document_id, None)
+                raise DocumentNotFoundError(document_id)
+            self._documents.move_to_end(document_id)
+            document.last_used = time.monotonic()
+            return document
+
+    def delete(self, document_id: str) -> None:
+        with self._lock:
+            if self._documents.pop(document_id, None) is None:
+                raise DocumentNotFoundError(document_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'documents': len(self._documents),
+                'bytes': sum(document.nbytes for document in self._documents.values()),
+            }
+
+    def _evict(self) -> None:
+        """淘汰过期和最久未使用的文档（保留最新加入的一个）"""
+        now = time.monotonic()
+        total = 0
+        for document_id, document in list(self._documents.items()):
+            if now - document.last_used > self.ttl:
+                del self._documents[document_id]
+            else:
+                total += document.nbytes
+        while total > self.max_bytes and len(self._documents) > 1:
+            _, document = self._documents.popitem(last=False)
+            total -= document.nbytes
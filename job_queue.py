@@ -0,0 +1,430 @@
+"""
+大批量清理任务：提交后在后台分块清理，进度和结果保存在 sqlite 文件中
+
+- 提交：请求体是 NDJSON，每行是一个字符串或 {"text": "...", "id": ...}，边读边写入数据库
+- 执行：JobRunner 在事件循环中轮流取出各个任务的下一块待清理文本，
+  交给 CleanExecutor（线程池/进程池并行）；执行器繁忙时等待后重试，让交互请求优先
+- 结果：按输入顺序分页读取，或以 NDJSON 流式读取
+- 多进程：每个进程（JobStore）有自己的 owner，条目先用一条 UPDATE … RETURNING 原子地认领再清理，
+  只保存自己认领的条目，多个 worker 共用一个数据库文件时不会重复清理或重复计数。
+  后台任务定期写入心跳；进程退出（或心跳超过 lease 秒）后，它认领的条目可以被其他进程重新认领，
+  它正在接收的上传标记为失败
+- 重启：未清理完的任务从没有结果的条目继续
+
+清理完成的条目只保存按响应模式生成的结果，原文随即清空以节省空间。
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from clean_executor import ExecutorBusyError
+
+# receiving: 正在上传；queued/running: 等待或正在清理；completed/failed/cancelled: 已结束
+JOB_STATUSES = ('receiving', 'queued', 'running', 'completed', 'failed', 'cancelled')
+ACTIVE_STATUSES = ('queued', 'running')
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+
+_EMPTY_TEXT_ERROR = "输入文本不能为空"
+
+logger = logging.getLogger(__name__)
+
+
+class JobNotFoundError(KeyError):
+    """任务不存在"""
+
+
+class JobStore:
+    """任务和条目的 sqlite 存储"""
+
+    def __init__(self, path: str):
+        self.path = path
+        # 本进程认领条目、接收上传时的标识
+        self.owner = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                options TEXT,
+                language TEXT,
+                response_mode TEXT NOT NULL,
+                total INTEGER NOT NULL DEFAULT 0,
+                done INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL,
+                owner TEXT
+            );
+            CREATE TABLE IF NOT EXISTS items (
+                job_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                ref TEXT,
+                text TEXT,
+                result TEXT,
+                error TEXT,
+                owner TEXT,
+                PRIMARY KEY (job_id, idx)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS runners (
+                owner TEXT PRIMARY KEY,
+                heartbeat REAL NOT NULL
+            );
+        """)
+        # 旧版本的数据库没有 owner 列
+        for table in ('jobs', 'items'):
+            columns = {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+            if 'owner' not in columns:
+                self._conn.execute(f"ALTER TABLE {table} ADD COLUMN owner TEXT")
+        # 只索引没有结果的条目，认领时不必扫描已经清理完的条目
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS items_unfinished ON items (job_id, idx) WHERE result IS NULL AND error IS NULL"
+        )
+
+    @contextmanager
+    def _transaction(self):
+        """加锁并在一个事务中执行（连接是自动提交模式，需要显式 BEGIN）
+
+        BEGIN IMMEDIATE 在开始时就取得写锁，其他进程同时写入时按 timeout 等待，而不是在事务中途失败。
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def create(self, options: Optional[Dict[str, bool]], language: Optional[str], response_mode: str) -> str:
+        """新建一个正在上传的任务，返回任务 id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, options, language, response_mode, created, updated, owner) "
+                "VALUES (?, 'receiving', ?, ?, ?, ?, ?, ?)",
+                (job_id, json.dumps(options) if options is not None else None, language, response_mode, now, now,
+                 self.owner),
+            )
+        return job_id
+
+    def add_items(self, job_id: str, start: int, items: List[Tuple[Any, str]]) -> None:
+        """写入一批 (id, 文本)，下标从 start 开始"""
+        rows = [
+            (job_id, start + offset, json.dumps(ref, ensure_ascii=False) if ref is not None else None, text)
+            for offset, (ref, text) in enumerate(items)
+        ]
+        with self._transaction():
+            self._conn.executemany("INSERT INTO items (job_id, idx, ref, text) VALUES (?, ?, ?, ?)", rows)
+            self._conn.execute(
+                "UPDATE jobs SET total = total + ?, updated = ? WHERE id = ?", (len(rows), time.time(), job_id)
+            )
+
+    def set_status(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = COALESCE(?, error), updated = ? WHERE id = ?",
+                (status, error, time.time(), job_id),
+            )
+
+    def get(self, job_id: str) -> Dict[str, Any]:
+        """任务状态和进度"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, options, language, response_mode, total, done, failed, error, created, updated "
+                "FROM jobs WHERE id = ?", (job_id,),
+            ).fetchone()
+        if row is None:
+            raise JobNotFoundError(job_id)
+        job_id, status, options, language, response_mode, total, done, failed, error, created, updated = row
+        return {
+            'job_id': job_id,
+            'status': status,
+            'options': json.loads(options) if options else None,
+            'language': language,
+            'response_mode': response_mode,
+            'total': total,
+            'done': done,
+            'failed': failed,
+            'progress': round((done + failed) / total, 4) if total else 0.0,
+            'error': error,
+            'created': created,
+            'updated': updated,
+        }
+
+    def active_jobs(self) -> List[str]:
+        """等待或正在清理的任务，按提交时间排序"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created", ACTIVE_STATUSES
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def claim_items(self, job_id: str, limit: int, lease: float) -> List[Tuple[int, str]]:
+        """认领最多 limit 个还没有结果、也没有被存活进程认领的条目，返回 [(下标, 文本), ...]
+
+        一条 UPDATE … RETURNING（sqlite 3.35+）完成查找和认领，多个进程同时认领时不会取到同一个条目。
+        认领者的心跳超过 lease 秒的条目视为没有被认领。
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "UPDATE items SET owner = ? WHERE job_id = ? AND idx IN ("
+                "  SELECT idx FROM items WHERE job_id = ? AND result IS NULL AND error IS NULL AND ("
+                "    owner IS NULL OR owner NOT IN (SELECT owner FROM runners WHERE heartbeat >= ?))"
+                "  ORDER BY idx LIMIT ?"
+                ") RETURNING idx, text",
+                (self.owner, job_id, job_id, time.time() - lease, limit),
+            ).fetchall()
+        return sorted(rows)
+
+    def release_items(self, job_id: str, indexes: List[int]) -> None:
+        """放弃认领（清理失败或执行器繁忙时），条目可以再被认领"""
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE items SET owner = NULL WHERE job_id = ? AND idx = ? AND owner = ?",
+                [(job_id, index, self.owner) for index in indexes],
+            )
+
+    def unfinished(self, job_id: str) -> int:
+        """还没有结果的条目数（包括其他进程认领、正在清理的条目）"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM items WHERE job_id = ? AND result IS NULL AND error IS NULL", (job_id,),
+            ).fetchone()[0]
+
+    def save_results(self, job_id: str, rows: List[Tuple[int, Optional[str], Optional[str]]]) -> None:
+        """保存一批 (下标, 结果 JSON, 错误)，并更新任务进度
+
+        只写入本进程认领、还没有结果的条目，进度按实际写入的条数累加。
+        """
+        update = ("UPDATE items SET result = ?, error = ?, text = NULL WHERE job_id = ? AND idx = ? "
+                  "AND owner = ? AND result IS NULL AND error IS NULL")
+        with self._transaction():
+            done = self._conn.executemany(
+                update, [(result, None, job_id, index, self.owner) for index, result, _ in rows if result is not None],
+            ).rowcount
+            failed = self._conn.executemany(
+                update, [(None, error, job_id, index, self.owner) for index, result, error in rows if result is None],
+            ).rowcount
+            self._conn.execute(
+                "UPDATE jobs SET done = done + ?, failed = failed + ?, updated = ? WHERE id = ?",
+                (done, failed, time.time(), job_id),
+            )
+
+    def results(self, job_id: str, offset: int, limit: int) -> List[Dict[str, Any]]:
+        """按输入顺序读取已经清理完的条目"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT idx, ref, result, error FROM items "
+                "WHERE job_id = ? AND idx >= ? AND (result IS NOT NULL OR error IS NOT NULL) "
+                "ORDER BY idx LIMIT ?", (job_id, offset, limit),
+            ).fetchall()
+        records = []
+        for index, ref, result, error in rows:
+            record = {'index': index}
+            if ref is not None:
+                record['id'] = json.loads(ref)
+            if result is not None:
+                record['result'] = json.loads(result)
+            else:
+                record['error'] = error
+            records.append(record)
+        return records
+
+    def delete(self, job_id: str) -> None:
+        with self._transaction():
+            self._conn.execute("DELETE FROM items WHERE job_id = ?", (job_id,))
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def heartbeat(self) -> None:
+        """记录本进程仍然存活"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO runners (owner, heartbeat) VALUES (?, ?) "
+                "ON CONFLICT (owner) DO UPDATE SET heartbeat = excluded.heartbeat",
+                (self.owner, time.time()),
+            )
+
+    def recover(self, lease: float) -> None:
+        """心跳超过 lease 秒的进程正在接收的上传标记为失败（其他进程仍在接收的上传不受影响）
+
+        它们认领的条目由 claim_items 重新认领，正在清理的任务由 JobRunner 继续。
+        """
+        expired = time.time() - lease
+        with self._transaction():
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = '上传中断', updated = ? WHERE status = 'receiving' AND ("
+                "  owner IS NULL OR owner NOT IN (SELECT owner FROM runners WHERE heartbeat >= ?))",
+                (time.time(), expired),
+            )
+            self._conn.execute("DELETE FROM runners WHERE heartbeat < ?", (expired,))
+
+    def retire(self) -> None:
+        """进程退出时调用：放弃所有认领，删除心跳，其他进程可以立即接手"""
+        with self._lock:
+            self._conn.execute("UPDATE items SET owner = NULL WHERE owner = ? AND result IS NULL AND error IS NULL",
+                               (self.owner,))
+            self._conn.execute("DELETE FROM runners WHERE owner = ?", (self.owner,))
+
+    def purge(self, older_than: float) -> int:
+        """删除在 older_than（时间戳）之前结束的任务，返回删除的任务数"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?, ?) AND updated < ?", (*FINISHED_STATUSES, older_than)
+            ).fetchall()
+        for (job_id,) in rows:
+            self.delete(job_id)
+        return len(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class JobRunner:
+    """在后台依次清理各个任务的条目"""
+
+    def __init__(self, store: JobStore, executor, shape: Callable[[Any, str], Dict[str, Any]],
+                 chunk_size: int = 64, retry_delay: float = 1.0, ttl: float = 7 * 24 * 3600, lease: float = 60.0):
+        self.store = store
+        self.executor = executor
+        self.shape = shape
+        self.chunk_size = chunk_size
+        self.retry_delay = retry_delay
+        self.ttl = ttl
+        # 心跳超过这么多秒的进程视为已经退出
+        self.lease = lease
+        self._task: Optional[asyncio.Task] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+
+    def start(self) -> None:
+        """在当前事件循环中启动后台任务"""
+        self.store.heartbeat()
+        self.store.recover(self.lease)
+        self._wake = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        self._task = loop.create_task(self._run())
+        self._heartbeat_task = loop.create_task(self._heartbeat())
+
+    def notify(self) -> None:
+        """有新任务时唤醒后台任务"""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def stop(self) -> None:
+        for task in (self._task, self._heartbeat_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        if self._task is not None:
+            await asyncio.to_thread(self.store.retire)
+        self._task = self._heartbeat_task = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.store.heartbeat)
+            except Exception:
+                logger.exception("写入任务心跳失败")
+            await asyncio.sleep(self.lease / 4)
+
+    async def _run(self) -> None:
+        last_purge = 0.0
+        last_recover = time.time()
+        while True:
+            try:
+                now = time.time()
+                if now - last_purge > 3600:
+                    await asyncio.to_thread(self.store.purge, now - self.ttl)
+                    last_purge = now
+                if now - last_recover > self.lease:
+                    await asyncio.to_thread(self.store.recover, self.lease)
+                    last_recover = now
+                job_ids = await asyncio.to_thread(self.store.active_jobs)
+                if not job_ids:
+                    # 其他进程退出后留下的条目和上传也要处理，空闲时每隔 lease 秒检查一次
+                    self._wake.clear()
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), timeout=self.lease)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                # 每个任务每轮处理一块，多个任务同时进行时轮流推进
+                for job_id in job_ids:
+                    try:
+                        await self._process_chunk(job_id)
+                    except ExecutorBusyError:
+                        await asyncio.sleep(self.retry_delay)
+                    except JobNotFoundError:
+                        pass
+            except Exception:
+                # 例如 sqlite 出错：记录后稍等再继续，后台任务不能因为一次错误退出
+                logger.exception("后台任务执行出错")
+                await asyncio.sleep(self.retry_delay)
+
+    async def _process_chunk(self, job_id: str) -> None:
+        """认领并清理任务的下一块条目；所有条目都有结果时把任务标记为完成"""
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job['status'] not in ACTIVE_STATUSES:
+            return
+        items = await asyncio.to_thread(self.store.claim_items, job_id, self.chunk_size, self.lease)
+        if not items:
+            # 剩下的条目可能正由其他进程清理
+            if not await asyncio.to_thread(self.store.unfinished, job_id):
+                await asyncio.to_thread(self.store.set_status, job_id, 'completed')
+            return
+        try:
+            if job['status'] == 'queued':
+                await asyncio.to_thread(self.store.set_status, job_id, 'running')
+            rows = await self._clean_items(items, job['options'], job['language'], job['response_mode'])
+            # 清理期间任务可能已被取消或删除
+            if (await asyncio.to_thread(self.store.get, job_id))['status'] in ACTIVE_STATUSES:
+                await asyncio.to_thread(self.store.save_results, job_id, rows)
+        except Exception:
+            await asyncio.to_thread(self.store.release_items, job_id, [index for index, _ in items])
+            raise
+
+    async def _clean_items(self, items: List[Tuple[int, str]], options, language, response_mode: str):
+        """清理一块条目，返回 [(下标, 结果 JSON, 错误), ...]"""
+        rows = [(index, None, _EMPTY_TEXT_ERROR) for index, text in items if not text.strip()]
+        valid = [(index, text) for index, text in items if text.strip()]
+        try:
+            results = await self.executor.clean_many([text for _, text in valid], options, language)
+        except ExecutorBusyError:
+            raise
+        except Exception:
+            # 整块失败时逐条清理，找出出错的条目
+            results = []
+            for _, text in valid:
+                try:
+                    results.append(await self.executor.clean(text, options, language))
+                except ExecutorBusyError:
+                    raise
+                except Exception as e:
+                    results.append(e)
+        # 生成响应结果（diff 模式要计算编辑脚本）放到线程中执行
+        return rows + await asyncio.to_thread(self._shape_rows, valid, results, response_mode)
+
+    def _shape_rows(self, valid: List[Tuple[int, str]], results: list, response_mode: str):
+        rows = []
+        for (index, _), result in zip(valid, results):
+            if isinstance(result, Exception):
+                rows.append((index, None, f"文本处理错误: {result}"))
+            else:
+                rows.append((index, json.dumps(self.shape(result, response_mode), ensure_ascii=False), None))
+        return rows
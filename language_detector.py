@@ -0,0 +1,203 @@
+"""
+语言检测：检测成本与文本长度无关
+
+- 只看文本中均匀分布的若干个窗口拼成的样本（默认约 2KB）
+- 先按 Unicode 区块统计文字：中日韩、俄、阿拉伯、希伯来、泰文直接判定，不调用 langdetect
+- 其余文本交给 langdetect，固定随机种子保证结果稳定，并按样本缓存结果
+- 批量检测大量短文本时（detect_many），按文字区块不能判定的文本按顺序拼成约 2KB 的组，
+  每组只调用一次 langdetect；组内语言混杂（最可能的语言概率不够高）时对半拆开分别检测
+- langdetect 在第一次需要时才导入，并从磁盘加载全部语言的概率表（数百毫秒、几十 MB）；
+  warm_up() 可以提前完成加载，例如在启动后的后台线程里，或在 fork 工作进程之前的父进程里
+"""
+
+import os
+import re
+import sys
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence
+
+# 加载好的 langdetect 模块；加载由锁保护（langdetect 自己的 init_factory 并发调用时会重复加载）
+_langdetect = None
+_langdetect_lock = threading.Lock()
+
+
+def _reset_lock_in_child() -> None:
+    # 后台线程加载到一半时 fork 出的子进程会继承一把永远不会释放的锁和只加载了一部分的
+    # 概率表；换一把新锁并丢掉半成品，子进程需要时自己重新加载
+    global _langdetect_lock
+    _langdetect_lock = threading.Lock()
+    if _langdetect is None and 'langdetect.detector_factory' in sys.modules:
+        sys.modules['langdetect.detector_factory']._factory = None
+
+
+os.register_at_fork(after_in_child=_reset_lock_in_child)
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_LETTER_RE = re.compile(r'[^\W\d_]')
+
+# 各文字的 Unicode 区块
+_SCRIPT_RES: Dict[str, re.Pattern] = {
+    'han': re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff]'),
+    'kana': re.compile(r'[\u3040-\u30ff]'),
+    'hangul': re.compile(r'[\u1100-\u11ff\u3130-\u318f\uac00-\ud7af]'),
+    'cyrillic': re.compile(r'[\u0400-\u04ff]'),
+    'arabic': re.compile(r'[\u0600-\u06ff]'),
+    'hebrew': re.compile(r'[\u0590-\u05ff]'),
+    'thai': re.compile(r'[\u0e00-\u0e7f]'),
+}
+
+_SCRIPT_LANGUAGES = {
+    'hangul': 'ko',
+    'cyrillic': 'ru',
+    'arabic': 'ar',
+    'hebrew': 'he',
+    'thai': 'th',
+}
+
+
+def _load_langdetect():
+    """导入 langdetect 并加载语言概率表（只执行一次）"""
+    global _langdetect
+    if _langdetect is None:
+        with _langdetect_lock:
+            if _langdetect is None:
+                import langdetect
+                from langdetect import DetectorFactory
+                from langdetect.detector_factory import init_factory
+                # langdetect 默认每次随机初始化，固定种子后同一文本总是得到同一结果
+                DetectorFactory.seed = 0
+                init_factory()
+                _langdetect = langdetect
+    return _langdetect
+
+
+def warm_up() -> float:
+    """提前加载 langdetect，返回耗时（秒）；已经加载时几乎不耗时"""
+    start = time.perf_counter()
+    _load_langdetect()
+    return time.perf_counter() - start
+
+
+def is_loaded() -> bool:
+    """langdetect 的概率表是否已经加载"""
+    return _langdetect is not None
+
+
+class LanguageDetector:
+    """按样本检测语言，结果缓存"""
+
+    def __init__(self, windows: int = 8, window_size: int = 256, script_threshold: float = 0.5, cache_size: int = 4096,
+                 group_confidence: float = 0.99):
+        self.windows = windows
+        self.window_size = window_size
+        self.script_threshold = script_threshold
+        self.group_confidence = group_confidence
+        self._detect_sample = lru_cache(maxsize=cache_size)(self._detect_uncached)
+
+    def detect(self, text: str) -> str:
+        """检测文本语言，无法判断时返回 'unknown'"""
+        sample = _WHITESPACE_RE.sub(' ', self.sample(text).strip())
+        if len(sample) < 10:
+            return 'unknown'
+        return self._detect_sample(sample)
+
+    def detect_many(self, texts: Sequence[str], group_size: int = 2048) -> List[str]:
+        """按组检测一批文本的语言：同一组的文本得到同一结果，适合同一来源的大量短文本"""
+        languages = [''] * len(texts)
+        group: List[int] = []
+        samples: List[str] = []
+        length = 0
+
+        def assign(indexes: List[int], parts: List[str]):
+            if len(indexes) == 1:
+                languages[indexes[0]] = self._detect_sample(parts[0])
+                return
+            language = self._detect_group(' '.join(parts))
+            if language:
+                for index in indexes:
+                    languages[index] = language
+                return
+            middle = len(indexes) // 2
+            assign(indexes[:middle], parts[:middle])
+            assign(indexes[middle:], parts[middle:])
+
+        def flush():
+            assign(list(group), list(samples))
+            group.clear()
+            samples.clear()
+
+        for index, text in enumerate(texts):
+            sample = _WHITESPACE_RE.sub(' ', self.sample(text).strip())
+            if len(sample) < 10:
+                languages[index] = 'unknown'
+                continue
+            language = self.classify_script(sample)
+            if language:
+                languages[index] = language
+                continue
+            group.append(index)
+            samples.append(sample)
+            length += len(sample) + 1
+            if length >= group_size:
+                flush()
+                length = 0
+        if group:
+            flush()
+        return languages
+
+    def sample(self, text: str) -> str:
+        """取文本中均匀分布的窗口，窗口两端对齐到空白以免截断单词"""
+        total = self.windows * self.window_size
+        if len(text) <= total:
+            return text
+        step = (len(text) - self.window_size) / (self.windows - 1) if self.windows > 1 else 0
+        parts = []
+        for index in range(self.windows):
+            start = int(index * step)
+            window = text[start:start + self.window_size]
+            if start > 0:
+                space = window.find(' ')
+                if 0 <= space < self.window_size // 4:
+                    window = window[space + 1:]
+            space = window.rfind(' ')
+            if space > self.window_size * 3 // 4:
+                window = window[:space]
+            parts.append(window)
+        return ' '.join(parts)
+
+    def classify_script(self, sample: str) -> Optional[str]:
+        """按文字区块判定语言；以拉丁字母等其他文字为主时返回 None"""
+        letters = len(_LETTER_RE.findall(sample))
+        if not letters:
+            return None
+        counts = {script: len(pattern.findall(sample)) for script, pattern in _SCRIPT_RES.items()}
+        cjk = counts.pop('han') + counts['kana']
+        kana = counts.pop('kana')
+        script, count = max(counts.items(), key=lambda item: item[1])
+        if cjk >= count:
+            script, count = 'cjk', cjk
+        if count < letters * self.script_threshold:
+            return None
+        if script == 'cjk':
+            # 日文夹杂汉字，假名占一成以上就判为日文
+            return 'ja' if kana * 10 >= cjk else 'zh'
+        return _SCRIPT_LANGUAGES[script]
+
+    def _detect_group(self, sample: str) -> Optional[str]:
+        """一组文本拼成的样本的语言；最可能的语言概率低于 group_confidence 时返回 None"""
+        try:
+            best = _load_langdetect().detect_langs(sample)[0]
+        except Exception:
+            return None
+        return best.lang if best.prob >= self.group_confidence else None
+
+    def _detect_uncached(self, sample: str) -> str:
+        language = self.classify_script(sample)
+        if language:
+            return language
+        try:
+            return _load_langdetect().detect(sample)
+        except Exception:
+            return 'unknown'
@@ -0,0 +1,90 @@
+"""
+按语言的规则包：每种语言一个 JSON 文件 language_packs/<语言代码>.json
+
+字段（都可以省略）：
+- name: 语言名称（/api/languages 返回）
+- hyphenation: 连字符断行的正则（替换为空），没有时使用通用规则
+- line_break: 语言特定的换行正则（替换为空），在段落和句子换行规则之前执行
+- punctuation: 追加到通用标点映射之后的替换规则 {原文: 替换文本}
+- ai_phrases: 追加的 AI 引导语（字面量），和通用的 "Here's" / "Here is" 一样删除到下一个冒号
+
+_common.json 是所有语言共用的规则（目前只有 punctuation）。
+
+启动时只列出目录并读取 JSON（几十个小文件，毫秒级），第一次用到某种语言时才编译正则，
+之后缓存；没有任何规则的语言和未知语言一样使用通用阶段计划。
+"""
+
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Optional
+
+LANGUAGE_PACK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'language_packs')
+_COMMON_PACK = '_common'
+
+
+class LanguagePack:
+    """编译好的单个语言的规则"""
+
+    def __init__(self, code: str, spec: Dict):
+        self.code = code
+        self.name: str = spec.get('name', code)
+        self.hyphenation: Optional[re.Pattern] = _compile(spec.get('hyphenation'))
+        self.line_break: Optional[re.Pattern] = _compile(spec.get('line_break'))
+        self.punctuation: Dict[str, str] = dict(spec.get('punctuation') or {})
+        self.ai_phrases: List[str] = list(spec.get('ai_phrases') or [])
+        self.ai_preamble: Optional[re.Pattern] = _compile(
+            '(?:' + '|'.join(map(re.escape, self.ai_phrases)) + ').*?:' if self.ai_phrases else None
+        )
+
+    @property
+    def has_rules(self) -> bool:
+        """是否有和通用计划不同的规则"""
+        return bool(self.hyphenation or self.line_break or self.punctuation or self.ai_phrases)
+
+
+def _compile(pattern: Optional[str]) -> Optional[re.Pattern]:
+    return re.compile(pattern) if pattern else None
+
+
+class LanguagePackRegistry:
+    """发现目录中的规则包，按需编译并缓存"""
+
+    def __init__(self, directory: str = LANGUAGE_PACK_DIR):
+        self.directory = directory
+        self._specs: Dict[str, Dict] = {}
+        self._packs: Dict[str, LanguagePack] = {}
+        self._lock = threading.Lock()
+        self.common: Dict = {}
+        for filename in sorted(os.listdir(directory)):
+            code, extension = os.path.splitext(filename)
+            if extension != '.json':
+                continue
+            with open(os.path.join(directory, filename), encoding='utf-8') as f:
+                spec = json.load(f)
+            if code == _COMMON_PACK:
+                self.common = spec
+            else:
+                self._specs[code] = spec
+
+    def names(self) -> Dict[str, str]:
+        """语言代码 -> 名称"""
+        return {code: spec.get('name', code) for code, spec in self._specs.items()}
+
+    def __contains__(self, code: object) -> bool:
+        return code in self._specs
+
+    def get(self, code: Optional[str]) -> Optional[LanguagePack]:
+        """语言的规则包（第一次调用时编译），没有规则包时返回 None"""
+        pack = self._packs.get(code)
+        if pack is None and code in self._specs:
+            with self._lock:
+                pack = self._packs.get(code)
+                if pack is None:
+                    pack = self._packs[code] = LanguagePack(code, self._specs[code])
+        return pack
+
+    def compiled(self) -> List[str]:
+        """已经编译的语言代码"""
+        return list(self._packs)
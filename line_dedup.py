@@ -0,0 +1,335 @@
+"""
+重复行删除用的“已见行”集合
+
+- exact: Python set 保存每个不同的行（原来的做法），内存随行的总长度增长
+- hashed: 只保存每行的 64 位哈希，放在 array 实现的开放寻址表里，每行约 12-24 字节；
+  哈希是 Python 内置的带随机密钥的 SipHash，1000 万行发生一次碰撞的概率约为百万分之三
+- bloom: 可扩展的 Bloom 过滤器，每行约 error_rate 决定的几个比特；有 error_rate 的概率
+  把没出现过的行误判为重复而删除
+- near: 忽略大小写、空白和标点后相同的行视为重复；足够长的行再用 MinHash 找出只差
+  个别词的近似重复行
+
+所有实现都提供 add(line) -> 是否第一次出现、line in seen 和 nbytes（估算的内存占用）。
+"""
+
+import math
+import random
+import re
+import sys
+from array import array
+from typing import Iterable, List, Optional
+
+DEDUP_MODES = ('exact', 'hashed', 'bloom', 'near')
+
+_MASK64 = (1 << 64) - 1
+
+
+class ExactLineSet:
+    """保存完整行的集合"""
+
+    def __init__(self):
+        self._lines = set()
+        self._string_bytes = 0
+
+    def add(self, line: str) -> bool:
+        if line in self._lines:
+            return False
+        self._lines.add(line)
+        self._string_bytes += sys.getsizeof(line)
+        return True
+
+    def __contains__(self, line: str) -> bool:
+        return line in self._lines
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+    @property
+    def nbytes(self) -> int:
+        return sys.getsizeof(self._lines) + self._string_bytes
+
+
+class HashedLineSet:
+    """只保存 64 位哈希的集合：线性探测的开放寻址表，0 表示空位"""
+
+    def __init__(self, capacity: int = 1024):
+        size = 16
+        while size * 2 < capacity * 3:
+            size *= 2
+        self._slots = array('q', [0]) * size
+        self._mask = size - 1
+        self._count = 0
+
+    def add(self, line: str) -> bool:
+        key = hash(line) or 1
+        slots, mask = self._slots, self._mask
+        index = key & mask
+        while True:
+            slot = slots[index]
+            if slot == 0:
+                slots[index] = key
+                self._count += 1
+                # 负载超过 2/3 时扩容
+                if self._count * 3 > len(slots) * 2:
+                    self._grow()
+                return True
+            if slot == key:
+                return False
+            index = (index + 1) & mask
+
+    def __contains__(self, line: str) -> bool:
+        key = hash(line) or 1
+        slots, mask = self._slots, self._mask
+        index = key & mask
+        while True:
+            slot = slots[index]
+            if slot == 0:
+                return False
+            if slot == key:
+                return True
+            index = (index + 1) & mask
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        return sys.getsizeof(self._slots)
+
+    def _grow(self) -> None:
+        old = self._slots
+        self._slots = array('q', [0]) * (len(old) * 2)
+        self._mask = len(self._slots) - 1
+        slots, mask = self._slots, self._mask
+        for key in old:
+            if key:
+                index = key & mask
+                while slots[index]:
+                    index = (index + 1) & mask
+                slots[index] = key
+
+
+class _IntMap:
+    """64 位整数键到非负整数的映射，结构同 HashedLineSet；键 0 换成 1，重复的键覆盖旧值"""
+
+    def __init__(self, size: int = 1024):
+        self._keys = array('q', [0]) * size
+        self._values = array('q', [0]) * size
+        self._mask = size - 1
+        self._count = 0
+
+    def get(self, key: int) -> Optional[int]:
+        key = key or 1
+        keys, mask = self._keys, self._mask
+        index = key & mask
+        while True:
+            slot = keys[index]
+            if slot == 0:
+                return None
+            if slot == key:
+                return self._values[index]
+            index = (index + 1) & mask
+
+    def put(self, key: int, value: int) -> None:
+        key = key or 1
+        keys, mask = self._keys, self._mask
+        index = key & mask
+        while keys[index] and keys[index] != key:
+            index = (index + 1) & mask
+        if keys[index] == 0:
+            keys[index] = key
+            self._count += 1
+        self._values[index] = value
+        if self._count * 3 > len(keys) * 2:
+            self._grow()
+
+    @property
+    def nbytes(self) -> int:
+        return sys.getsizeof(self._keys) + sys.getsizeof(self._values)
+
+    def _grow(self) -> None:
+        old_keys, old_values = self._keys, self._values
+        self.__init__(len(old_keys) * 2)
+        for key, value in zip(old_keys, old_values):
+            if key:
+                self.put(key, value)
+
+
+class _BloomFilter:
+    """固定容量的 Bloom 过滤器，位置由 64 位哈希的两半做双重哈希得到"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        log2 = math.log(2)
+        bits = max(64, int(-capacity * math.log(error_rate) / (log2 * log2)))
+        self.bits = bits
+        self.hashes = max(1, round(bits / capacity * log2))
+        self.capacity = capacity
+        self.count = 0
+        self.array = bytearray((bits + 7) // 8)
+
+    def positions(self, key: int) -> List[int]:
+        low = key & 0xffffffff
+        high = (key >> 32) | 1
+        return [(low + i * high) % self.bits for i in range(self.hashes)]
+
+    def contains(self, positions: List[int]) -> bool:
+        data = self.array
+        return all(data[p >> 3] & (1 << (p & 7)) for p in positions)
+
+    def add(self, positions: List[int]) -> None:
+        data = self.array
+        for p in positions:
+            data[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+
+class BloomLineSet:
+    """可扩展的 Bloom 过滤器：写满后追加一个容量加倍、误判率减半的过滤器，总误判率不超过 error_rate"""
+
+    def __init__(self, error_rate: float = 0.001, capacity: int = 65536):
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate 必须在 0 和 1 之间")
+        self.error_rate = error_rate
+        self._filters = [_BloomFilter(capacity, error_rate / 2)]
+        self._count = 0
+
+    def add(self, line: str) -> bool:
+        key = hash(line) & _MASK64
+        if self._contains_key(key):
+            return False
+        current = self._filters[-1]
+        if current.count >= current.capacity:
+            current = _BloomFilter(current.capacity * 2, self.error_rate / 2 ** (len(self._filters) + 1))
+            self._filters.append(current)
+        current.add(current.positions(key))
+        self._count += 1
+        return True
+
+    def __contains__(self, line: str) -> bool:
+        return self._contains_key(hash(line) & _MASK64)
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        return sum(sys.getsizeof(bloom.array) for bloom in self._filters)
+
+    def _contains_key(self, key: int) -> bool:
+        return any(bloom.contains(bloom.positions(key)) for bloom in self._filters)
+
+
+# 忽略空白、标点和下划线
+_NEAR_STRIP_RE = re.compile(r'[\W_]+')
+_WORD_RE = re.compile(r'\w+')
+
+# MinHash 的“排列”：词哈希与固定的随机掩码异或，掩码用固定种子生成
+_MINHASH_MASKS = [random.Random(seed).getrandbits(64) for seed in range(64)]
+
+
+def minhash(tokens: Iterable[str], permutations: int = 32) -> List[int]:
+    """词集合的 MinHash 签名：两个签名相同位置的值相等的比例约等于两个集合的 Jaccard 相似度"""
+    keys = {hash(token) & _MASK64 for token in tokens}
+    return [min([key ^ mask for key in keys]) for mask in _MINHASH_MASKS[:permutations]]
+
+
+class NearDuplicateLineSet:
+    """近似重复行：规范化后相同，或词和相邻两词集合的 Jaccard 相似度（MinHash 估计）不低于 threshold
+
+    签名按 bands 段、每段 rows 个值做 LSH：相似度 0.8 的两行至少有一段完全相同的概率约 99%，
+    有相同段的候选再用完整签名确认。每段只记住最近一行；每行约占 400 字节，是 hashed 的几十倍。
+    """
+
+    def __init__(self, threshold: float = 0.6, bands: int = 8, rows: int = 4, min_words: int = 5):
+        self.threshold = threshold
+        self.rows = rows
+        self.min_words = min_words
+        self._normalized = HashedLineSet()
+        self.bands = bands
+        # (段号, 段内的值) 的哈希 -> 最近一行的序号
+        self._band_index = _IntMap()
+        # 所有签名依次存放，每个值只保留低 32 位用于确认
+        self._signatures = array('I')
+        self._count = 0
+
+    def add(self, line: str) -> bool:
+        if not self._normalized.add(_normalize(line)):
+            return False
+        signature = self._signature(line)
+        if signature is None:
+            return True
+        keys = self._band_keys(signature)
+        if self._has_similar(signature, keys):
+            return False
+        index = self._count
+        self._count += 1
+        self._signatures.extend([value & 0xffffffff for value in signature])
+        for key in keys:
+            self._band_index.put(key, index)
+        return True
+
+    def __contains__(self, line: str) -> bool:
+        if _normalize(line) in self._normalized:
+            return True
+        signature = self._signature(line)
+        return signature is not None and self._has_similar(signature, self._band_keys(signature))
+
+    def __len__(self) -> int:
+        return len(self._normalized)
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            self._normalized.nbytes
+            + sys.getsizeof(self._signatures)
+            + self._band_index.nbytes
+        )
+
+    def _signature(self, line: str) -> Optional[List[int]]:
+        """词数足够时返回 MinHash 签名，太短的行只做规范化比较"""
+        words = _WORD_RE.findall(line.casefold())
+        if len(words) < self.min_words:
+            return None
+        # 词和相邻两词：只有词的话，词汇量小的日志里无关的行也很相似
+        return minhash(words + [f'{a} {b}' for a, b in zip(words, words[1:])], self.bands * self.rows)
+
+    def _band_keys(self, signature: List[int]) -> List[int]:
+        return [hash((band, *signature[band * self.rows:(band + 1) * self.rows])) for band in range(self.bands)]
+
+    def _has_similar(self, signature: List[int], keys: List[int]) -> bool:
+        for key in keys:
+            index = self._band_index.get(key)
+            if index is not None:
+                stored = self._signatures[index * len(signature):(index + 1) * len(signature)]
+                same = sum(1 for a, b in zip(signature, stored) if a & 0xffffffff == b)
+                if same >= self.threshold * len(signature):
+                    return True
+        return False
+
+
+def _normalize(line: str) -> str:
+    """去掉空白、标点并忽略大小写；只有标点的行保持原样"""
+    return _NEAR_STRIP_RE.sub('', line).casefold() or line
+
+
+def make_line_set(mode: str = 'hashed', error_rate: float = 0.001):
+    """按模式创建已见行集合"""
+    if mode == 'exact':
+        return ExactLineSet()
+    if mode == 'hashed':
+        return HashedLineSet()
+    if mode == 'bloom':
+        return BloomLineSet(error_rate)
+    if mode == 'near':
+        return NearDuplicateLineSet()
+    raise ValueError(f"未知的去重模式: {mode}（可选: {', '.join(DEDUP_MODES)}）")
+
+
+def remove_duplicate_lines(text: str, seen) -> str:
+    """移除在 seen 中出现过的非空行（比较去掉首尾空白后的内容），并把新出现的行加入 seen"""
+    unique_lines = []
+    for line in text.split('\n'):
+        line_stripped = line.strip()
+        if not line_stripped or seen.add(line_stripped):
+            unique_lines.append(line)
+    return '\n'.join(unique_lines)
@@ -0,0 +1,191 @@
+"""
+进程内指标：计数器和直方图，按 Prometheus 文本格式输出
+
+不依赖 prometheus_client。每个指标带一组固定的标签名，
+观测时按标签值分别累计；render() 生成 /api/metrics 的响应文本。
+
+MetricsMiddleware 是纯 ASGI 中间件（不读取请求体，不影响流式接口），
+按路由模板（如 /api/jobs/{job_id}）统计请求数和耗时；没有匹配到路由的请求统一记为 "other"，
+避免标签数量随任意路径无限增长。
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 耗时直方图的默认桶（秒）
+DEFAULT_TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """只增不减的计数"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, values)} {_format_value(value)}" for values, value in items]
+
+
+class Histogram:
+    """按固定桶累计观测值，同时记录总和与次数"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Iterable[float] = DEFAULT_TIME_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # 标签值 -> [各桶计数（不累积）..., 总和, 次数]
+        self._values: Dict[Labels, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                state = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((values, list(state)) for values, state in self._values.items())
+        lines = []
+        for values, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, values)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, values)} {state[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """已注册的指标，以及在输出时读取的瞬时值（gauge）"""
+
+    def __init__(self):
+        self._metrics: List = []
+        self._gauges: List[Tuple[str, str, Callable[[], Dict[str, float]]]] = []
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Iterable[float] = DEFAULT_TIME_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauges(self, prefix: str, help_text: str, collect: Callable[[], Optional[Dict[str, float]]]) -> None:
+        """注册一组瞬时值：collect() 返回 {名称: 值}，输出为 prefix_名称"""
+        self._gauges.append((prefix, help_text, collect))
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for prefix, help_text, collect in self._gauges:
+            for name, value in (collect() or {}).items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                lines.append(f"# HELP {prefix}_{name} {help_text}")
+                lines.append(f"# TYPE {prefix}_{name} gauge")
+                lines.append(f"{prefix}_{name} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """按路由统计 HTTP 请求数和耗时"""
+
+    def __init__(self, app, requests: Counter, latency: Histogram, routes: Callable[[], Iterable]):
+        self.app = app
+        self.requests = requests
+        self.latency = latency
+        self._routes = routes
+        # endpoint -> 使用它的路由（静态文件等多个路由可以共用一个 endpoint）
+        self._paths: Optional[Dict[Callable, List]] = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        if self._paths is None:
+            self._paths = {}
+            for route in self._routes():
+                if hasattr(route, 'endpoint'):
+                    self._paths.setdefault(route.endpoint, []).append(route)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            path = self._path(scope)
+            self.latency.observe(time.perf_counter() - start, scope['method'], path)
+            self.requests.inc(scope['method'], path, str(status[0]))
+
+    def _path(self, scope) -> str:
+        """匹配到的路由模板，没有匹配到时为 other"""
+        # FastAPI 的路由匹配后会把路由写入 scope；Starlette 的 Route 只写入 endpoint
+        route = scope.get('route')
+        if route is not None:
+            return route.path
+        routes = self._paths.get(scope.get('endpoint'))
+        if not routes:
+            return 'other'
+        if len(routes) == 1:
+            return routes[0].path
+        # 多个路由共用 endpoint 时按请求路径确定是哪一个
+        for route in routes:
+            if route.path_regex.match(scope['path']):
+                return route.path
+        return 'other'
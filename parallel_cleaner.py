@@ -0,0 +1,150 @@
+"""
+单个大文本的分段并行清理：在段落边界分块，各块并行清理后再拼接
+
+clean_text 对整篇文本依次执行各阶段，20MB 的文档只能用一个核。这里在安全的空行处
+（stream_cleaner.iter_safe_cuts）把文本切成若干块，交给 map_blocks（例如进程池）并行执行
+行阶段之外的阶段（编码、HTML、Markdown、断词、断行、空格、空行、标点、引号），然后按顺序：
+- 用 StreamCleaner.append 处理块间的空白（与流式清理相同的断行、连字符、空格、空行、标点规则），
+  重复行删除使用跨块的已见集合，AI 标记清理在完整的行上执行，最后按整篇清理的规则去掉首尾空白
+- 按整篇清理时各阶段看到的块边界字符，判断块间的空白被哪些阶段改动（用于 changes_made；
+  标点标准化之后才改变的边界字符，例如 "。"，在断行修复时还是原来的字符）
+- 原文的词数由各块累加（块间的空白不含词），其余统计在这里计算
+
+只用于默认选项（关闭部分阶段时块边界的处理可能不同，见 stream_cleaner），结果（cleaned_text、
+changes_made、stats）与 clean_text 一致。分块点两侧都不是空白，块的两端在某个阶段变成空白
+或 Markdown 行首标记（例如去掉 HTML 标签后露出的列表标记）时，整篇清理会把它与块间的空白
+一起处理，这样的块与相邻的块合并后在调用方重新清理。
+"""
+
+import re
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from batch_cleaner import BatchResult
+from stream_cleaner import LINE_STAGES, SEAM_STAGES, StreamCleaner
+from text_features import may_change, scan as scan_features
+from text_stats import count_lines, count_words
+
+# Markdown 列表、编号、引用标记：规则开头的 ^\s* 会吃掉前面的空白，标记后的 \s 会吃掉后面的空白
+_LINE_MARK_RE = re.compile(r'[-*+>]|\d+\.')
+_MARKS_ONLY_RE = re.compile(r'[\s\-*+>.\d]+')
+# 块间空白的探测文本：(前一块的最后一个字符)(空白)(后一块的第一个字符)
+_SEAM_RE = re.compile(r'\S?(\s*)\S?')
+
+
+class BlockResult:
+    """一块的清理结果（clean_block 的返回值，在进程之间传递）"""
+
+    __slots__ = ('staged', 'changes', 'words', 'open_start', 'open_end', 'edges')
+
+    def __init__(self, staged: str, changes: List[str], words: int, open_start: bool, open_end: bool,
+                 edges: Dict[str, Tuple[str, str]]):
+        self.staged = staged
+        self.changes = changes
+        self.words = words
+        # 块的开头（结尾）是否在某个阶段可能与块外的空白一起处理
+        self.open_start = open_start
+        self.open_end = open_end
+        # 处理块间空白的阶段 -> 执行该阶段之前块的 (第一个字符, 最后一个字符)
+        self.edges = edges
+
+
+def clean_block(cleaner, options: Optional[Dict[str, bool]], language: str, content: str) -> BlockResult:
+    """对一块执行行阶段之外的阶段（与 stream_cleaner.run_block_stages 相同），并记录块两端的变化
+
+    块的开头（结尾）在某个阶段之后是空白或为空，或者 Markdown 清理之前是行首标记（最后一行只有标记）时，
+    整篇清理会把它与块间的空白一起处理，open_start（open_end）为 True。
+    """
+    plan = cleaner.get_plan(options, language)
+    words = count_words(content)
+    changes = set()
+    edges = {}
+    open_start, open_end = not content[:1].strip(), not content[-1:].strip()
+    features = scan_features(content)
+    for name, stage, _ in plan:
+        if name in LINE_STAGES:
+            continue
+        if name in SEAM_STAGES:
+            edges[name] = (content[:1], content[-1:])
+        elif name == 'remove_markdown':
+            open_start = open_start or _LINE_MARK_RE.match(content) is not None
+            open_end = open_end or _MARKS_ONLY_RE.fullmatch(content, content.rfind('\n') + 1) is not None
+        if not may_change(plan.triggers[name], features):
+            continue
+        old_content, content = content, stage(content)
+        if content != old_content:
+            features = scan_features(content)
+            changes.add(name)
+            open_start = open_start or not content[:1].strip()
+            open_end = open_end or not content[-1:].strip()
+    return BlockResult(content, sorted(changes), words, open_start, open_end, edges)
+
+
+def clean_document(cleaner, text: str, map_blocks: Callable[[List[str], str], Iterable[BlockResult]],
+                   options: Optional[Dict[str, bool]] = None, language: Optional[str] = None,
+                   block_size: int = 1024 * 1024, stats: bool = True) -> BatchResult:
+    """分块清理一个完整的文本，结果与 clean_text 相同
+
+    map_blocks(各块原文, 语言) 按顺序返回各块 clean_block() 的结果，可以在进程池中执行；
+    这里边接收结果边拼接。
+    """
+    if not text.strip():
+        raise ValueError("输入文本不能为空")
+    language = language or cleaner.detect_language(text)
+    plan = cleaner.get_plan(options, language)
+    stream = StreamCleaner(cleaner, options, language, block_size=block_size)
+    stream.changes = set()
+    blocks = stream.split_all(text)
+    changes: Set[str] = set()
+    output = []
+    original_words = 0
+    # 上一块还不能拼接：要等下一块的结果确定两块是否需要合并
+    pending = None
+    for (content, gap), result in zip(blocks, map_blocks([content for content, _ in blocks], language)):
+        if pending is not None:
+            pending_content, pending_gap, pending_result = pending
+            if pending_result.open_end or result.open_start:
+                content = pending_content + pending_gap + content
+                result = clean_block(cleaner, options, language, content)
+            else:
+                output.append(stream.append(pending_result.staged, pending_gap))
+                changes.update(pending_result.changes)
+                original_words += pending_result.words
+                _add_seam_changes(plan, pending_gap, pending_result.edges, result.edges, changes)
+        pending = content, gap, result
+    _, gap, result = pending
+    output.append(stream.append(result.staged, gap))
+    changes.update(result.changes)
+    original_words += result.words
+    output.append(stream.finish())
+    changes.update(stream.changes)
+
+    cleaned = ''.join(output)
+    result_stats = None
+    if stats:
+        result_stats = {
+            'original_length': len(text),
+            'cleaned_length': len(cleaned),
+            'chars_removed': len(text) - len(cleaned),
+            'original_lines': count_lines(text),
+            'cleaned_lines': count_lines(cleaned),
+            'original_words': original_words,
+            'cleaned_words': count_words(cleaned),
+        }
+    return BatchResult(text, cleaned, language, [change for name, _, change in plan if name in changes],
+                       result_stats)
+
+
+def _add_seam_changes(plan, gap: str, before: Dict[str, Tuple[str, str]], after: Dict[str, Tuple[str, str]],
+                      changes: Set[str]) -> None:
+    """加入整篇清理时改动两块之间空白的阶段：每个阶段用它执行之前两块的边界字符"""
+    for name, stage, _ in plan:
+        if name not in SEAM_STAGES:
+            continue
+        probe = before[name][1] + gap + after[name][0]
+        output = stage(probe)
+        if output != probe:
+            changes.add(name)
+            match = _SEAM_RE.fullmatch(output)
+            if match is None:
+                return
+            gap = match.group(1)
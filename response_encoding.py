@@ -0,0 +1,194 @@
+"""
+清理结果的响应格式和 JSON 编码
+
+响应模式（请求中的 response_mode）：
+- full: 完整结果，包括原文（原来的行为）
+- cleaned: 不回传原文，其余字段不变
+- diff: 不回传原文和清理后的文本，只返回把原文变成清理结果的编辑脚本
+
+编辑脚本是按位置排序的 [起点, 终点, 替换文本] 列表，位置是原文中的字符下标，
+客户端用 apply_edits 的逻辑在本地原文上重建清理结果。
+
+编码时优先使用 orjson（大结果快数倍），没有安装时退回标准库 json。
+"""
+
+import json
+from typing import Any, Dict, List, Tuple
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson 是可选依赖
+    orjson = None
+
+RESPONSE_MODES = ('full', 'cleaned', 'diff')
+
+# 对齐点：采样间隔、采样长度、在估计位置前后查找的范围
+_SAMPLE_STEP = 64
+_SAMPLE_LENGTH = 8
+_SAMPLE_WINDOW = 2048
+# 小段内重新对齐：(锚点字符数, 在原文中的查找窗口)，依次尝试；短锚点容易对错位置，只在近处查找
+_ANCHORS = ((8, 512), (4, 64), (2, 16))
+# 清理结果中最多尝试的插入长度
+_MAX_INSERT = 16
+# 跳过相同部分时每次比较的块大小
+_BLOCK = 64
+
+Edit = Tuple[int, int, str]
+
+
+def json_dumps(content: Any) -> bytes:
+    """编码为 UTF-8 JSON；orjson 不能处理的内容（如孤立代理字符）交给标准库"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(content)
+        except TypeError:
+            pass
+    return json.dumps(content, ensure_ascii=False, separators=(',', ':')).encode('utf-8', 'surrogatepass')
+
+
+class FastJSONResponse(Response):
+    """用 json_dumps 编码的 JSON 响应"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return json_dumps(content)
+
+
+def edit_script(original: str, cleaned: str) -> List[Edit]:
+    """计算把 original 变成 cleaned 的编辑脚本
+
+    清理大多是删除和就地替换，可以只向前对齐：
+    1. 每隔 _SAMPLE_STEP 个字符取清理结果中的一段，在原文中上一个对齐点之后查找，
+       得到一串单调的对齐点，把文本切成互不影响的小段
+    2. 每段内跳过相同的部分，遇到不同时用清理结果接下来的几个字符作为锚点重新对齐
+
+    只用 str.find，总耗时随文本长度线性增长。结果总能准确重建，但不保证是最短的脚本。
+    """
+    edits: List[Edit] = []
+    i = j = 0
+    for next_i, next_j in _alignment_points(original, cleaned):
+        edits.extend(_segment_edits(original[i:next_i], cleaned[j:next_j], i))
+        i, j = next_i, next_j
+    return edits
+
+
+def apply_edits(original: str, edits: List[Edit]) -> str:
+    """按编辑脚本重建清理结果"""
+    parts = []
+    position = 0
+    for start, end, replacement in edits:
+        parts.append(original[position:start])
+        parts.append(replacement)
+        position = end
+    parts.append(original[position:])
+    return ''.join(parts)
+
+
+def shape_result(result, mode: str) -> Dict[str, Any]:
+    """按响应模式把 CleanResult 转成响应字典"""
+    if mode == 'full':
+        return result.model_dump(exclude_none=True)
+    if mode == 'cleaned':
+        return result.model_dump(exclude={'original_text'}, exclude_none=True)
+    content = result.model_dump(exclude={'original_text', 'cleaned_text'}, exclude_none=True)
+    content['edits'] = edit_script(result.original_text, result.cleaned_text)
+    return content
+
+
+def _alignment_points(original: str, cleaned: str) -> List[Tuple[int, int]]:
+    """单调的对齐点 [(原文位置, 清理结果位置), ...]，最后一个是两段文本的末尾
+
+    采样段只在按整体长度比例估计的位置附近查找；位置和上一个对齐点不连续时，
+    要求下一个采样段紧接着也能找到，避免对到别处重复出现的同样文字上。
+    """
+    points = []
+    i = j = 0
+    ratio = len(original) / max(1, len(cleaned))
+    for position in range(_SAMPLE_STEP, len(cleaned) - _SAMPLE_LENGTH, _SAMPLE_STEP):
+        expected = i + int((position - j) * ratio)
+        key = cleaned[position:position + _SAMPLE_LENGTH]
+        found = original.find(key, max(i, expected - _SAMPLE_WINDOW), expected + _SAMPLE_WINDOW + _SAMPLE_LENGTH)
+        if found == -1:
+            continue
+        if found - i != position - j:
+            following = cleaned[position + _SAMPLE_STEP:position + _SAMPLE_STEP + _SAMPLE_LENGTH]
+            if len(following) == _SAMPLE_LENGTH and original.find(
+                    following, found, found + 2 * _SAMPLE_STEP + _SAMPLE_LENGTH) == -1:
+                continue
+        points.append((found, position))
+        i, j = found, position
+    points.append((len(original), len(cleaned)))
+    return points
+
+
+def _segment_edits(original: str, cleaned: str, base: int) -> List[Edit]:
+    """一个小段内的编辑脚本，位置加上小段在原文中的起点"""
+    edits: List[Edit] = []
+    i = j = 0
+    original_length, cleaned_length = len(original), len(cleaned)
+    while True:
+        i, j = _skip_common(original, cleaned, i, j)
+        if j == cleaned_length:
+            if i < original_length:
+                edits.append((base + i, base + original_length, ''))
+            return edits
+        if cleaned_length - j < _ANCHORS[-1][0]:
+            # 剩下的清理结果太短，不能作为锚点：能作为原文结尾就只删除中间部分
+            rest = cleaned[j:]
+            if original.endswith(rest) and original_length - len(rest) >= i:
+                edits.append((base + i, base + original_length - len(rest), ''))
+            else:
+                edits.append((base + i, base + original_length, rest))
+            return edits
+        found = _resync(original, cleaned, i, j)
+        if found is None:
+            edits.append((base + i, base + original_length, cleaned[j:]))
+            return edits
+        next_i, next_j = found
+        edits.append((base + i, base + next_i, cleaned[j:next_j]))
+        i, j = next_i, next_j
+
+
+def _skip_common(original: str, cleaned: str, i: int, j: int) -> Tuple[int, int]:
+    """跳过相同的部分，先按块比较再逐字符比较"""
+    while original[i:i + _BLOCK] == cleaned[j:j + _BLOCK] and j + _BLOCK <= len(cleaned) and i + _BLOCK <= len(original):
+        i += _BLOCK
+        j += _BLOCK
+    while i < len(original) and j < len(cleaned) and original[i] == cleaned[j]:
+        i += 1
+        j += 1
+    return i, j
+
+
+def _resync(original: str, cleaned: str, i: int, j: int):
+    """找下一个对齐位置 (原文位置, 清理结果位置)，使跳过的字符数最少；找不到时返回 None
+
+    先在附近依次用较长和较短的锚点查找（中日文的改动很密，长锚点常常跨过改动），
+    都找不到时再用最长的锚点把窗口逐步扩大到整段。
+    """
+    for anchor, max_cost in _ANCHORS:
+        found = _find_anchor(original, cleaned, i, j, anchor, min(len(original), i + max_cost))
+        if found is not None:
+            return found
+    window = _ANCHORS[0][1]
+    while i + window < len(original):
+        window *= 2
+        found = _find_anchor(original, cleaned, i, j, _ANCHORS[0][0], min(len(original), i + window))
+        if found is not None:
+            return found
+    return None
+
+
+def _find_anchor(original: str, cleaned: str, i: int, j: int, anchor: int, limit: int):
+    """在 original[i:limit] 中查找清理结果前 _MAX_INSERT 个位置开头的锚点，返回跳过最少的对齐位置"""
+    best = None
+    for skip in range(min(_MAX_INSERT, len(cleaned) - j - anchor) + 1):
+        if best is not None and skip >= best[0]:
+            break
+        position = original.find(cleaned[j + skip:j + skip + anchor], i, limit + anchor)
+        if position != -1 and (best is None or position - i + skip < best[0]):
+            best = (position - i + skip, position, j + skip)
+    return None if best is None else best[1:]
@@ -0,0 +1,165 @@
+"""
+清理结果缓存
+
+键是 (文本, 阶段开关, 语言) 的哈希，值是不含原文的清理结果。
+- 进程内 LRU：按估算的内存占用限制大小，条目超过 TTL 后失效
+- 可选的共享后端（CacheBackend 接口），例如多个 worker 共用的 sqlite 文件
+- 命中、未命中、淘汰次数计数
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# 每个条目除文本外的大致固定开销（字典、模型对象、键）
+_ENTRY_OVERHEAD = 512
+
+
+class CacheBackend:
+    """共享缓存后端接口：按键读写序列化后的结果"""
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        raise NotImplementedError
+
+
+class SqliteCacheBackend(CacheBackend):
+    """用 sqlite 文件做共享缓存，同一台机器上的多个进程可以共用"""
+
+    def __init__(self, path: str, max_entries: int = 100000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_expires ON results (expires)")
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM results WHERE key = ? AND expires > ?", (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, expires) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl),
+            )
+            self._writes += 1
+            # 定期清理过期条目，并删除最早过期的条目使总数不超过上限
+            if self._writes % 1000 == 0:
+                self._conn.execute("DELETE FROM results WHERE expires <= ?", (time.time(),))
+                self._conn.execute(
+                    "DELETE FROM results WHERE key IN "
+                    "(SELECT key FROM results ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+
+
+class ResultCache:
+    """清理结果的 LRU 缓存，可选地以共享后端作为第二层"""
+
+    def __init__(self, result_type, max_bytes: int = 64 * 1024 * 1024, ttl: float = 3600,
+                 backend: Optional[CacheBackend] = None):
+        self.result_type = result_type
+        self.max_bytes = max_bytes
+        # 单个条目最多占总预算的 1/16，避免一个大文档清空整个缓存
+        self.max_entry_bytes = max_bytes // 16
+        self.ttl = ttl
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = 0
+        self._entries: "OrderedDict[str, Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text: str, stage_key: Tuple[bool, ...], language: Optional[str]) -> str:
+        """缓存键：文本、阶段开关和语言的哈希"""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{language or ''}|{''.join('1' if enabled else '0' for enabled in stage_key)}|".encode())
+        digest.update(text.encode('utf-8', 'surrogatepass'))
+        return digest.hexdigest()
+
+    def get(self, text: str, stage_key: Tuple[bool, ...], language: Optional[str]):
+        """读取缓存的清理结果，未命中时返回 None"""
+        key = self.key(text, stage_key, language)
+        payload = self._get_local(key)
+        if payload is None and self.backend is not None:
+            value = self.backend.get(key)
+            if value is not None:
+                payload = json.loads(value)
+                self._set_local(key, payload)
+        if payload is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.result_type(original_text=text, **payload)
+
+    def put(self, text: str, stage_key: Tuple[bool, ...], language: Optional[str], result) -> None:
+        """写入清理结果（不保存原文、阶段耗时和各阶段统计，读取时用请求的文本补上原文）"""
+        key = self.key(text, stage_key, language)
+        payload = result.model_dump(exclude={'original_text', 'timings', 'stage_stats'})
+        if self._set_local(key, payload) and self.backend is not None:
+            self.backend.set(key, json.dumps(payload, ensure_ascii=False).encode('utf-8'), self.ttl)
+
+    def stats(self) -> Dict[str, int]:
+        """缓存计数"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'bytes': self.size,
+            'max_bytes': self.max_bytes,
+        }
+
+    def clear(self) -> None:
+        """清空进程内缓存"""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _get_local(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, size, payload = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                self.size -= size
+                self.evictions += 1
+                return None
+            self._entries.move_to_end(key)
+            return payload
+
+    def _set_local(self, key: str, payload: Dict[str, Any]) -> bool:
+        """写入进程内缓存，条目过大时不缓存并返回 False"""
+        size = _ENTRY_OVERHEAD + 4 * len(payload['cleaned_text']) + sum(100 + 4 * len(change) for change in payload['changes_made'])
+        if size > self.max_entry_bytes:
+            return False
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (time.monotonic() + self.ttl, size, payload)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+        return True
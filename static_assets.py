@@ -0,0 +1,154 @@
+"""
+主页和静态文件：启动时读入内存并预先压缩，带强 ETag，文件修改后才重新读取
+
+原来每次访问 / 都在 async 处理函数里用阻塞 I/O 读取 index.html（约 60KB），响应不压缩、
+没有 ETag 和缓存头；style.css、api-integration.js 没有路由。这里：
+- 每个文件读入一次，按 Accept-Encoding 返回预先压缩好的 br（安装了 brotli 时）、gzip
+  或原文，压缩后不比原文小的编码不使用
+- ETag 由内容的哈希生成，各编码的 ETag 不同（强 ETag 对应具体的字节）；If-None-Match
+  匹配时返回 304，不带响应体
+- 距离上次检查超过 check_interval 秒时 stat 一次文件，修改时间或大小变了才在线程中重新读取；
+  文件被删除时继续返回内存中的内容
+- HTML 用 Cache-Control: no-cache（每次验证 ETag，修改后立即生效），其他文件缓存 max_age 秒
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import Response
+
+from compression import choose_encoding
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli 是可选依赖
+    brotli = None
+
+# 服务端支持的编码，按优先顺序
+_ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def _compress(encoding: str, body: bytes) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=11)
+    return gzip.compress(body, compresslevel=9, mtime=0)
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否包含 etag（按弱比较，W/ 前缀不影响）"""
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    return any(tag.strip().removeprefix('W/') == etag for tag in header.split(','))
+
+
+class StaticAsset:
+    """内存中的一个文件：原文和各编码的压缩结果"""
+
+    def __init__(self, path: str, media_type: str):
+        self.path = path
+        self.media_type = media_type
+        # 编码（'' 表示原文）-> (响应体, ETag)
+        self.variants: Dict[str, Tuple[bytes, str]] = {}
+        # 有压缩结果的编码，按服务端优先顺序
+        self.encodings: Tuple[str, ...] = ()
+        self.signature: Optional[Tuple[int, int]] = None
+        self.checked = 0.0
+        self.loads = 0
+
+    def stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self) -> bool:
+        """读取文件并压缩；文件不存在时保留原来的内容，返回是否有内容"""
+        signature = self.stat()
+        if signature is None:
+            return bool(self.variants)
+        if signature == self.signature:
+            return True
+        with open(self.path, 'rb') as file:
+            body = file.read()
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        variants = {'': (body, f'"{digest}"')}
+        for encoding in _ENCODINGS:
+            compressed = _compress(encoding, body)
+            if len(compressed) < len(body):
+                variants[encoding] = (compressed, f'"{digest}-{encoding}"')
+        self.variants = variants
+        self.encodings = tuple(encoding for encoding in _ENCODINGS if encoding in variants)
+        self.signature = signature
+        self.loads += 1
+        return True
+
+    def stale(self, now: float, check_interval: float) -> bool:
+        """距离上次检查超过 check_interval 秒时 stat 一次，文件变了返回 True"""
+        if now - self.checked < check_interval:
+            return False
+        self.checked = now
+        signature = self.stat()
+        return signature is not None and signature != self.signature
+
+
+class StaticAssets:
+    """按 URL 路径提供内存中的文件"""
+
+    def __init__(self, files: Dict[str, str], check_interval: float = 1.0, max_age: int = 300):
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self.assets: Dict[str, StaticAsset] = {}
+        for url_path, path in files.items():
+            media_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            if media_type.startswith('text/') or media_type == 'application/javascript':
+                media_type += '; charset=utf-8'
+            asset = StaticAsset(path, media_type)
+            asset.load()
+            self.assets[url_path] = asset
+
+    @property
+    def paths(self) -> List[str]:
+        return list(self.assets)
+
+    async def response(self, request: Request, url_path: Optional[str] = None) -> Optional[Response]:
+        """url_path（默认是请求路径）对应文件的响应；文件从未读到时返回 None"""
+        asset = self.assets[url_path or request.scope['path']]
+        if asset.stale(time.monotonic(), self.check_interval):
+            await run_in_threadpool(asset.load)
+        if not asset.variants:
+            return None
+
+        encoding = choose_encoding(request.headers.get('accept-encoding'), asset.encodings) or ''
+        body, etag = asset.variants[encoding]
+        headers = {
+            'etag': etag,
+            'cache-control': 'no-cache' if asset.media_type.startswith('text/html') else f'public, max-age={self.max_age}',
+            'vary': 'Accept-Encoding',
+        }
+        if etag_matches(request.headers.get('if-none-match'), etag):
+            return Response(status_code=304, headers=headers)
+        headers['content-type'] = asset.media_type
+        if encoding:
+            headers['content-encoding'] = encoding
+        return Response(body, headers=headers)
+
+    async def endpoint(self, request: Request) -> Response:
+        """静态文件的路由；文件不存在时返回 404"""
+        response = await self.response(request)
+        return response if response is not None else Response(status_code=404)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'files': sum(bool(asset.variants) for asset in self.assets.values()),
+            'bytes': sum(len(body) for asset in self.assets.values() for body, _ in asset.variants.values()),
+            'loads_total': sum(asset.loads for asset in self.assets.values()),
+        }
@@ -0,0 +1,491 @@
+"""
+流式文本清理：按段落边界分块清理，逐块输出结果
+
+整篇文本不必同时放在内存里。分块时保留跨块的状态：
+- 分块点选在空行处，并避开未闭合的代码块、HTML标签/注释、链接和强调标记，
+  保证这些跨行规则不会被切断；清理后可能以连字符或列表标记结尾（包括之后的段落被整段删除）的
+  位置也不分块，这些结尾在整篇清理时会和下一段连在一起
+- 两块之间的空白按整篇清理时的换行/空格/标点规则处理（连接成空格、保留为段落等）
+- 重复行删除使用跨块的已见集合，只对已经完整的行执行
+
+默认选项下输出与整篇清理一致；关闭空格/空行/标点处理等阶段时，块边界处的空白
+以及跨空行的成对 Markdown 标记在少数情况下可能与整篇清理略有不同。
+"""
+
+import codecs
+import html
+import json
+import re
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Set, Tuple
+
+from line_dedup import remove_duplicate_lines
+from text_features import may_change, scan as scan_features
+
+# 在完整的行上执行的阶段（必须在拼接之后执行）
+LINE_STAGES = ('remove_duplicates', 'fix_ai_artifacts')
+
+# 处理块间空白的阶段
+SEAM_STAGES = ('fix_hyphenation', 'fix_line_breaks', 'remove_extra_spaces', 'remove_empty_lines', 'normalize_punctuation')
+
+# 含空行的空白（优先的分块点）和任意含换行的空白（块过大时的分块点）
+_PARAGRAPH_GAP_RE = re.compile(r'\s*\n[^\S\n]*\n\s*')
+_LINE_GAP_RE = re.compile(r'\s*\n\s*')
+
+# 分块点之前可以是的标点（见 iter_safe_cuts）
+_SENTENCE_ENDS = '.!?,;:。！？，；：'
+
+# HTML 标签（可以跨行，"<>" 不是标签）和到文本末尾还没有闭合的标签
+_HTML_TAG_RE = re.compile(r'<(?!>)[^>]*>')
+_UNCLOSED_TAG_RE = re.compile(r'<(?!>)[^>]*\Z')
+
+# 跨行的 Markdown 链接标记：(开始, 结束)，分块点之前不能有未闭合的开始标记
+_MARKDOWN_PAIRS = (('[', ']'), ('](', ')'))
+
+# 清理后可能跨空行与下一段连接的字符：断词的连字符，Markdown 列表、编号和引用标记（见 _MarkerState）
+_HYPHEN_MARKS_RE = re.compile(r'-')
+_LINE_MARKS_RE = re.compile(r'[-*+>\d]')
+# 判断可见文本结尾时处理的字符数
+_TAIL_WINDOW = 64
+
+
+class StreamCleaner:
+    """逐块接收文本并返回可以输出的清理结果"""
+
+    def __init__(self, cleaner, options: Optional[Dict[str, bool]] = None, language: Optional[str] = None,
+                 block_size: int = 64 * 1024, max_block_size: int = 1024 * 1024):
+        self.cleaner = cleaner
+        self.options = options
+        self.language = language
+        self.block_size = block_size
+        self.max_block_size = max_block_size
+        self._buffer = ''
+        self._tail: Optional[str] = None  # 已清理但尚未输出的最后一行
+        self._gap = ''  # _tail 之后尚未处理的原始空白
+        self._seen = cleaner.new_line_set()
+        self._newline = False  # 已输出文本末尾暂缓输出的换行
+        self._plan = None
+        # 不为 None 时加入改动了文本的行阶段（重复行删除、AI 标记清理）的阶段名
+        self.changes: Optional[Set[str]] = None
+
+    def feed(self, text: str) -> str:
+        """接收一段文本，返回已经可以输出的清理结果"""
+        return ''.join(self.append(self.clean_block(content), gap) for content, gap in self.split(text))
+
+    def finish(self) -> str:
+        """输入结束，返回剩余的清理结果"""
+        output = ''.join(self.append(self.clean_block(content), gap) for content, gap in self.split_rest())
+        if self._tail is not None:
+            # 最后一行被当作重复行删除时，它前面的换行也一起去掉
+            dropped = (any(name == 'remove_duplicates' for name, _, _ in self._get_plan(self._tail))
+                       and self._tail.strip() in self._seen)
+            if not dropped:
+                # 最后一行被行阶段清空（例如只有 AI 标记）时，整篇清理保留它前面的换行
+                output += (self._emit_lines(self._tail) if self._tail else '') or '\n' * self._newline
+            elif self.changes is not None:
+                self.changes.add('remove_duplicates')
+        self._tail = None
+        self._newline = False
+        return output
+
+    def split(self, text: str) -> List[Tuple[str, str]]:
+        """接收一段文本，返回已经可以清理的块 [(块, 块后的空白), ...]
+
+        feed() 等价于对每块依次调用 clean_block() 和 append()；clean_block() 不依赖跨块状态，
+        可以交给其他线程或进程执行，只要 append() 按顺序调用。
+        """
+        self._buffer += text
+        blocks = []
+        while len(self._buffer) >= self.block_size:
+            cut = self._find_cut()
+            if cut is None:
+                break
+            start, end = cut
+            blocks.append((self._buffer[:start], self._buffer[start:end]))
+            self._buffer = self._buffer[end:]
+        return blocks
+
+    def split_rest(self) -> List[Tuple[str, str]]:
+        """输入结束，返回缓冲区中剩余的块（之后再调用 finish() 输出最后一行）"""
+        if not self._buffer:
+            return []
+        self._get_plan(self._buffer)
+        blocks = [(self._buffer, '')]
+        self._buffer = ''
+        return blocks
+
+    def split_all(self, text: str) -> List[Tuple[str, str]]:
+        """一次切分完整的文本（代替 split() 和 split_rest()），块之间至少相隔 block_size 个字符
+
+        只在 iter_safe_cuts 返回的位置分块，找不到时不按 max_block_size 强制分块。
+        """
+        names = {name for name, _, _ in self._get_plan(text)}
+        blocks = []
+        position = 0
+        for start, end in iter_safe_cuts(text, names, self.block_size):
+            blocks.append((text[position:start], text[start:end]))
+            position = end
+        blocks.append((text[position:], ''))
+        return blocks
+
+    def clean_block(self, content: str) -> str:
+        """对一块执行行阶段之外的阶段"""
+        return run_block_stages(self.cleaner, self._get_plan(content), content)
+
+    def append(self, content: str, gap: str) -> str:
+        """把 clean_block() 的结果与之前的块拼接，返回已完整的行"""
+        if not content.strip():
+            self._gap += content + gap
+            return ''
+        joined = join_cleaned(self._plan, self._tail or '', self._gap, content)
+        self._gap = gap
+        lines_end = joined.rfind('\n') + 1
+        self._tail = joined[lines_end:]
+        return self._emit_lines(joined[:lines_end]) if lines_end else ''
+
+    def checkpoint(self) -> Dict[str, Any]:
+        """已经 append() 的块之后的跨块状态（不含尚未分块的缓冲区），可以 pickle"""
+        return {'language': self.language, 'tail': self._tail, 'gap': self._gap, 'seen': self._seen,
+                'newline': self._newline}
+
+    def restore(self, state: Dict[str, Any]) -> None:
+        """从 checkpoint() 的结果继续；之后从对应的输入位置重新 feed()"""
+        self.language = state['language']
+        self._tail = state['tail']
+        self._gap = state['gap']
+        self._seen = state['seen']
+        self._newline = state['newline']
+        self._buffer = ''
+        self._plan = None
+
+    def _find_cut(self) -> Optional[Tuple[int, int]]:
+        """找到最后一个安全的分块点，返回分隔空白中从第一个到最后一个换行的 (开始, 结束)"""
+        names = {name for name, _, _ in self._get_plan(self._buffer)}
+        safe = None
+        fallback = None
+        for _, start, end, is_safe in iter_paragraph_cuts(self._buffer, names):
+            fallback = (start, end)
+            if is_safe:
+                safe = fallback
+        if safe is not None or len(self._buffer) < self.max_block_size:
+            return safe
+        # 块过大时放宽条件，保证内存有上限
+        if fallback is None:
+            for match in _LINE_GAP_RE.finditer(self._buffer):
+                if match.end() < len(self._buffer):
+                    fallback = _newline_span(match)
+        return fallback if fallback is not None else (self.max_block_size, self.max_block_size)
+
+    def _emit_lines(self, text: str) -> str:
+        """对完整的行执行重复行删除和之后的阶段"""
+        for name, stage, _ in self._plan:
+            if name in LINE_STAGES:
+                old_text, text = text, self._remove_seen_lines(text) if name == 'remove_duplicates' else stage(text)
+                if self.changes is not None and text != old_text:
+                    self.changes.add(name)
+        if not text:
+            return ''
+        if self._newline:
+            text = '\n' + text
+        self._newline = text.endswith('\n')
+        return text[:-1] if self._newline else text
+
+    def _remove_seen_lines(self, text: str) -> str:
+        """移除在之前任何块中出现过的行"""
+        return remove_duplicate_lines(text, self._seen)
+
+    def _get_plan(self, sample: str):
+        """第一次调用时检测语言并生成阶段计划"""
+        if self._plan is None:
+            if not self.language:
+                self.language = self.cleaner.detect_language(sample)
+            self._plan = self.cleaner.get_plan(self.options, self.language)
+        return self._plan
+
+
+def iter_paragraph_cuts(text: str, names: Set[str]) -> Iterator[Tuple[int, int, int, bool]]:
+    """依次返回 text 中含空行的空白：(空白起点, 分块起点, 分块终点, 此处分块是否安全)
+
+    分块范围是空白中从第一个到最后一个换行的部分；text 末尾的空白可能还没有结束，不返回。
+    安全指之前的成对标记都已闭合，并且之前的文本清理后不会跨过这段空白与下一段连接（见 _MarkerState.joinable）。
+    """
+    state = _MarkerState(names)
+    position = 0
+    for match in _PARAGRAPH_GAP_RE.finditer(text):
+        if match.end() == len(text):
+            break
+        state.update(text, position, match.start())
+        position = match.start()
+        start, end = _newline_span(match)
+        yield match.start(), start, end, state.balanced() and not state.joinable()
+
+
+def iter_safe_cuts(text: str, names: Set[str], min_size: int) -> Iterator[Tuple[int, int]]:
+    """依次返回 text 中的分块范围 (分块起点, 分块终点)，相邻两个分块点至少相隔 min_size 个字符
+
+    除了 iter_paragraph_cuts 的安全条件，还要求空白只有换行、两侧是普通的文字（前一段以字母、
+    数字或句末标点结尾并且清理后仍然如此（见 _MarkerState.ends_solid），下一段以字母开头，不是标记），
+    块的两端单独清理时与整篇清理时的处理相同（见 parallel_cleaner）。只检查每个目标位置之后的空行，
+    跳过的部分一次计入标记。
+    """
+    state = _MarkerState(names)
+    position = 0
+    search = min_size
+    while search < len(text):
+        match = _PARAGRAPH_GAP_RE.search(text, search)
+        if match is None:
+            return
+        # 从空白中间开始搜索时退回到整段空白的起点，与从头查找的结果相同
+        gap_start = match.start()
+        while gap_start > position and text[gap_start - 1].isspace():
+            gap_start -= 1
+        match = _PARAGRAPH_GAP_RE.match(text, gap_start)
+        if match.end() == len(text):
+            return
+        state.update(text, position, gap_start)
+        position = gap_start
+        if (state.balanced() and not match.group().strip('\n') and text[match.end()].isalpha()
+                and (text[gap_start - 1].isalnum() or text[gap_start - 1] in _SENTENCE_ENDS) and state.ends_solid()):
+            start, end = _newline_span(match)
+            yield start, end
+            search = end + min_size
+        else:
+            search = match.end()
+
+
+def run_block_stages(cleaner, plan, content: str, changes: Optional[Set[str]] = None) -> str:
+    """对一块执行行阶段之外的阶段，跳过预扫描表明不会改动文本的阶段
+
+    changes 不为 None 时加入改动了文本的阶段名。
+    """
+    features = scan_features(content)
+    for name, stage, _ in plan:
+        if name in LINE_STAGES or not may_change(plan.triggers[name], features):
+            continue
+        old_content, content = content, stage(content)
+        if content != old_content:
+            features = scan_features(content)
+            if changes is not None:
+                changes.add(name)
+    return content
+
+
+def join_cleaned(plan, previous: str, gap: str, following: str, changes: Optional[Set[str]] = None) -> str:
+    """按整篇清理时的规则处理两块清理结果之间的原始空白，返回拼接后的文本
+
+    changes 不为 None 时加入改动了这段空白的阶段名。
+    """
+    body = previous.rstrip()
+    head = len(following) - len(following.lstrip())
+    before = body[-1:]
+    probe = before + previous[len(body):] + gap + following[:head + 1]
+    for name, stage, _ in plan:
+        if name in SEAM_STAGES:
+            if changes is None:
+                probe = stage(probe)
+            else:
+                old_probe, probe = probe, stage(probe)
+                if probe != old_probe:
+                    changes.add(name)
+    if len(probe) > len(before) and probe.startswith(before) and probe[-1] == following[head]:
+        return body + probe[len(before):-1] + following[head:]
+    return previous + gap + following
+
+
+def _newline_span(match: re.Match) -> Tuple[int, int]:
+    """空白中从第一个换行到最后一个换行的范围；行首行尾的空格留在各自的块里"""
+    gap = match.group()
+    return match.start() + gap.index('\n'), match.start() + gap.rindex('\n') + 1
+
+
+class _MarkerState:
+    """增量跟踪分块点之前的成对标记是否都已闭合
+
+    按整篇清理的顺序排除已被前面的规则删除的部分：启用 HTML 清理时不计入标签（<...>，可以跨行）
+    中的标记；启用 Markdown 清理时代码块（``` 成对）和行内代码（` 成对）先被删除，其中的标记不计入，
+    分块点也不能在代码中。
+
+    同时跟踪去掉标签和代码（并解码实体）之后可见文本的结尾：以不会被删除的文字结尾时，清理后的文本
+    也以它结尾，不会与下一段连接；否则结尾可能被删除（"`code`"、乱码 "Â"）或者是连字符、列表标记，
+    整篇清理时断词修复和 Markdown 清理会把它与之后的空白、被删除的段落和下一段连在一起
+    （"quick-\n\n`code`\n\nlink" 清理成 "quicklink"）。
+    """
+
+    def __init__(self, names: Set[str]):
+        self.parity_marks: Tuple[str, ...] = ()
+        self.pairs: List[Tuple[str, str]] = []
+        self.markdown = 'remove_markdown' in names
+        if self.markdown:
+            self.parity_marks += ('*', '_')
+            self.pairs.extend(_MARKDOWN_PAIRS)
+        elif 'fix_ai_artifacts' in names:
+            self.parity_marks += ('`',)
+        self.html = 'remove_html' in names
+        # 乱码修复会删除或替换 Latin-1 范围的字符（例如 "Â"），这样的字符不算稳定的结尾
+        self.encoding = 'fix_encoding' in names
+        if self.markdown:
+            self.marks_re: Optional[re.Pattern] = _LINE_MARKS_RE
+        elif 'fix_hyphenation' in names:
+            self.marks_re = _HYPHEN_MARKS_RE
+        else:
+            self.marks_re = None
+        # 上一个稳定结尾之后的可见文本中是否有连字符或行首标记，以及可见文本去掉末尾空白后的最后两个字符
+        self.marked = False
+        self.tail = ''
+        self.in_tag = False
+        self.in_fence = False
+        self.in_code = False
+        self.counts = dict.fromkeys(self.parity_marks, 0)
+        self.open = dict.fromkeys(self.pairs, False)
+
+    def update(self, text: str, start: int, end: int) -> None:
+        """计入 text[start:end] 中的标记"""
+        visible = self._outside_tags(text, start, end)
+        for range_start, range_end in self._outside_code(visible, 0, len(visible)):
+            self._track_end(visible[range_start:range_end])
+            for mark in self.parity_marks:
+                self.counts[mark] += visible.count(mark, range_start, range_end)
+            for pair in self.pairs:
+                opening, closing = pair
+                last_open = visible.rfind(opening, range_start, range_end)
+                last_close = visible.rfind(closing, range_start, range_end)
+                if last_open > last_close:
+                    self.open[pair] = True
+                elif last_close >= 0:
+                    self.open[pair] = False
+
+    def balanced(self) -> bool:
+        return (not any(count % 2 for count in self.counts.values()) and not any(self.open.values())
+                and not (self.in_tag or self.in_fence or self.in_code))
+
+    def ends_solid(self) -> bool:
+        """可见文本是否以清理时不会被删除的文字结尾：字母或数字，或者字母之后的句末标点"""
+        last = self.tail[-1:]
+        if last in _SENTENCE_ENDS:
+            last = self.tail[-2:-1]
+            if not last.isalpha():
+                return False
+        return last.isalnum() and (last.isascii() or last > '\xff' or not self.encoding)
+
+    def joinable(self) -> bool:
+        """到目前为止的文本清理后是否可能跨过之后的空白与下一段连接
+
+        可见文本以稳定的文字结尾时不会，并从这里重新开始计入连字符和行首标记；否则只要上一个稳定结尾之后
+        出现过这些标记，结尾（连同之后被删除的段落）就可能在整篇清理时与下一段连接。
+        """
+        if self.ends_solid():
+            self.marked = False
+        return self.marked
+
+    def _track_end(self, visible: str) -> None:
+        """计入一段可见文本中的连字符和行首标记，并更新可见文本的结尾"""
+        if self.marks_re is not None and not self.marked:
+            self.marked = self.marks_re.search(visible) is not None
+            if not self.marked and self.html and '&' in visible:
+                self.marked = self.marks_re.search(html.unescape(visible)) is not None
+        # 结尾只取决于最后一段文字（实体不超过 _TAIL_WINDOW 个字符），末尾都是空白和标签时才处理整段
+        end = visible[-_TAIL_WINDOW:]
+        if len(visible) > _TAIL_WINDOW and not end.replace('\x00', '').strip():
+            end = visible
+        end = end.replace('\x00', '')
+        if self.html and '&' in end:
+            end = html.unescape(end)
+        end = end.rstrip()
+        if end:
+            self.tail = (self.tail + end[-2:])[-2:]
+
+    def _outside_tags(self, text: str, start: int, end: int) -> str:
+        """text[start:end] 中不在 HTML 标签内的部分；每个标签换成 \x00，标签两侧的字符不会连成标记"""
+        if not self.html:
+            return text[start:end]
+        if self.in_tag:
+            closing = text.find('>', start, end)
+            if closing == -1:
+                return ''
+            self.in_tag = False
+            start = closing + 1
+        visible = text[start:end]
+        if '<' not in visible:
+            return visible
+        visible = _HTML_TAG_RE.sub('\x00', visible)
+        # 没有闭合的标签延续到之后的文本
+        unclosed = _UNCLOSED_TAG_RE.search(visible)
+        if unclosed is not None:
+            self.in_tag = True
+            visible = visible[:unclosed.start()]
+        return visible
+
+    def _outside_code(self, text: str, start: int, end: int) -> List[Tuple[int, int]]:
+        """text[start:end] 中不在代码块和行内代码中的范围；代码块先于行内代码成对"""
+        if not self.markdown:
+            return [(start, end)]
+        ranges = []
+        position = start
+        while position < end:
+            if self.in_fence:
+                closing = text.find('```', position, end)
+                if closing == -1:
+                    break
+                self.in_fence = False
+                position = closing + 3
+                continue
+            tick = text.find('`', position, end)
+            if tick == -1:
+                if not self.in_code:
+                    ranges.append((position, end))
+                break
+            if not self.in_code:
+                ranges.append((position, tick))
+            if text.startswith('```', tick, end):
+                self.in_fence = True
+                position = tick + 3
+            else:
+                self.in_code = not self.in_code
+                position = tick + 1
+        return ranges
+
+
+async def iter_request_text(chunks: AsyncIterator[bytes], ndjson: bool = False) -> AsyncIterator[str]:
+    """把请求体的字节流解码成文本片段；NDJSON 每行是 {"text": "..."}，格式不对时抛出 ValueError"""
+    if ndjson:
+        line = 0
+        async for record in iter_ndjson_records(chunks):
+            line += 1
+            if not isinstance(record, dict) or not isinstance(record.get('text'), str):
+                raise ValueError(f"第 {line} 行必须是包含 text 字段的对象")
+            yield record['text']
+        return
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    async for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+
+async def iter_ndjson_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    """把 NDJSON 字节流逐行解析成 JSON 值，跳过空行
+
+    只在新收到的文本中查找换行，未完的行按块存在列表里，一行很长时也是线性时间。
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    partial: List[str] = []
+    async for chunk in chunks:
+        text = decoder.decode(chunk)
+        start = 0
+        end = text.find('\n')
+        while end >= 0:
+            partial.append(text[start:end])
+            record = ''.join(partial)
+            partial = []
+            if record.strip():
+                yield json.loads(record)
+            start = end + 1
+            end = text.find('\n', start)
+        if start < len(text):
+            partial.append(text[start:])
+    partial.append(decoder.decode(b'', final=True))
+    record = ''.join(partial)
+    if record.strip():
+        yield json.loads(record)